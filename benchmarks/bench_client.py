@@ -0,0 +1,185 @@
+"""Benchmark the whmcs client against the local whmcs simulator.
+
+Reports calls per second, p50/p99 latency, errors and peak traced memory of
+the sync (a new connection per call), pooled, concurrent, cached and write
+paths. The simulator runs in a child process so it does not compete with the
+client for the GIL. No network access is needed and runs are reproducible
+for a given seed, so the reports of two revisions can be compared to catch
+regressions.
+
+Usage: python -m benchmarks.bench_client [--calls 200] [--gzip] [--output report.json]
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+from django.conf import settings
+
+from benchmarks.simulator import run_in_process
+from olittwhmcs.exceptions import WhmcsException
+
+
+def get_percentile(sorted_values, percentile):
+    index = max(0, -(-len(sorted_values) * percentile // 100) - 1)
+    return sorted_values[int(index)]
+
+
+def measure(name, run):
+    """Run a scenario and summarize its latencies.
+
+    Args:
+        name (str): Name of the scenario.
+        run (callable): Runs the scenario and returns the latency of each
+            call, in seconds, and the number of calls that failed.
+    Returns:
+        dict: Calls per second, latency percentiles in milliseconds, errors
+            and peak traced memory in KiB.
+    """
+    started_at = time.perf_counter()
+    latencies, errors = run()
+    latencies.sort()
+    elapsed = time.perf_counter() - started_at
+    # Tracing allocations slows the client down, so memory is measured in a
+    # second run.
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "scenario": name,
+        "calls": len(latencies),
+        "errors": errors,
+        "calls_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(get_percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(get_percentile(latencies, 99) * 1000, 2),
+        "peak_memory_kib": round(peak / 1024, 1),
+    }
+
+
+def timed(function):
+    """Wrap a function to collect the latency of each call and count errors."""
+    latencies = []
+    errors = []
+
+    def call(*args, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        except WhmcsException as e:
+            errors.append(e)
+        finally:
+            latencies.append(time.perf_counter() - started_at)
+
+    call.results = lambda: (latencies, len(errors))
+    return call
+
+
+def run_scenarios(calls, workers, working_set):
+    from olittwhmcs import network, whmcs
+
+    def sync():
+        get_orders = timed(whmcs.get_orders)
+        for _ in range(calls):
+            network.close_session()
+            get_orders()
+        return get_orders.results()
+
+    def pooled():
+        get_orders = timed(whmcs.get_orders)
+        for _ in range(calls):
+            get_orders()
+        return get_orders.results()
+
+    def concurrent():
+        get_client = timed(whmcs.get_client)
+        whmcs.batch(
+            get_client,
+            [{"client_id": client_id} for client_id in range(1, calls + 1)],
+            max_workers=workers,
+        )
+        return get_client.results()
+
+    def cached():
+        settings.WHMCS_RESPONSE_CACHE = True
+        try:
+            get_client = timed(whmcs.get_client)
+            for call in range(calls):
+                get_client(client_id=call % working_set + 1)
+            return get_client.results()
+        finally:
+            settings.WHMCS_RESPONSE_CACHE = False
+
+    def write():
+        order_product = timed(whmcs.order_product)
+        for _ in range(calls):
+            order_product(1, "mpesa", "annually", product_id=1)
+        return order_product.results()
+
+    network.close_session()
+    return [
+        measure("sync", sync),
+        measure("pooled", pooled),
+        measure("concurrent", concurrent),
+        measure("cached", cached),
+        measure("write", write),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--working-set", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--jitter", type=float, default=0.002)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--gzip", action="store_true", help="Compress responses.")
+    parser.add_argument("--output", help="Also write the report to a JSON file.")
+    arguments = parser.parse_args()
+
+    with run_in_process(
+        latency=arguments.latency,
+        jitter=arguments.jitter,
+        error_rate=arguments.error_rate,
+        items=arguments.items,
+        seed=arguments.seed,
+        compress=arguments.gzip,
+    ) as base_url:
+        settings.configure(
+            WHMCS_BASE_URL=base_url,
+            WHMCS_POOL_MAXSIZE=arguments.workers,
+            WHMCS_RETRY_BASE_DELAY=0.01,
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+                }
+            },
+        )
+        report = run_scenarios(
+            arguments.calls, arguments.workers, arguments.working_set
+        )
+
+    columns = (
+        "scenario",
+        "calls_per_second",
+        "p50_ms",
+        "p99_ms",
+        "errors",
+        "peak_memory_kib",
+    )
+    print("".join(f"{column:>18}" for column in columns))
+    for row in report:
+        print("".join(f"{row[column]:>18}" for column in columns))
+    if arguments.output:
+        with open(arguments.output, "w") as output:
+            json.dump(
+                {"arguments": vars(arguments), "report": report}, output, indent=2
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark the cost of decoding whmcs responses with each JSON backend.
+
+Usage: python -m benchmarks.bench_json [--invoices 5000] [--repeat 20]
+"""
+
+import argparse
+import json
+import timeit
+
+from olittwhmcs.jsonbackends import PREFERRED_BACKENDS, load_backend
+
+
+def build_invoices_response(count):
+    """Build a GetInvoices response body holding ``count`` invoices."""
+    invoices = [
+        {
+            "id": str(invoice_id),
+            "userid": str(invoice_id % 500),
+            "invoicenum": "",
+            "date": "2021-03-01",
+            "duedate": "2021-03-08",
+            "datepaid": "2021-03-02 09:30:05",
+            "last_capture_attempt": "0000-00-00 00:00:00",
+            "subtotal": "1200.00",
+            "credit": "0.00",
+            "tax": "192.00",
+            "tax2": "0.00",
+            "total": "1392.00",
+            "taxrate": "16.00",
+            "taxrate2": "0.00",
+            "status": "Paid" if invoice_id % 3 else "Unpaid",
+            "paymentmethod": "mpesa",
+            "notes": "",
+            "currencycode": "KES",
+            "currencyprefix": "KSh",
+            "currencysuffix": "KES",
+        }
+        for invoice_id in range(count)
+    ]
+    return json.dumps(
+        {
+            "result": "success",
+            "totalresults": count,
+            "startnumber": 0,
+            "numreturned": count,
+            "invoices": {"invoice": invoices},
+        }
+    ).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--invoices", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    arguments = parser.parse_args()
+
+    body = build_invoices_response(arguments.invoices)
+    megabytes = len(body) / 1024 / 1024
+    print(f"GetInvoices response: {arguments.invoices} invoices, {megabytes:.2f} MiB")
+    print(f"{'backend':<10}{'ms/decode':>12}{'MiB/s':>10}{'speedup':>10}")
+    baseline = None
+    for name in reversed(PREFERRED_BACKENDS):
+        loads = load_backend(name)
+        if loads is None:
+            print(f"{name:<10}{'not installed':>32}")
+            continue
+        seconds = min(
+            timeit.repeat(lambda: loads(body), number=1, repeat=arguments.repeat)
+        )
+        baseline = baseline or seconds
+        print(
+            f"{name:<10}{seconds * 1000:>12.2f}{megabytes / seconds:>10.1f}"
+            f"{baseline / seconds:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
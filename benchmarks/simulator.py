@@ -0,0 +1,372 @@
+"""A local stand-in for the whmcs api, for benchmarks.
+
+Serves ``/includes/api.php`` for GetProducts, GetClientsDetails,
+GetClientsProducts, GetOrders, GetInvoices and AddOrder with configurable
+latency, payload sizes and error rates, gzip compressed on request. Responses
+are generated once from a seed, so runs are reproducible.
+
+Usage: python -m benchmarks.simulator [--port 8099] [--latency 0.005] [--gzip]
+"""
+
+import argparse
+import gzip
+import json
+import multiprocessing
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+API_PATH = "/includes/api.php"
+
+
+def build_products(count):
+    return [
+        {
+            "pid": str(product_id),
+            "gid": str(product_id % 5 + 1),
+            "type": "hostingaccount",
+            "name": f"Hosting plan {product_id}",
+            "description": "SSD storage, free SSL and daily backups",
+            "module": "cpanel",
+            "paytype": "recurring",
+            "pricing": {
+                currency: {
+                    "prefix": prefix,
+                    "suffix": currency,
+                    "msetupfee": "0.00",
+                    "monthly": f"{product_id * 10 + 100}.00",
+                    "annually": f"{product_id * 100 + 1000}.00",
+                }
+                for currency, prefix in (("KES", "KSh"), ("USD", "$"))
+            },
+        }
+        for product_id in range(1, count + 1)
+    ]
+
+
+def build_client(client_id):
+    return {
+        "result": "success",
+        "client": {
+            "id": client_id,
+            "uuid": f"00000000-0000-0000-0000-{client_id:012d}",
+            "firstname": "Jane",
+            "lastname": "Doe",
+            "email": f"client{client_id}@example.com",
+            "phonecc": 254,
+            "telephoneNumber": "+254.700000000",
+            "companyname": "",
+            "address1": "1 Moi Avenue",
+            "postcode": "00100",
+            "city": "Nairobi",
+            "state": "Nairobi",
+            "country": "KE",
+            "currency": 1,
+            "currency_code": "KES",
+        },
+    }
+
+
+def build_client_products(count):
+    return [
+        {
+            "id": service_id,
+            "clientid": 1,
+            "orderid": service_id,
+            "pid": service_id % 20 + 1,
+            "regdate": "2021-03-01",
+            "name": "Hosting plan",
+            "translated_name": "Hosting plan",
+            "groupname": "Hosting",
+            "translated_groupname": "Hosting",
+            "domain": f"site{service_id}.example.com",
+            "firstpaymentamount": "1200.00",
+            "recurringamount": "1200.00",
+            "paymentmethod": "mpesa",
+            "paymentmethodname": "M-Pesa",
+            "billingcycle": "Annually",
+            "nextduedate": "2022-03-01",
+            "status": "Active",
+            "suspensionreason": "",
+            "notes": "",
+        }
+        for service_id in range(1, count + 1)
+    ]
+
+
+def build_orders(count):
+    return [
+        {
+            "id": order_id,
+            "ordernum": 1000000 + order_id,
+            "userid": order_id % 500,
+            "date": "2021-03-01 09:30:05",
+            "amount": "1200.00",
+            "invoiceid": order_id,
+            "paymentmethod": "mpesa",
+            "paymentstatus": "Paid",
+            "status": "Active",
+            "notes": "",
+            "lineitems": {
+                "lineitem": [
+                    {
+                        "type": "product",
+                        "relid": order_id,
+                        "producttype": "Hosting Account",
+                        "product": "Hosting plan",
+                        "domain": f"site{order_id}.example.com",
+                        "billingcycle": "Annually",
+                        "amount": "KSh1,200.00KES",
+                        "status": "Active",
+                    }
+                ]
+            },
+        }
+        for order_id in range(1, count + 1)
+    ]
+
+
+def build_invoices(count):
+    return [
+        {
+            "id": invoice_id,
+            "userid": invoice_id % 500,
+            "invoicenum": "",
+            "date": "2021-03-01",
+            "duedate": "2021-03-08",
+            "datepaid": "2021-03-02 09:30:05",
+            "last_capture_attempt": "0000-00-00 00:00:00",
+            "subtotal": "1200.00",
+            "credit": "0.00",
+            "tax": "192.00",
+            "tax2": "0.00",
+            "total": "1392.00",
+            "taxrate": "16.00",
+            "taxrate2": "0.00",
+            "status": "Paid" if invoice_id % 3 else "Unpaid",
+            "paymentmethod": "mpesa",
+            "notes": "",
+        }
+        for invoice_id in range(1, count + 1)
+    ]
+
+
+class WhmcsSimulator:
+    """Serves canned whmcs responses on a local port."""
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency=0.005,
+        jitter=0.002,
+        error_rate=0.0,
+        items=100,
+        seed=0,
+        compress=False,
+    ):
+        """Create the simulator.
+
+        Args:
+            host (str): Optional. Interface to listen on.
+            port (int): Optional. Port to listen on, a free one if 0.
+            latency (float): Optional. Seconds each request takes.
+            jitter (float): Optional. Maximum random seconds added to the
+                latency.
+            error_rate (float): Optional. Fraction of requests answered with
+                a 503 error.
+            items (int): Optional. Number of records in list responses.
+            seed (int): Optional. Seed of the latency and error draws.
+            compress (bool): Optional. Gzip responses to clients accepting it.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.requests = 0
+        self.lists = {
+            "GetProducts": ("products", "product", build_products(items)),
+            "GetClientsProducts": (
+                "products",
+                "product",
+                build_client_products(items),
+            ),
+            "GetOrders": ("orders", "order", build_orders(items)),
+            "GetInvoices": ("invoices", "invoice", build_invoices(items)),
+        }
+        self.compress = compress
+        self.bodies = {
+            action: self.encode_page(action, 0, None) for action in self.lists
+        }
+        self.compressed_bodies = {
+            body: gzip.compress(body) for body in self.bodies.values()
+        }
+        self.server = ThreadingHTTPServer((host, port), self.create_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        """Url to use as ``WHMCS_BASE_URL``."""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve requests in a background thread."""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving requests."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def encode_page(self, action, limit_start, limit_num):
+        wrapper_key, item_key, records = self.lists[action]
+        end = len(records) if limit_num is None else limit_start + limit_num
+        page = records[limit_start:end]
+        return json.dumps(
+            {
+                "result": "success",
+                "totalresults": len(records),
+                "startnumber": limit_start,
+                "numreturned": len(page),
+                wrapper_key: {item_key: page},
+            }
+        ).encode()
+
+    def respond(self, parameters):
+        """Build the status and body of the response to a request."""
+        with self.random_lock:
+            self.requests += 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            fails = self.random.random() < self.error_rate
+        time.sleep(delay)
+        if fails:
+            return 503, b'{"result": "error", "message": "Service Unavailable"}'
+        action = parameters.get("action")
+        if action in self.lists:
+            if "limitstart" in parameters or "limitnum" in parameters:
+                return 200, self.encode_page(
+                    action,
+                    int(parameters.get("limitstart", 0)),
+                    int(parameters.get("limitnum", 25)),
+                )
+            return 200, self.bodies[action]
+        if action == "GetClientsDetails":
+            client_id = int(parameters.get("clientid") or 1)
+            return 200, json.dumps(build_client(client_id)).encode()
+        if action == "AddOrder":
+            with self.random_lock:
+                order_id = self.requests
+            return 200, json.dumps(
+                {"result": "success", "orderid": order_id, "invoiceid": order_id}
+            ).encode()
+        return 200, json.dumps(
+            {"result": "error", "message": f"Unsupported action {action}"}
+        ).encode()
+
+    def create_handler(self):
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # The headers and body are written separately, avoid waiting for
+            # delayed acknowledgements between them.
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                if self.path != API_PATH:
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                parameters = dict(parse_qsl(self.rfile.read(length).decode()))
+                status, body = simulator.respond(parameters)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                if simulator.compress and "gzip" in self.headers.get(
+                    "Accept-Encoding", ""
+                ):
+                    compressed_body = simulator.compressed_bodies.get(body)
+                    body = compressed_body or gzip.compress(body, 6)
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def serve(ports, options):
+    simulator = WhmcsSimulator(**options)
+    ports.put(simulator.server.server_address[1])
+    simulator.server.serve_forever()
+
+
+@contextmanager
+def run_in_process(host="127.0.0.1", **options):
+    """Run a simulator in a child process, so it does not compete with the
+    benchmarked client for the GIL.
+
+    Args:
+        host (str): Optional. Interface to listen on.
+        options: Other arguments of :class:`WhmcsSimulator`.
+    Yields:
+        str: Url to use as ``WHMCS_BASE_URL``.
+    """
+    ports = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=serve, args=(ports, {**options, "host": host}), daemon=True
+    )
+    process.start()
+    try:
+        yield f"http://{host}:{ports.get(timeout=30)}"
+    finally:
+        process.terminate()
+        process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--jitter", type=float, default=0.002)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--gzip", action="store_true")
+    arguments = parser.parse_args()
+    simulator = WhmcsSimulator(
+        arguments.host,
+        arguments.port,
+        arguments.latency,
+        arguments.jitter,
+        arguments.error_rate,
+        arguments.items,
+        arguments.seed,
+        arguments.gzip,
+    )
+    print(f"Serving the whmcs api on {simulator.base_url}{API_PATH}")
+    try:
+        simulator.server.serve_forever()
+    except KeyboardInterrupt:
+        simulator.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""This module contains the declarative registry of the whmcs actions.
+
+Each action declares how its payload is built, where its data sits in the
+response, which model wraps it, whether it only reads data and which cached
+responses it invalidates. The response parser of every action is compiled
+once, when the action is registered, and the functions in
+:mod:`olittwhmcs.whmcs` and :mod:`olittwhmcs.aio` run every action through
+the same pipeline.
+
+New actions can be registered without writing a function for them::
+
+    register(Action("GetTickets", "Unable to fetch tickets",
+                    response_path=("tickets", "ticket"), read=True))
+    tickets = whmcs.call_action("GetTickets", clientid=1)
+"""
+
+from functools import partial
+
+from olittwhmcs import models, responsecache, serializer
+
+ACTIONS = {}
+
+
+def get_path(response, path):
+    """Retrieve the list nested in a response. Eg ("orders", "order")."""
+    try:
+        for key in path:
+            response = response.get(key)
+        return response or []
+    except AttributeError:
+        return []
+
+
+def compile_parser(response_path=None, model=None, result_keys=None):
+    """
+    Build the function turning a successful response into the action's result.
+    :param response_path: Tuple, optional. Keys leading to a list in the response.
+    :param model: Class, optional. Model wrapping the response or each list item.
+    :param result_keys: String or Tuple, optional. Key(s) of the response to return.
+    :return: The response parser.
+    :rtype: Callable
+    """
+    if response_path and model:
+        return lambda response: [
+            model(item) for item in get_path(response, response_path)
+        ]
+    if response_path:
+        return partial(get_path, path=response_path)
+    if model:
+        return model
+    if isinstance(result_keys, str):
+        return lambda response: response.get(result_keys)
+    if result_keys:
+        return lambda response: tuple(response.get(key) for key in result_keys)
+    return lambda response: response
+
+
+class Action:
+    """A whmcs action and how its requests and responses are handled."""
+
+    __slots__ = (
+        "name",
+        "default_error",
+        "build_parameters",
+        "parse_response",
+        "read",
+        "require_response",
+        "invalidate",
+    )
+
+    def __init__(
+        self,
+        name,
+        default_error,
+        build_parameters=None,
+        response_path=None,
+        model=None,
+        result_keys=None,
+        parse_response=None,
+        read=False,
+        require_response=True,
+        invalidate=None,
+    ):
+        """Declare an action.
+
+        Args:
+            name (str): Name of the whmcs action. Eg GetOrders.
+            default_error (str): Error raised if whmcs does not give one.
+            build_parameters (callable): Optional. Builds the payload from the
+                arguments of the call. Defaults to sending the keyword
+                arguments as they are.
+            response_path (tuple): Optional. Keys leading to the list of
+                records in the response. Eg ("orders", "order").
+            model (type): Optional. Model wrapping the response, or each
+                record when a response path is given.
+            result_keys (str or tuple): Optional. Key, or keys, of the
+                response to return.
+            parse_response (callable): Optional. Custom response parser,
+                overriding the three options above.
+            read (bool): Optional. Whether the action only reads data, making
+                it safe to retry, coalesce and cache.
+            require_response (bool): Optional. Whether an empty response is
+                an error.
+            invalidate (callable): Optional. Invalidates cached responses
+                after the action is sent. Called with the payload and the
+                response, None if the action failed.
+        """
+        self.name = name
+        self.default_error = default_error
+        self.build_parameters = build_parameters or partial(
+            serializer.get_action_parameters, name
+        )
+        self.parse_response = parse_response or compile_parser(
+            response_path, model, result_keys
+        )
+        self.read = read
+        self.require_response = require_response
+        self.invalidate = invalidate
+
+
+def register(action):
+    """Add an action to the registry, replacing any action of the same name."""
+    ACTIONS[action.name] = action
+    return action
+
+
+def get_action(name):
+    """
+    Retrieve a registered action.
+    :param name: String, name of the whmcs action.
+    :return: The action.
+    :rtype: Action
+    :raises KeyError: If the action is not registered.
+    """
+    return ACTIONS[name]
+
+
+def is_read_action(name):
+    """Check whether a whmcs action is registered as only reading data."""
+    action = ACTIONS.get(name)
+    return action is not None and action.read
+
+
+#################
+# INVALIDATIONS #
+#################
+
+
+def invalidate_requested_client(parameters, response):
+    responsecache.invalidate_client(parameters.get("clientid"))
+
+
+def invalidate_updated_client(parameters, response):
+    responsecache.invalidate_client(email=parameters.get("clientemail"))
+    if response:
+        responsecache.invalidate_client(response.get("clientid"))
+
+
+def invalidate_requested_service(parameters, response):
+    responsecache.invalidate_service(parameters.get("serviceid"))
+
+
+def invalidate_all(parameters, response):
+    responsecache.invalidate_all()
+
+
+###########
+# ACTIONS #
+###########
+
+ADD_CLIENT = register(
+    Action(
+        "AddClient",
+        "Unable to enroll for a billing account",
+        build_parameters=serializer.create_user_request_parameters,
+        result_keys="clientid",
+    )
+)
+GET_CLIENT = register(
+    Action(
+        "GetClientsDetails",
+        "Unable to get client details",
+        build_parameters=serializer.get_client_request_parameters,
+        model=models.Client,
+        read=True,
+    )
+)
+UPDATE_CLIENT = register(
+    Action(
+        "UpdateClient",
+        "Unable to update client details",
+        build_parameters=serializer.update_client_request_parameters,
+        result_keys="clientid",
+        invalidate=invalidate_updated_client,
+    )
+)
+GET_PRODUCTS = register(
+    Action(
+        "GetProducts",
+        "Unable to fetch products",
+        build_parameters=serializer.get_product_request_parameters,
+        response_path=("products", "product"),
+        read=True,
+    )
+)
+GET_CLIENT_PRODUCTS = register(
+    Action(
+        "GetClientsProducts",
+        "Unable to fetch your products",
+        build_parameters=serializer.get_client_product_request_parameters,
+        response_path=("products", "product"),
+        model=models.ClientProduct,
+        read=True,
+        require_response=False,
+    )
+)
+ADD_ORDER = register(
+    Action(
+        "AddOrder",
+        "Unable to fetch products",
+        build_parameters=serializer.order_product_request_parameters,
+        result_keys=("orderid", "invoiceid"),
+        invalidate=invalidate_requested_client,
+    )
+)
+GET_DOMAIN_NAMESERVERS = register(
+    Action(
+        "DomainGetNameservers",
+        "Unable to get nameservers",
+        build_parameters=serializer.get_domain_nameservers_request_parameter,
+        read=True,
+    )
+)
+UPDATE_DOMAIN_NAMESERVERS = register(
+    Action(
+        "DomainUpdateNameservers",
+        "Unable to update nameservers",
+        build_parameters=serializer.update_domain_nameservers_request_parameter,
+    )
+)
+UPDATE_CLIENT_PRODUCT = register(
+    Action(
+        "UpdateClientProduct",
+        "Unable to fetch products",
+        build_parameters=serializer.upgrade_product_request_parameters,
+        result_keys="serviceid",
+        invalidate=invalidate_requested_service,
+    )
+)
+UPGRADE_PRODUCT = register(
+    Action(
+        "UpgradeProduct",
+        "Unable to complete upgrade",
+        build_parameters=serializer.get_upgrade_product_parameters,
+        model=models.ProductUpgrade,
+        invalidate=invalidate_requested_service,
+    )
+)
+ADD_INVOICE_PAYMENT = register(
+    Action(
+        "AddInvoicePayment",
+        "Unable to add payment",
+        build_parameters=serializer.get_add_invoice_payment_parameters,
+        parse_response=lambda response: True,
+        require_response=False,
+        invalidate=invalidate_all,
+    )
+)
+GET_ORDERS = register(
+    Action(
+        "GetOrders",
+        "Unable to fetch orders",
+        build_parameters=serializer.prepare_get_orders_request,
+        response_path=("orders", "order"),
+        model=models.Order,
+        read=True,
+    )
+)
+CANCEL_ORDER = register(
+    Action(
+        "CancelOrder",
+        "Unable to cancel the order",
+        build_parameters=serializer.prepare_cancel_order_request,
+        parse_response=lambda response: True,
+        require_response=False,
+        invalidate=invalidate_all,
+    )
+)
+GET_INVOICES = register(
+    Action(
+        "GetInvoices",
+        "Unable to fetch invoices",
+        build_parameters=serializer.prepare_get_invoices_request,
+        response_path=("invoices", "invoice"),
+        model=models.Invoice,
+        read=True,
+    )
+)
+GET_INVOICE = register(Action("GetInvoice", "Unable to fetch invoice", read=True))
+CREATE_SSO_TOKEN = register(
+    Action(
+        "CreateSsoToken",
+        "Unable to generate SSO token",
+        result_keys=("access_token", "redirect_url"),
+    )
+)
@@ -0,0 +1,687 @@
+"""This module contains the asyncio api surface for consuming this package.
+
+The functions mirror those in :mod:`olittwhmcs.whmcs` but are awaitable and
+share a pooled ``httpx.AsyncClient`` per event loop. Install the ``aio`` extra
+to use it. Like them, they accept a ``timeout`` keyword argument bounding the
+whole call, and reads share the response cache of the synchronous api. Calls
+to the Django cache are made from worker threads, off the event loop.
+"""
+
+import asyncio
+import time
+import weakref
+from typing import Dict
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from olittwhmcs import (
+    actions,
+    deadlines,
+    metrics,
+    models,
+    responsecache,
+    serializer,
+    sso,
+)
+from olittwhmcs.actions import is_read_action
+from olittwhmcs.deadlines import with_timeout
+from olittwhmcs.exceptions import (
+    WhmcsConnectionError,
+    WhmcsException,
+    WhmcsTimeoutError,
+)
+from olittwhmcs.network import (
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_POOL_MAXSIZE,
+    DEFAULT_READ_TIMEOUT,
+    get_accept_encoding,
+    get_api_url,
+    get_circuit_breakers,
+    get_error_message,
+    get_limiters,
+    get_response_data,
+    get_retry_policy,
+    get_timeouts,
+    is_overloaded_response,
+    record_attempt,
+)
+from olittwhmcs.ratelimit import TokenBucket
+from olittwhmcs.singleflight import AsyncSingleFlight, get_request_key
+from olittwhmcs.whmcs import (
+    DEFAULT_BATCH_CONCURRENCY,
+    get_settle_invoice_url,
+    get_settle_invoice_urls,
+    prewarm_sso_tokens,
+)
+
+__all__ = [
+    "add_invoice_payment",
+    "batch",
+    "call_action",
+    "cancel_order",
+    "close_async_client",
+    "create_client",
+    "create_sso_token",
+    "get_async_client",
+    "get_client",
+    "get_client_invoice_sso_url",
+    "get_client_invoices_sso_url",
+    "get_client_products",
+    "get_domain_nameservers",
+    "get_invoices",
+    "get_orders",
+    "get_products",
+    # Helpers that make no request, shared with olittwhmcs.whmcs.
+    "get_settle_invoice_url",
+    "get_settle_invoice_urls",
+    "get_sso_token_and_redirect_url",
+    "map_client_products",
+    "map_clients",
+    "order_bulk_products",
+    "order_product",
+    "prewarm_sso_tokens",
+    "run_action",
+    "update_client",
+    "update_domain_nameservers",
+    "upgrade_client_product",
+    "upgrade_product",
+]
+
+DEFAULT_MAX_CONNECTIONS = 100
+
+_clients = weakref.WeakKeyDictionary()
+_single_flights = weakref.WeakKeyDictionary()
+
+###########
+# NETWORK #
+###########
+
+
+def get_async_client():
+    """
+    Retrieve the http client shared by all requests on the running event loop.
+
+    The connection pool can be sized with the ``WHMCS_ASYNC_MAX_CONNECTIONS``
+    (total connections) and ``WHMCS_POOL_MAXSIZE`` (kept-alive connections)
+    settings. Compressed responses are negotiated like in
+    :func:`olittwhmcs.network.get_accept_encoding`.
+    :return: The shared client for the running event loop.
+    :rtype: httpx.AsyncClient
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        limits = httpx.Limits(
+            max_connections=getattr(
+                settings, "WHMCS_ASYNC_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS
+            ),
+            max_keepalive_connections=getattr(
+                settings, "WHMCS_POOL_MAXSIZE", DEFAULT_POOL_MAXSIZE
+            ),
+        )
+        timeout = httpx.Timeout(
+            getattr(settings, "WHMCS_READ_TIMEOUT", DEFAULT_READ_TIMEOUT),
+            connect=getattr(settings, "WHMCS_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT),
+        )
+        client = httpx.AsyncClient(
+            limits=limits,
+            timeout=timeout,
+            headers={"Accept-Encoding": get_accept_encoding()},
+        )
+        _clients[loop] = client
+    return client
+
+
+async def close_async_client():
+    """Close the http client of the running event loop."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def make_whmcs_network_request(parameters):
+    """
+    Make a network request to WHMCS, retrying failures the retry policy allows.
+
+    Requests fail fast while the circuit breaker of the endpoint or action
+    is open.
+    :param parameters: Dictionary, payload to send to whmcs
+    :return: :class:`Response <Response>` object
+    :rtype: httpx.Response
+    :raises WhmcsConnectionError: If the network request fails.
+    :raises WhmcsTimeoutError: If the deadline of the call passes.
+    """
+    action = parameters.get("action")
+    url = get_api_url(action)
+    circuit_breakers = get_circuit_breakers()
+    if not circuit_breakers.allow(url, action):
+        raise WhmcsConnectionError("Whmcs server is unavailable.")
+    succeeded = None
+    try:
+        response = await send_whmcs_request_with_retries(url, parameters)
+        succeeded = not is_overloaded_response(response)
+        return response
+    except httpx.HTTPError:
+        # Running out of time is not a failure of the whmcs server.
+        if deadlines.has_expired():
+            raise WhmcsTimeoutError(deadlines.DEADLINE_EXCEEDED)
+        succeeded = False
+        raise WhmcsConnectionError("Could not reach whmcs server.")
+    finally:
+        if succeeded is None:
+            # Timed out or interrupted, give back a half open probe so the
+            # breaker keeps letting the next request through.
+            circuit_breakers.cancel(url, action)
+        elif succeeded:
+            circuit_breakers.record_success(url, action)
+        else:
+            circuit_breakers.record_failure(url, action)
+
+
+async def send_whmcs_request_with_retries(url, parameters):
+    """
+    Send a request to WHMCS, retrying failures the retry policy allows.
+
+    Retries stop at the retry deadline or at the deadline of the call,
+    whichever comes first.
+    :param url: String, url of the whmcs api.
+    :param parameters: Dictionary, payload to send to whmcs
+    :return: :class:`Response <Response>` object
+    :rtype: httpx.Response
+    :raises httpx.HTTPError: If the last attempt fails.
+    :raises WhmcsTimeoutError: If the limiters do not let a request through
+        before the deadline.
+    """
+    action = parameters.get("action")
+    rate_limiter, concurrency_limiter = get_limiters()
+    policy = get_retry_policy()
+    deadline = time.monotonic() + policy.deadline
+    if deadlines.get_expiry() is not None:
+        deadline = min(deadline, deadlines.get_expiry())
+    attempt = 0
+    while True:
+        attempt += 1
+        response = error = None
+        if rate_limiter and not await rate_limiter.acquire_async(
+            deadlines.get_remaining()
+        ):
+            raise WhmcsTimeoutError(deadlines.DEADLINE_EXCEEDED)
+        if concurrency_limiter and not await concurrency_limiter.acquire_async(
+            deadlines.get_remaining()
+        ):
+            raise WhmcsTimeoutError(deadlines.DEADLINE_EXCEEDED)
+        started_at = time.monotonic()
+        try:
+            connect_timeout, read_timeout = get_timeouts(action)
+            response = await get_async_client().post(
+                url,
+                data=parameters,
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            )
+        except httpx.HTTPError as e:
+            error = e
+        finally:
+            record_attempt(
+                url,
+                concurrency_limiter,
+                time.monotonic() - started_at,
+                response,
+                error,
+            )
+        if metrics.is_enabled():
+            metrics.record_request(action, started_at, response, error)
+        if error is None and not is_overloaded_response(response):
+            return response
+        status_code = response.status_code if response is not None else None
+        sent = not isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout))
+        if not policy.should_retry(action, attempt, status_code, sent):
+            break
+        delay = policy.get_delay(attempt)
+        if time.monotonic() + delay >= deadline:
+            break
+        if metrics.is_enabled():
+            metrics.record_retry(action, status_code)
+        await asyncio.sleep(delay)
+    if error is not None:
+        raise error
+    return response
+
+
+def get_single_flight():
+    """Retrieve the single flight shared by the tasks of the running event loop."""
+    loop = asyncio.get_running_loop()
+    single_flight = _single_flights.get(loop)
+    if single_flight is None:
+        single_flight = _single_flights[loop] = AsyncSingleFlight()
+    return single_flight
+
+
+async def get_whmcs_response(parameters):
+    """
+    Make requests to whmcs and retrieve the response or error.
+
+    Identical read requests made concurrently on an event loop share a single
+    request to whmcs and its response, unless ``WHMCS_COALESCE_READS`` is
+    False. The shared request runs outside the deadline of the task that
+    started it, each task only waits for it until its own deadline.
+    :param parameters: (Dictionary) the request payload
+    :return: whmcs response if request completed successfully otherwise an error message
+    :rtype: Dictionary or String or None
+    """
+    if is_read_action(parameters.get("action")) and getattr(
+        settings, "WHMCS_COALESCE_READS", True
+    ):
+
+        async def fetch():
+            with deadlines.unbounded():
+                return await fetch_whmcs_response(parameters)
+
+        try:
+            return await get_single_flight().do(
+                get_request_key(parameters), fetch, deadlines.get_remaining()
+            )
+        except (asyncio.TimeoutError, WhmcsTimeoutError):
+            return False, deadlines.DEADLINE_EXCEEDED
+    return await fetch_whmcs_response(parameters)
+
+
+async def fetch_whmcs_response(parameters):
+    """
+    Request whmcs and retrieve the response or error.
+    :param parameters: (Dictionary) the request payload
+    :return: whmcs response if request completed successfully otherwise an error message
+    :rtype: Dictionary or String or None
+    """
+    started_at = time.monotonic()
+    outcome = "whmcs"
+    try:
+        response = await make_whmcs_network_request(parameters)
+        response_data = get_response_data(response)
+        result = response_data.get("result") if response_data else None
+        if response.is_success and result == "success":
+            outcome = "success"
+            return True, response_data
+        error = get_error_message(response_data)
+    except WhmcsConnectionError as e:
+        outcome = "connection"
+        error = e.message
+    finally:
+        if metrics.is_enabled():
+            metrics.record_call(parameters.get("action"), started_at, outcome)
+    return False, error
+
+
+async def call_action(name, *args, **kwargs):
+    """
+    Send a registered whmcs action.
+
+    See :func:`olittwhmcs.whmcs.call_action`.
+    """
+    action = actions.get_action(name)
+    return await run_action(action, action.build_parameters(*args, **kwargs))
+
+
+async def run_action(action, parameters):
+    """
+    Send a whmcs action and parse its response.
+
+    Like :func:`olittwhmcs.whmcs.run_action`, reads go through the response
+    cache and writes invalidate the cached responses they affect. The Django
+    cache is called from a worker thread, off the event loop.
+    :param action: Action, the registered action to send.
+    :param parameters: Dictionary, payload of the request.
+    :return: The result of the action, as declared in the registry.
+    :raises WhmcsTimeoutError: If the deadline of the call passes.
+    :raises WhmcsException: If an error occurs.
+    """
+    if action.read:
+        is_successful, response_or_error = (
+            await responsecache.get_cached_whmcs_response_async(
+                parameters, get_whmcs_response
+            )
+        )
+    else:
+        is_successful, response_or_error = await get_whmcs_response(parameters)
+    if action.invalidate is not None:
+        await sync_to_async(action.invalidate, thread_sensitive=False)(
+            parameters, response_or_error if is_successful else None
+        )
+    if is_successful and (response_or_error or not action.require_response):
+        return action.parse_response(response_or_error)
+    if response_or_error == deadlines.DEADLINE_EXCEEDED:
+        raise WhmcsTimeoutError(response_or_error)
+    error = response_or_error if response_or_error else action.default_error
+    raise WhmcsException(error)
+
+
+##########
+# CLIENT #
+##########
+
+
+@with_timeout
+async def create_client(**kwargs):
+    """Create a WHMCS User account.
+
+    See :func:`olittwhmcs.whmcs.create_client`.
+    """
+    return await call_action("AddClient", **kwargs)
+
+
+@with_timeout
+async def get_client(email=None, client_id=None):
+    """Retrieve a WHMCS User account.
+
+    See :func:`olittwhmcs.whmcs.get_client`.
+    """
+    return await call_action("GetClientsDetails", email, client_id)
+
+
+@with_timeout
+async def update_client(**kwargs):
+    """Update a WHMCS User account.
+
+    See :func:`olittwhmcs.whmcs.update_client`.
+    """
+    return await call_action("UpdateClient", **kwargs)
+
+
+###########
+# PRODUCT #
+###########
+
+
+@with_timeout
+async def get_products(currency=None, group_id=None, module=None, product_ids=None):
+    """Retrieve products from WHMCS.
+
+    See :func:`olittwhmcs.whmcs.get_products`.
+    """
+    whmcs_products = await call_action("GetProducts", group_id, module, product_ids)
+    return [
+        models.Product(whmcs_product, currency) for whmcs_product in whmcs_products
+    ]
+
+
+@with_timeout
+async def get_client_products(client_id, product_id=None, service_id=None, domain=None):
+    """Retrieve a user's products from WHMCS.
+
+    See :func:`olittwhmcs.whmcs.get_client_products`.
+    """
+    return await call_action(
+        "GetClientsProducts", client_id, product_id, service_id, domain
+    )
+
+
+@with_timeout
+async def order_product(
+    client_id, payment_method, billing_cycle, product_id=None, domain=None, **kwargs
+):
+    """Place a product order in WHMCS.
+
+    See :func:`olittwhmcs.whmcs.order_product`.
+    """
+    if product_id:
+        parameters = serializer.order_product_request_parameters(
+            client_id, product_id, payment_method, billing_cycle, **kwargs
+        )
+    else:
+        parameters = serializer.order_domain_request_parameters(
+            client_id, domain, payment_method, billing_cycle, **kwargs
+        )
+    return await run_action(actions.ADD_ORDER, parameters)
+
+
+@with_timeout
+async def order_bulk_products(parameters=None, **kwargs):
+    """Place a multiple products order in WHMCS.
+
+    See :func:`olittwhmcs.whmcs.order_bulk_products`.
+    """
+    if not parameters:
+        parameters = {}
+    updated_parameters = serializer.order_bulk_products_request_parameters(parameters)
+    return await run_action(actions.ADD_ORDER, updated_parameters)
+
+
+@with_timeout
+async def get_domain_nameservers(domain_id):
+    """Get domain nameservers.
+
+    See :func:`olittwhmcs.whmcs.get_domain_nameservers`.
+    """
+    return await call_action("DomainGetNameservers", domain_id)
+
+
+@with_timeout
+async def update_domain_nameservers(data):
+    """Update a domain nameservers.
+
+    See :func:`olittwhmcs.whmcs.update_domain_nameservers`.
+    """
+    return await call_action("DomainUpdateNameservers", data)
+
+
+@with_timeout
+async def upgrade_client_product(
+    service_id, payment_method, billing_cycle=None, package_id=None
+):
+    """Upgrade a product in WHMCS.
+
+    See :func:`olittwhmcs.whmcs.upgrade_client_product`.
+    """
+    return await call_action(
+        "UpdateClientProduct", service_id, payment_method, billing_cycle, package_id
+    )
+
+
+###########
+# SERVICE #
+###########
+
+
+@with_timeout
+async def upgrade_product(
+    service_id,
+    payment_method,
+    upgrade_type,
+    new_product_id=None,
+    new_billing_cycle=None,
+    promo_code=None,
+):
+    """Upgrade, or calculate an upgrade on, a product.
+
+    See :func:`olittwhmcs.whmcs.upgrade_product`.
+    """
+    return await call_action(
+        "UpgradeProduct",
+        service_id,
+        payment_method,
+        upgrade_type,
+        new_product_id,
+        new_billing_cycle,
+        promo_code,
+    )
+
+
+@with_timeout
+async def add_invoice_payment(invoice_id, transaction_id, amount, date, gateway):
+    """Add a payment to an invoice.
+
+    See :func:`olittwhmcs.whmcs.add_invoice_payment`.
+    """
+    return await call_action(
+        "AddInvoicePayment", invoice_id, transaction_id, amount, date, gateway
+    )
+
+
+#########
+# ORDER #
+#########
+
+
+@with_timeout
+async def get_orders(client_id=None, order_id=None, status=None):
+    """Retrieve a WHMCS orders.
+
+    See :func:`olittwhmcs.whmcs.get_orders`.
+    """
+    return await call_action("GetOrders", client_id, order_id, status)
+
+
+@with_timeout
+async def cancel_order(order_id, cancel_subscription=None, no_email=None):
+    """Cancel a WHMCS order.
+
+    See :func:`olittwhmcs.whmcs.cancel_order`.
+    """
+    return await call_action("CancelOrder", order_id, cancel_subscription, no_email)
+
+
+###########
+# INVOICE #
+###########
+
+
+@with_timeout
+async def get_client_invoices_sso_url(client_id: int):
+    """Get or generate a url to view a client's invoices."""
+    return await get_sso_token_and_redirect_url(client_id, "clientarea:invoices")
+
+
+@with_timeout
+async def get_client_invoice_sso_url(client_id: int, invoice_id: int):
+    """Get or generate a url to view a client's invoices."""
+    return await get_sso_token_and_redirect_url(
+        client_id,
+        "sso:custom_redirect",
+        {"sso_redirect_path": f"/viewinvoice.php?id={invoice_id}"},
+    )
+
+
+@with_timeout
+async def get_invoices(client_id=None, status=None, order_by=None, order=None):
+    """Retrieve a WHMCS invoices.
+
+    See :func:`olittwhmcs.whmcs.get_invoices`.
+    """
+    return await call_action("GetInvoices", client_id, status, order_by, order)
+
+
+###########
+# AUTH #
+###########
+
+
+@with_timeout
+async def get_sso_token_and_redirect_url(
+    client_id: int, destination: str = "", extra_paramaters: Dict = None
+):
+    """
+    Generate Single Sign On access token and redirect url.
+
+    See :func:`olittwhmcs.whmcs.get_sso_token_and_redirect_url`. Tokens are
+    shared with the synchronous api through :data:`olittwhmcs.sso.sso_token_pool`
+    and refreshed in its background threads. A token created on a miss is
+    shared by the tasks waiting for it, each until its own deadline.
+    """
+    pool = sso.sso_token_pool
+    token = await sync_to_async(pool.lookup, thread_sensitive=False)(
+        client_id, destination, extra_paramaters
+    )
+    if token is None:
+        key = sso.get_token_key(client_id, destination, extra_paramaters)
+
+        async def create_token():
+            created_at = time.time()
+            with deadlines.unbounded():
+                access_token, redirect_url = await create_sso_token(
+                    client_id, destination, extra_paramaters
+                )
+            return await sync_to_async(pool.store, thread_sensitive=False)(
+                key, access_token, redirect_url, created_at
+            )
+
+        try:
+            token = await get_single_flight().do(
+                key, create_token, deadlines.get_remaining()
+            )
+        except asyncio.TimeoutError:
+            raise WhmcsTimeoutError(deadlines.DEADLINE_EXCEEDED)
+    return token["access_token"], token["redirect_url"]
+
+
+@with_timeout
+async def create_sso_token(
+    client_id: int, destination: str = "", extra_paramaters: Dict = None
+):
+    """
+    Create a Single Sign On access token in whmcs, bypassing the token pool.
+
+    See :func:`olittwhmcs.whmcs.create_sso_token`.
+    """
+    parameters = {
+        **serializer.get_template("CreateSsoToken"),
+        "client_id": client_id,
+        "destination": destination,
+        **(extra_paramaters or {}),
+    }
+    return await run_action(actions.CREATE_SSO_TOKEN, parameters)
+
+
+#########
+# BATCH #
+#########
+
+
+async def batch(function, arguments, max_workers=None, rate_limit=None):
+    """Await a WHMCS coroutine function for many inputs concurrently.
+
+    Args:
+        function (callable): The coroutine function to call. Eg get_client.
+        arguments (iterable): The arguments of each call. Each item is either
+            a tuple of positional arguments or a dict of keyword arguments.
+        max_workers (int): Optional. Maximum number of concurrent calls.
+        rate_limit (float): Optional. Maximum number of calls per second.
+    Returns:
+        list: The result of each call, in the order of the arguments. Calls
+            that fail hold the WhmcsException they raised instead.
+    """
+    semaphore = asyncio.Semaphore(max_workers or DEFAULT_BATCH_CONCURRENCY)
+    limiter = TokenBucket(rate_limit) if rate_limit else None
+
+    async def call(call_arguments):
+        async with semaphore:
+            try:
+                if limiter and not await limiter.acquire_async(
+                    deadlines.get_remaining()
+                ):
+                    raise WhmcsTimeoutError(deadlines.DEADLINE_EXCEEDED)
+                if isinstance(call_arguments, dict):
+                    return await function(**call_arguments)
+                return await function(*call_arguments)
+            except WhmcsException as e:
+                return e
+
+    return await asyncio.gather(*(call(item) for item in arguments))
+
+
+async def map_clients(client_ids, max_workers=None, rate_limit=None):
+    """Retrieve many WHMCS clients concurrently.
+
+    See :func:`olittwhmcs.whmcs.map_clients`.
+    """
+    arguments = ({"client_id": client_id} for client_id in client_ids)
+    return await batch(get_client, arguments, max_workers, rate_limit)
+
+
+async def map_client_products(client_ids, max_workers=None, rate_limit=None):
+    """Retrieve the products of many WHMCS clients concurrently.
+
+    See :func:`olittwhmcs.whmcs.map_client_products`.
+    """
+    arguments = ((client_id,) for client_id in client_ids)
+    return await batch(get_client_products, arguments, max_workers, rate_limit)
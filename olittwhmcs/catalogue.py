@@ -0,0 +1,380 @@
+"""This module contains an in-memory cache of the whmcs product catalogue.
+
+The catalogue can also be persisted to a snapshot file, set with the
+``WHMCS_CATALOGUE_SNAPSHOT`` setting, so new processes start serving
+products straight from disk instead of each calling GetProducts. Snapshots
+older than ``WHMCS_CATALOGUE_SNAPSHOT_MAX_AGE`` seconds are ignored, and
+younger ones past the ttl are served while the catalogue is refreshed in
+the background. A lock file next to the snapshot lets a single process
+refresh it at a time.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from olittwhmcs import jsonbackends, metrics, whmcs
+from olittwhmcs.models import Product
+
+try:
+    import fcntl
+except ImportError:  # Windows, where snapshots are refreshed without a lock.
+    fcntl = None
+
+DEFAULT_TTL = 60 * 60
+DEFAULT_CURRENCY = "USD"
+DEFAULT_SNAPSHOT_MAX_AGE = 24 * 60 * 60
+RETRY_INTERVAL = 30
+SNAPSHOT_FORMAT = 1
+
+#############
+# SNAPSHOTS #
+#############
+
+
+def write_snapshot(path, whmcs_products):
+    """
+    Atomically write the products to a snapshot file.
+
+    The file holds a JSON header with the format, version and save time of
+    the snapshot on its first line, followed by the products.
+    :param path: String, path of the snapshot file.
+    :param whmcs_products: List, product dictionaries obtained from whmcs.
+    :return: The version of the products, a hash of their content.
+    :rtype: String
+    :raises OSError: If the file cannot be written.
+    """
+    body = json.dumps(whmcs_products, separators=(",", ":")).encode()
+    version = hashlib.sha1(body).hexdigest()
+    header = json.dumps(
+        {"format": SNAPSHOT_FORMAT, "version": version, "saved_at": time.time()}
+    ).encode()
+    descriptor, temporary_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), prefix=".catalogue-"
+    )
+    try:
+        with os.fdopen(descriptor, "wb") as snapshot:
+            snapshot.write(header + b"\n" + body)
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+    return version
+
+
+def read_snapshot(path):
+    """
+    Read a snapshot file, mapping it in memory rather than copying it.
+
+    The products are decoded straight from the mapping when the JSON backend
+    supports it, see :func:`olittwhmcs.jsonbackends.loads`.
+    :param path: String, path of the snapshot file.
+    :return: The header of the snapshot and the products, None if the file
+        is missing or invalid.
+    :rtype: Tuple or None
+    """
+    try:
+        with open(path, "rb") as snapshot, mmap.mmap(
+            snapshot.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data:
+            end = data.find(b"\n")
+            if end < 0:
+                return None
+            header = json.loads(data[:end])
+            if header.get("format") != SNAPSHOT_FORMAT:
+                return None
+            with memoryview(data) as view, view[end + 1:] as body:
+                return header, jsonbackends.loads(body)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+@contextmanager
+def lock_snapshot(path, blocking=False):
+    """
+    Hold the lock of a snapshot while refreshing it, across processes.
+    :param path: String, path of the snapshot file, None if there is none.
+    :param blocking: Boolean, wait for the lock instead of giving up.
+    :return: Context manager yielding whether the lock was acquired.
+    """
+    if fcntl is None or not path:
+        yield True
+        return
+    try:
+        lock_file = open(f"{path}.lock", "a")
+    except OSError:
+        yield True
+        return
+    with lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+#############
+# CATALOGUE #
+#############
+
+
+class CatalogueView:
+    """The products of the catalogue priced in a single currency."""
+
+    def __init__(self, whmcs_products, currency):
+        """Build the products and their indexes.
+
+        Args:
+            whmcs_products (list): Product dictionaries obtained from whmcs.
+            currency (str): Currency to get prices in.
+        """
+        self.currency = currency
+        self.products = [
+            Product(whmcs_product, currency) for whmcs_product in whmcs_products
+        ]
+        self.by_id = {}
+        self.by_group = {}
+        self.by_module = {}
+        for product in self.products:
+            self.by_id[str(product.id)] = product
+            self.by_group.setdefault(str(product.group_id), []).append(product)
+            self.by_module.setdefault(product.module, []).append(product)
+
+
+class ProductCatalogue:
+    """Cache of the whmcs product catalogue.
+
+    The full catalogue is fetched once and kept in memory. Once it is older
+    than the ttl it is refreshed in a background thread while the stale
+    products keep being served. With a snapshot file the catalogue is loaded
+    from disk on first use and saved to it after every refresh.
+    """
+
+    def __init__(self, ttl=None, fetch_products=None, snapshot_path=None):
+        """Create an empty catalogue.
+
+        Args:
+            ttl (int): Optional. Seconds before the catalogue is refreshed.
+                Defaults to the ``WHMCS_CATALOGUE_TTL`` setting.
+            fetch_products (callable): Optional. Returns the product
+                dictionaries of the whole catalogue.
+            snapshot_path (str): Optional. Path of the snapshot file.
+                Defaults to the ``WHMCS_CATALOGUE_SNAPSHOT`` setting.
+        """
+        self._ttl = ttl
+        self._fetch_products = fetch_products or whmcs.get_raw_products
+        self._snapshot_path = snapshot_path
+        self.version = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._whmcs_products = None
+        self._views = {}
+        self._loaded_at = None
+        self._retry_at = None
+        self._refreshing = False
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, "WHMCS_CATALOGUE_TTL", DEFAULT_TTL)
+
+    @property
+    def snapshot_path(self):
+        if self._snapshot_path is not None:
+            return self._snapshot_path
+        return getattr(settings, "WHMCS_CATALOGUE_SNAPSHOT", None)
+
+    def get_products(self, currency=None):
+        """Retrieve all products.
+
+        Args:
+            currency (str): Optional. Currency to display prices. Eg kes, usd.
+        Returns:
+            list: The products in the catalogue.
+        Raises:
+            WhmcsException: If the catalogue has never been fetched and
+                fetching it fails.
+        """
+        return list(self.get_view(currency).products)
+
+    def get_product(self, product_id, currency=None):
+        """Retrieve a product by id, or None if it is not in the catalogue."""
+        return self.get_view(currency).by_id.get(str(product_id))
+
+    def get_group_products(self, group_id, currency=None):
+        """Retrieve the products in a product group."""
+        return list(self.get_view(currency).by_group.get(str(group_id), []))
+
+    def get_module_products(self, module, currency=None):
+        """Retrieve the products provisioned by a module."""
+        return list(self.get_view(currency).by_module.get(module, []))
+
+    def get_view(self, currency=None):
+        """Retrieve the catalogue priced in a currency.
+
+        Args:
+            currency (str): Optional. Currency to display prices. Eg kes, usd.
+        Returns:
+            CatalogueView: The products priced in the currency.
+        """
+        currency = (currency or DEFAULT_CURRENCY).upper()
+        whmcs_products = self._get_whmcs_products()
+        view = self._views.get(currency)
+        if view is None:
+            with self._lock:
+                if self._whmcs_products is not whmcs_products:
+                    return CatalogueView(whmcs_products, currency)
+                view = self._views.get(currency)
+                if view is None:
+                    view = CatalogueView(whmcs_products, currency)
+                    self._views[currency] = view
+        return view
+
+    def refresh(self):
+        """Fetch the catalogue from whmcs and replace the cached products.
+
+        Raises:
+            WhmcsException: If an error occurs.
+        """
+        whmcs_products = self._fetch_products()
+        self.load(whmcs_products, version=self.save_snapshot(whmcs_products))
+
+    def load(self, whmcs_products, loaded_at=None, version=None):
+        """Replace the cached products.
+
+        Args:
+            whmcs_products (list): Product dictionaries obtained from whmcs.
+            loaded_at (float): Optional. Time the products were fetched.
+            version (str): Optional. Version of the products. The priced
+                views are kept when it matches the cached version.
+        """
+        with self._lock:
+            if (
+                self._whmcs_products is None
+                or version is None
+                or version != self.version
+            ):
+                self._whmcs_products = whmcs_products
+                self._views = {}
+            self.version = version
+            self._loaded_at = time.monotonic() if loaded_at is None else loaded_at
+            self._retry_at = None
+
+    def load_snapshot(self):
+        """Load the products from the snapshot file.
+
+        Returns:
+            bool: Whether a snapshot younger than the max age was loaded.
+        """
+        path = self.snapshot_path
+        snapshot = read_snapshot(path) if path else None
+        if snapshot is None:
+            return False
+        header, whmcs_products = snapshot
+        age = max(0, time.time() - header["saved_at"])
+        max_age = getattr(
+            settings, "WHMCS_CATALOGUE_SNAPSHOT_MAX_AGE", DEFAULT_SNAPSHOT_MAX_AGE
+        )
+        if age > max_age:
+            return False
+        self.load(whmcs_products, time.monotonic() - age, header["version"])
+        return True
+
+    def save_snapshot(self, whmcs_products):
+        """Save the products to the snapshot file, if one is configured.
+
+        Args:
+            whmcs_products (list): Product dictionaries obtained from whmcs.
+        Returns:
+            str: The version of the products, None if they were not saved.
+        """
+        path = self.snapshot_path
+        if not path:
+            return None
+        try:
+            return write_snapshot(path, whmcs_products)
+        except OSError:
+            # The snapshot only speeds up cold starts, keep serving without.
+            return None
+
+    def invalidate(self):
+        """Drop the cached products so the next lookup fetches them again."""
+        with self._lock:
+            self._whmcs_products = None
+            self._views = {}
+            self._loaded_at = None
+            self.version = None
+
+    def is_stale(self):
+        """Check whether the cached products are older than the ttl."""
+        loaded_at = self._loaded_at
+        if loaded_at is None:
+            return True
+        now = time.monotonic()
+        if self._retry_at is not None and now < self._retry_at:
+            return False
+        return now - loaded_at >= self.ttl
+
+    def _get_whmcs_products(self):
+        whmcs_products = self._whmcs_products
+        if metrics.is_enabled():
+            metrics.record_cache_request(
+                "catalogue", "GetProducts", whmcs_products is not None
+            )
+        if whmcs_products is None:
+            with self._load_lock:
+                if self._whmcs_products is not None:
+                    return self._whmcs_products
+                if not self.load_snapshot():
+                    # Wait for any other process fetching the catalogue and
+                    # use its snapshot instead of fetching it again.
+                    with lock_snapshot(self.snapshot_path, blocking=True):
+                        if not self.load_snapshot():
+                            self.refresh()
+                            return self._whmcs_products
+                whmcs_products = self._whmcs_products
+        # Snapshots may be older than the ttl.
+        if self.is_stale():
+            self._refresh_in_background()
+        return whmcs_products
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        thread = threading.Thread(target=self._background_refresh, daemon=True)
+        thread.start()
+
+    def _background_refresh(self):
+        try:
+            with lock_snapshot(self.snapshot_path) as is_locked:
+                if not is_locked:
+                    # Another process is refreshing the snapshot, load it
+                    # once it is done.
+                    self._retry_at = time.monotonic() + RETRY_INTERVAL
+                elif not self.load_snapshot() or self.is_stale():
+                    self.refresh()
+        except Exception:
+            # Keep serving the stale catalogue and retry a little later.
+            self._retry_at = time.monotonic() + RETRY_INTERVAL
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+
+product_catalogue = ProductCatalogue()
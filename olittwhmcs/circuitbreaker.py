@@ -0,0 +1,185 @@
+"""This module contains the circuit breakers guarding the whmcs endpoint."""
+
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RECOVERY_TIMEOUT = 30
+DEFAULT_HALF_OPEN_CALLS = 1
+
+
+class CircuitBreaker:
+    """Stops sending requests to whmcs once they keep failing.
+
+    The breaker opens after ``failure_threshold`` consecutive failures and
+    rejects calls until ``recovery_timeout`` seconds have passed. It then lets
+    up to ``half_open_calls`` probe requests through: a successful probe
+    closes the breaker, a failed one opens it again.
+    """
+
+    def __init__(
+        self,
+        failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+        recovery_timeout=DEFAULT_RECOVERY_TIMEOUT,
+        half_open_calls=DEFAULT_HALF_OPEN_CALLS,
+    ):
+        """Create a closed breaker.
+
+        Args:
+            failure_threshold (int): Optional. Consecutive failures that open
+                the breaker.
+            recovery_timeout (float): Optional. Seconds the breaker stays open
+                before probing whmcs again.
+            half_open_calls (int): Optional. Number of concurrent probes
+                allowed while half open.
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_calls = half_open_calls
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """The state of the breaker: closed, open or half_open."""
+        with self._lock:
+            return self._get_state(time.monotonic())
+
+    def allow(self):
+        """Check whether a request may be sent, reserving a probe if half open.
+
+        Returns:
+            bool: True if the request may be sent.
+        """
+        with self._lock:
+            state = self._get_state(time.monotonic())
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._probes < self.half_open_calls:
+                self._state = HALF_OPEN
+                self._probes += 1
+                return True
+            return False
+
+    def cancel(self):
+        """Give back a probe reserved by :meth:`allow` for an unsent request."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes:
+                self._probes -= 1
+
+    def record_success(self):
+        """Record a successful request, closing the breaker."""
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._opened_at = None
+            self._probes = 0
+
+    def record_failure(self):
+        """Record a failed request, opening the breaker past the threshold."""
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probes = 0
+
+    def get_status(self):
+        """Retrieve the state and failure count of the breaker.
+
+        Returns:
+            dict: The state, consecutive failures and seconds since opening.
+        """
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "state": self._get_state(now),
+                "failures": self._failures,
+                "open_for": now - self._opened_at if self._opened_at else None,
+            }
+
+    def _get_state(self, now):
+        if self._state == OPEN and now - self._opened_at >= self.recovery_timeout:
+            return HALF_OPEN
+        return self._state
+
+
+class CircuitBreakerRegistry:
+    """Circuit breakers for each whmcs endpoint and each action on it.
+
+    A request is only sent if both the breaker of its endpoint and the
+    breaker of its action allow it, so an outage of the whole endpoint
+    fails every action fast while a single failing action leaves the
+    others alone.
+    """
+
+    def __init__(self, **breaker_options):
+        """Create an empty registry.
+
+        Args:
+            breaker_options: Optional. Arguments of every CircuitBreaker.
+        """
+        self.breaker_options = breaker_options
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, endpoint, action=None):
+        """Retrieve the breaker of an endpoint, or of an action on it."""
+        key = (endpoint, action)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(
+                    key, CircuitBreaker(**self.breaker_options)
+                )
+        return breaker
+
+    def allow(self, endpoint, action):
+        """Check whether a request for an action may be sent to an endpoint."""
+        endpoint_breaker = self.get(endpoint)
+        if not endpoint_breaker.allow():
+            return False
+        if not self.get(endpoint, action).allow():
+            endpoint_breaker.cancel()
+            return False
+        return True
+
+    def cancel(self, endpoint, action):
+        """Give back the probes reserved by :meth:`allow` for an unsent request.
+
+        Also used when a request is abandoned at its deadline, which says
+        nothing about the health of whmcs.
+        """
+        self.get(endpoint).cancel()
+        self.get(endpoint, action).cancel()
+
+    def record_success(self, endpoint, action):
+        """Record a successful request for an action on an endpoint."""
+        self.get(endpoint).record_success()
+        self.get(endpoint, action).record_success()
+
+    def record_failure(self, endpoint, action):
+        """Record a failed request for an action on an endpoint."""
+        self.get(endpoint).record_failure()
+        self.get(endpoint, action).record_failure()
+
+    def get_states(self):
+        """Retrieve the status of every breaker.
+
+        Returns:
+            list: A dict per breaker with its endpoint, action (None for the
+                endpoint breaker) and status.
+        """
+        with self._lock:
+            breakers = list(self._breakers.items())
+        return [
+            {"endpoint": endpoint, "action": action, **breaker.get_status()}
+            for (endpoint, action), breaker in breakers
+        ]
@@ -0,0 +1,245 @@
+"""Memory compact whmcs models.
+
+These models have the same attributes as those in :mod:`olittwhmcs.models`
+but use ``__slots__`` and keep a reference to the whmcs dictionary instead
+of copying every field. Plain fields are read from the dictionary on access,
+expensive fields such as dates, amounts and line items are decoded on first
+access and cached.
+"""
+
+from olittwhmcs.models import Order as OrderModel
+from olittwhmcs.models import Product as ProductModel
+from olittwhmcs.models import get_date_object
+from olittwhmcs.parsing import parse_amount
+
+
+class Field:
+    """Attribute read from the whmcs dictionary of the model."""
+
+    def __init__(self, key):
+        self.key = key
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance.whmcs_data.get(self.key)
+
+
+class LazyField:
+    """Attribute decoded from the whmcs dictionary once, on first access.
+
+    The decoded value is cached in the ``_<name>`` slot of the model.
+    """
+
+    def __init__(self, decode):
+        self.decode = decode
+        self.slot = None
+
+    def __set_name__(self, owner, name):
+        self.slot = f"_{name}"
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        try:
+            return getattr(instance, self.slot)
+        except AttributeError:
+            value = self.decode(instance)
+            setattr(instance, self.slot, value)
+            return value
+
+
+def date_field(key, date_format):
+    """Lazy attribute parsing a whmcs date."""
+    return LazyField(
+        lambda model: get_date_object(model.whmcs_data.get(key), date_format)
+    )
+
+
+def float_field(key):
+    """Lazy attribute converting a whmcs amount to a float."""
+    return LazyField(lambda model: parse_amount(model.whmcs_data.get(key)))
+
+
+class CompactModel:
+    """Base of the compact models, holding the whmcs dictionary."""
+
+    __slots__ = ("whmcs_data",)
+
+    def __init__(self, whmcs_data):
+        self.whmcs_data = whmcs_data
+
+
+class Client(CompactModel):
+    """This object contains a whmcs client."""
+
+    __slots__ = ()
+
+    id = Field("id")
+    uuid = Field("uuid")
+    first_name = Field("firstname")
+    last_name = Field("lastname")
+    email = Field("email")
+    phone_country_code = Field("phonecc")
+    phone_number = Field("telephoneNumber")
+    company = Field("companyname")
+    address = Field("address1")
+    postcode = Field("postcode")
+    city = Field("city")
+    state = Field("state")
+    country = Field("country")
+    currency_id = Field("currency")
+    currency_code = Field("currency_code")
+
+    def __init__(self, whmcs_client):
+        """Wrap the whmcs client.
+
+        Args:
+            whmcs_client (dict): Response obtained from whmcs.
+        """
+        super().__init__(whmcs_client.get("client"))
+
+
+class Product(CompactModel):
+    """This object contains a whmcs product."""
+
+    __slots__ = ("currency", "_pricing")
+
+    id = Field("pid")
+    group_id = Field("gid")
+    module = Field("module")
+    type = Field("type")
+    name = Field("name")
+    description = Field("description")
+    billing_cycle = Field("paytype")
+    pricing = LazyField(
+        lambda product: ProductModel.get_pricing(
+            product.whmcs_data.get("pricing"), product.currency
+        )
+    )
+
+    def __init__(self, whmcs_product, currency):
+        """Wrap the whmcs product.
+
+        Args:
+            whmcs_product (dict): Response obtained from whmcs.
+            currency (str): Currency to get prices in.
+        """
+        super().__init__(whmcs_product)
+        self.currency = currency
+
+
+class ClientProduct(CompactModel):
+    """This object contains a whmcs client's product."""
+
+    __slots__ = ("_registration_date", "_next_due_date")
+
+    id = Field("id")
+    client_id = Field("clientid")
+    order_id = Field("orderid")
+    product_id = Field("pid")
+    registration_date = date_field("regdate", "%Y-%m-%d")
+    name = Field("name")
+    translated_name = Field("translated_name")
+    group_name = Field("groupname")
+    translated_group_name = Field("translated_groupname")
+    suspension_reason = Field("suspensionreason")
+    first_payment_amount = Field("firstpaymentamount")
+    recurring_amount = Field("recurringamount")
+    payment_method = Field("payment_method")
+    payment_method_name = Field("paymentmethodname")
+    billing_cycle = Field("billingcycle")
+    next_due_date = date_field("nextduedate", "%Y-%m-%d")
+    status = Field("status")
+    notes = Field("notes")
+
+
+class ProductUpgrade(CompactModel):
+    """Deserialize upgrade product response."""
+
+    __slots__ = ()
+
+    id = Field("id")
+    old_product_id = Field("oldproductid")
+    old_product_name = Field("oldproductname")
+    new_product_id = Field("newproductid")
+    new_product_name = Field("newproductid")
+    new_product_billing_cycle = Field("newproductbillingcycle")
+    days_until_renewal = Field("daysuntilrenewal")
+    price = Field("price")
+    order_id = Field("orderid")
+    order_number = Field("order_number")
+    invoice_id = Field("invoiceid")
+
+
+def get_order_items(order):
+    """Decode the line items of a compact order."""
+    try:
+        order_items = order.whmcs_data.get("lineitems").get("lineitem")
+        return [OrderModel.get_order_items(order_item) for order_item in order_items]
+    except AttributeError:
+        return []
+
+
+class Order(CompactModel):
+    """This object contains a whmcs order."""
+
+    __slots__ = ("_date", "_items")
+
+    id = Field("id")
+    order_number = Field("ordernum")
+    order_data = Field("orderdata")
+    client_id = Field("userid")
+    date = date_field("date", "%Y-%m-%d %H:%M:%S")
+    nameservers = Field("nameservers")
+    transfer_secret = Field("transfersecret")
+    renewals = Field("renewals")
+    promo_code = Field("promocode")
+    promo_type = Field("promotype")
+    promo_value = Field("promovalue")
+    amount = Field("amount")
+    invoice_id = Field("invoiceid")
+    payment_status = Field("paymentstatus")
+    payment_method = Field("paymentmethod")
+    fraud_module = Field("fraudmodule")
+    fraud_output = Field("fraudoutput")
+    fraud_data = Field("frauddata")
+    status = Field("status")
+    notes = Field("notes")
+    items = LazyField(get_order_items)
+
+
+class Invoice(CompactModel):
+    """This object contains a whmcs invoice."""
+
+    __slots__ = (
+        "_date_created",
+        "_date_due",
+        "_date_paid",
+        "_last_capture_attempt",
+        "_sub_total",
+        "_total",
+        "_credit",
+        "_tax",
+        "_tax2",
+        "_tax_rate",
+        "_tax_rate_2",
+    )
+
+    id = Field("id")
+    invoice_number = Field("invoicenum")
+    client_id = Field("userid")
+    date_created = date_field("date", "%Y-%m-%d")
+    date_due = date_field("duedate", "%Y-%m-%d")
+    date_paid = date_field("datepaid", "%Y-%m-%d %H:%M:%S")
+    last_capture_attempt = date_field("last_capture_attempt", "%Y-%m-%d %H:%M:%S")
+    sub_total = float_field("subtotal")
+    total = float_field("total")
+    credit = float_field("credit")
+    tax = float_field("tax")
+    tax2 = float_field("tax2")
+    tax_rate = float_field("taxrate")
+    tax_rate_2 = float_field("taxrate2")
+    status = Field("status")
+    payment_method = Field("paymentmethod")
+    notes = Field("notes")
@@ -0,0 +1,140 @@
+"""This module contains the deadlines that bound the duration of whmcs calls.
+
+A deadline is set for a block of code with :func:`deadline`, or for a single
+call with the ``timeout`` keyword argument every function of
+:mod:`olittwhmcs.whmcs` and :mod:`olittwhmcs.aio` accepts. Connect and read
+timeouts, retries, waits for coalesced requests and the pages of a paginated
+list are all cut short so the call never runs past its deadline. Nested
+deadlines can only shorten the enclosing one.
+"""
+
+import asyncio
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from olittwhmcs.exceptions import WhmcsTimeoutError
+
+DEADLINE_EXCEEDED = "Whmcs request deadline exceeded."
+
+# Monotonic time by which the current call must complete, None if unbounded.
+_expires_at = ContextVar("whmcs_deadline", default=None)
+
+
+@contextmanager
+def deadline(timeout):
+    """
+    Bound the whmcs calls made in a block to ``timeout`` seconds.
+    :param timeout: Float, seconds the block may take. None for no deadline.
+    """
+    if timeout is None:
+        yield
+        return
+    with deadline_at(time.monotonic() + timeout):
+        yield
+
+
+@contextmanager
+def deadline_at(expires_at):
+    """
+    Bound the whmcs calls made in a block by an absolute deadline.
+    :param expires_at: Float, ``time.monotonic()`` by which the calls must end.
+    """
+    current = _expires_at.get()
+    if current is not None:
+        expires_at = min(current, expires_at)
+    token = _expires_at.set(expires_at)
+    try:
+        yield
+    finally:
+        _expires_at.reset(token)
+
+
+@contextmanager
+def unbounded():
+    """
+    Lift the deadline for a block.
+
+    Used for a call shared by several callers, each bounding its own wait
+    for the call rather than the call itself.
+    """
+    token = _expires_at.set(None)
+    try:
+        yield
+    finally:
+        _expires_at.reset(token)
+
+
+def get_expiry():
+    """Retrieve the monotonic time of the current deadline, None if unbounded."""
+    return _expires_at.get()
+
+
+def get_remaining():
+    """
+    Retrieve the seconds left before the current deadline.
+    :return: The seconds left, None if there is no deadline.
+    :rtype: Float or None
+    :raises WhmcsTimeoutError: If the deadline has passed.
+    """
+    expires_at = _expires_at.get()
+    if expires_at is None:
+        return None
+    remaining = expires_at - time.monotonic()
+    if remaining <= 0:
+        raise WhmcsTimeoutError(DEADLINE_EXCEEDED)
+    return remaining
+
+
+def has_expired():
+    """Check whether the current deadline has passed."""
+    expires_at = _expires_at.get()
+    return expires_at is not None and time.monotonic() >= expires_at
+
+
+def with_timeout(function):
+    """
+    Add a ``timeout`` keyword argument to a function, bounding its duration.
+
+    Supports functions, coroutine functions and generator functions. The
+    timeout of a generator covers its whole iteration, time spent by the
+    consumer between items included.
+    """
+    if inspect.isgeneratorfunction(function):
+
+        @functools.wraps(function)
+        def generator_wrapper(*args, timeout=None, **kwargs):
+            if timeout is None:
+                return (yield from function(*args, **kwargs))
+            expires_at = time.monotonic() + timeout
+            iterator = function(*args, **kwargs)
+            try:
+                while True:
+                    with deadline_at(expires_at):
+                        try:
+                            item = next(iterator)
+                        except StopIteration as stop:
+                            return stop.value
+                    yield item
+            finally:
+                iterator.close()
+
+        return generator_wrapper
+
+    if asyncio.iscoroutinefunction(function):
+
+        @functools.wraps(function)
+        async def coroutine_wrapper(*args, timeout=None, **kwargs):
+            with deadline(timeout):
+                return await function(*args, **kwargs)
+
+        return coroutine_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, timeout=None, **kwargs):
+        with deadline(timeout):
+            return function(*args, **kwargs)
+
+    return wrapper
@@ -14,3 +14,7 @@ class WhmcsException(Exception):
 
 class WhmcsConnectionError(WhmcsException):
     """An error occurred while connecting to the whmcs server"""
+
+
+class WhmcsTimeoutError(WhmcsConnectionError):
+    """The deadline of a whmcs call passed before whmcs responded"""
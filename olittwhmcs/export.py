@@ -0,0 +1,373 @@
+"""This module contains the columnar bulk export of whmcs records.
+
+Records are streamed page by page from whmcs straight into typed column
+buffers without building a model per record. Ids are stored as int64,
+amounts as float64, dates as int64 seconds since the epoch and low
+cardinality text such as statuses as dictionary encoded codes.
+
+Converting a table to NumPy requires ``numpy`` and writing Arrow or Parquet
+requires ``pyarrow``; install the ``export`` extra for both.
+"""
+
+import calendar
+from array import array
+from functools import lru_cache
+
+from olittwhmcs import whmcs
+from olittwhmcs.parsing import parse_amount, parse_date
+from olittwhmcs.serializer import (
+    get_client_product_request_parameters,
+    prepare_get_invoices_request,
+    prepare_get_orders_request,
+)
+
+INT = "int"
+AMOUNT = "amount"
+DATE = "date"
+CATEGORY = "category"
+
+# numpy.datetime64("NaT") has the same int64 representation.
+MISSING_DATE = -(2 ** 63)
+MISSING_INT = 0
+
+INVOICE_COLUMNS = (
+    ("id", "id", INT),
+    ("client_id", "userid", INT),
+    ("date_created", "date", DATE),
+    ("date_due", "duedate", DATE),
+    ("date_paid", "datepaid", DATE),
+    ("sub_total", "subtotal", AMOUNT),
+    ("tax", "tax", AMOUNT),
+    ("tax2", "tax2", AMOUNT),
+    ("credit", "credit", AMOUNT),
+    ("total", "total", AMOUNT),
+    ("status", "status", CATEGORY),
+    ("payment_method", "paymentmethod", CATEGORY),
+)
+
+ORDER_COLUMNS = (
+    ("id", "id", INT),
+    ("client_id", "userid", INT),
+    ("invoice_id", "invoiceid", INT),
+    ("date", "date", DATE),
+    ("amount", "amount", AMOUNT),
+    ("status", "status", CATEGORY),
+    ("payment_status", "paymentstatus", CATEGORY),
+    ("payment_method", "paymentmethod", CATEGORY),
+)
+
+CLIENT_PRODUCT_COLUMNS = (
+    ("id", "id", INT),
+    ("client_id", "clientid", INT),
+    ("order_id", "orderid", INT),
+    ("product_id", "pid", INT),
+    ("registration_date", "regdate", DATE),
+    ("next_due_date", "nextduedate", DATE),
+    ("first_payment_amount", "firstpaymentamount", AMOUNT),
+    ("recurring_amount", "recurringamount", AMOUNT),
+    ("billing_cycle", "billingcycle", CATEGORY),
+    ("status", "status", CATEGORY),
+    ("payment_method", "paymentmethod", CATEGORY),
+)
+
+
+@lru_cache(maxsize=4096)
+def get_timestamp(value):
+    """Convert a whmcs date into seconds since the epoch."""
+    date = parse_date(value)
+    if date is None:
+        return MISSING_DATE
+    return calendar.timegm(date.timetuple())
+
+
+def get_int(value):
+    """Convert a whmcs id into an int."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return MISSING_INT
+
+
+def get_float(value):
+    """Convert a whmcs amount into a float, NaN when it is missing."""
+    amount = parse_amount(value)
+    return float("nan") if amount is None else amount
+
+
+class DictionaryColumn:
+    """Text column stored as integer codes into a list of distinct values."""
+
+    def __init__(self):
+        self.codes = array("q")
+        self.categories = []
+        self._index = {}
+
+    def append(self, value):
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.categories)
+            self.categories.append(value)
+        self.codes.append(code)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def decode(self):
+        """Retrieve the values of the column."""
+        return [self.categories[code] for code in self.codes]
+
+
+class ColumnarTable:
+    """Whmcs records stored column by column."""
+
+    def __init__(self, columns):
+        """Create an empty table.
+
+        Args:
+            columns (tuple): (name, whmcs key, type) of each column.
+        """
+        self.schema = columns
+        self.columns = {}
+        for name, _, column_type in columns:
+            if column_type == CATEGORY:
+                self.columns[name] = DictionaryColumn()
+            elif column_type == AMOUNT:
+                self.columns[name] = array("d")
+            else:
+                self.columns[name] = array("q")
+
+    def __len__(self):
+        return len(self.columns[self.schema[0][0]])
+
+    def append(self, whmcs_record):
+        """Add a record obtained from whmcs to the table."""
+        for name, key, column_type in self.schema:
+            value = whmcs_record.get(key)
+            if column_type == INT:
+                value = get_int(value)
+            elif column_type == AMOUNT:
+                value = get_float(value)
+            elif column_type == DATE:
+                value = get_timestamp(value)
+            self.columns[name].append(value)
+
+    def extend(self, whmcs_records):
+        """Add records obtained from whmcs to the table."""
+        for whmcs_record in whmcs_records:
+            self.append(whmcs_record)
+        return self
+
+    def to_numpy(self):
+        """Convert the table into a NumPy record array.
+
+        Dates become datetime64[s] and dictionary encoded columns are
+        decoded into unicode strings.
+
+        Returns:
+            numpy.recarray: The records.
+        """
+        import numpy
+
+        arrays = [self.get_numpy_column(name) for name, _, _ in self.schema]
+        names = [name for name, _, _ in self.schema]
+        return numpy.rec.fromarrays(arrays, names=names)
+
+    def get_numpy_column(self, name):
+        """Convert a column into a NumPy array.
+
+        Args:
+            name (str): Name of the column.
+        Returns:
+            numpy.ndarray: The values of the column.
+        """
+        import numpy
+
+        column = self.columns[name]
+        column_type = self.get_type(name)
+        if column_type == CATEGORY:
+            return numpy.array(column.categories, dtype=str)[
+                numpy.frombuffer(column.codes, dtype=numpy.int64)
+            ]
+        if column_type == DATE:
+            return numpy.frombuffer(column, dtype=numpy.int64).view("datetime64[s]")
+        return numpy.frombuffer(column, dtype=numpy.dtype(column.typecode))
+
+    def to_arrow(self):
+        """Convert the table into an Arrow table.
+
+        Dates become timestamp[s] and text columns stay dictionary encoded.
+
+        Returns:
+            pyarrow.Table: The records.
+        """
+        import pyarrow
+        import pyarrow.compute
+
+        def from_buffer(values, arrow_type):
+            return pyarrow.Array.from_buffers(
+                arrow_type, len(values), [None, pyarrow.py_buffer(values)]
+            )
+
+        arrays = []
+        for name, _, column_type in self.schema:
+            column = self.columns[name]
+            if column_type == CATEGORY:
+                arrays.append(
+                    pyarrow.DictionaryArray.from_arrays(
+                        from_buffer(column.codes, pyarrow.int64()),
+                        pyarrow.array(column.categories, type=pyarrow.string()),
+                    )
+                )
+            elif column_type == DATE:
+                timestamps = from_buffer(column, pyarrow.int64())
+                missing = pyarrow.compute.equal(timestamps, MISSING_DATE)
+                timestamps = pyarrow.compute.if_else(
+                    missing, pyarrow.scalar(None, pyarrow.int64()), timestamps
+                )
+                arrays.append(timestamps.cast(pyarrow.timestamp("s")))
+            elif column_type == AMOUNT:
+                arrays.append(from_buffer(column, pyarrow.float64()))
+            else:
+                arrays.append(from_buffer(column, pyarrow.int64()))
+        return pyarrow.Table.from_arrays(
+            arrays, names=[name for name, _, _ in self.schema]
+        )
+
+    def write_parquet(self, path):
+        """Write the table to a Parquet file.
+
+        Args:
+            path (str): Path of the file to write.
+        """
+        import pyarrow.parquet
+
+        pyarrow.parquet.write_table(self.to_arrow(), path)
+
+    def get_type(self, name):
+        """Retrieve the type of a column."""
+        for column_name, _, column_type in self.schema:
+            if column_name == name:
+                return column_type
+        raise KeyError(name)
+
+    def sum_by(self, category, amount):
+        """Sum an amount column for each value of a dictionary column.
+
+        Eg ``table.sum_by("status", "total")`` for invoice totals by status.
+
+        Args:
+            category (str): Name of the dictionary column to group by.
+            amount (str): Name of the amount column to sum.
+        Returns:
+            dict: The sum of the amounts for each value.
+        """
+        import numpy
+
+        column = self.columns[category]
+        codes = numpy.frombuffer(column.codes, dtype=numpy.int64)
+        amounts = numpy.nan_to_num(self.get_numpy_column(amount))
+        sums = numpy.bincount(
+            codes, weights=amounts, minlength=len(column.categories)
+        )
+        return dict(zip(column.categories, sums.tolist()))
+
+    def sum_by_month(self, date, amount):
+        """Sum an amount column for each month of a date column.
+
+        Eg ``table.sum_by_month("date_paid", "total")`` for revenue by month.
+        Records without a date are left out.
+
+        Args:
+            date (str): Name of the date column to group by.
+            amount (str): Name of the amount column to sum.
+        Returns:
+            dict: The sum of the amounts for each month, keyed YYYY-MM.
+        """
+        import numpy
+
+        dates = self.get_numpy_column(date)
+        amounts = numpy.nan_to_num(self.get_numpy_column(amount))
+        has_date = ~numpy.isnat(dates)
+        months = dates[has_date].astype("datetime64[M]")
+        unique_months, month_codes = numpy.unique(months, return_inverse=True)
+        sums = numpy.bincount(month_codes, weights=amounts[has_date])
+        return dict(zip(unique_months.astype(str).tolist(), sums.tolist()))
+
+
+def export_invoices(
+    client_id=None, status=None, order_by=None, order=None, page_size=None
+):
+    """Export WHMCS invoices into a columnar table.
+
+    Args:
+        client_id (int): (Optional) ID of client whose invoices to export.
+        status (str): (Optional) Status of the invoices to export.
+        order (str): (Optional) Sort attribute. Accepted values are: asc, desc.
+        order_by (str): (Optional) Field to sort results by.
+        page_size (int): (Optional) Number of invoices to request per page.
+    Returns:
+        ColumnarTable: The invoices.
+    Raises:
+        WhmcsException: If an error occurs.
+    """
+
+    def build_parameters(limit_start, limit_num):
+        return prepare_get_invoices_request(
+            client_id, status, order_by, order, limit_start, limit_num
+        )
+
+    whmcs_invoices = whmcs.iter_pages(
+        build_parameters, "invoices", "invoice", "Unable to fetch invoices", page_size
+    )
+    return ColumnarTable(INVOICE_COLUMNS).extend(whmcs_invoices)
+
+
+def export_orders(client_id=None, status=None, page_size=None):
+    """Export WHMCS orders into a columnar table.
+
+    Args:
+        client_id (int): (Optional) ID of client whose orders to export.
+        status (str): (Optional) Status of the orders to export.
+        page_size (int): (Optional) Number of orders to request per page.
+    Returns:
+        ColumnarTable: The orders.
+    Raises:
+        WhmcsException: If an error occurs.
+    """
+
+    def build_parameters(limit_start, limit_num):
+        return prepare_get_orders_request(
+            client_id, None, status, limit_start, limit_num
+        )
+
+    whmcs_orders = whmcs.iter_pages(
+        build_parameters, "orders", "order", "Unable to fetch orders", page_size
+    )
+    return ColumnarTable(ORDER_COLUMNS).extend(whmcs_orders)
+
+
+def export_client_products(client_id, page_size=None):
+    """Export a client's WHMCS services into a columnar table.
+
+    Args:
+        client_id (int): ID of the client whose services to export.
+        page_size (int): (Optional) Number of services to request per page.
+    Returns:
+        ColumnarTable: The services.
+    Raises:
+        WhmcsException: If an error occurs.
+    """
+
+    def build_parameters(limit_start, limit_num):
+        return get_client_product_request_parameters(
+            client_id, limit_start=limit_start, limit_num=limit_num
+        )
+
+    whmcs_products = whmcs.iter_pages(
+        build_parameters,
+        "products",
+        "product",
+        "Unable to fetch your products",
+        page_size,
+    )
+    return ColumnarTable(CLIENT_PRODUCT_COLUMNS).extend(whmcs_products)
@@ -0,0 +1,96 @@
+"""This module contains the pluggable JSON decoders for whmcs responses.
+
+The fastest installed backend is used unless ``WHMCS_JSON_BACKEND`` names
+one, in order of preference orjson, ujson and the standard library json.
+Every backend decodes the raw bytes of the response, so no intermediate
+text copy is made.
+"""
+
+import json
+import threading
+
+from django.conf import settings
+
+PREFERRED_BACKENDS = ("orjson", "ujson", "json")
+# Backends decoding a memoryview in place, the others are given a copy.
+BUFFER_BACKENDS = frozenset({"orjson"})
+
+_decoders = {}
+_decoders_lock = threading.Lock()
+
+
+def load_backend(name):
+    """
+    Import the ``loads`` function of a JSON backend.
+    :param name: String, name of the backend. One of orjson, ujson or json.
+    :return: The function decoding bytes, None if the backend is not installed.
+    :rtype: Callable or None
+    """
+    if name == "json":
+        return json.loads
+    if name not in PREFERRED_BACKENDS:
+        raise ValueError(f"Unknown JSON backend {name}")
+    try:
+        module = __import__(name)
+    except ImportError:
+        return None
+    return module.loads
+
+
+def get_decoder(name=None):
+    """
+    Retrieve the function decoding whmcs responses.
+    :param name: String, optional. Backend to use instead of the one
+        configured by ``WHMCS_JSON_BACKEND``.
+    :return: The name of the backend and its function decoding bytes.
+    :rtype: Tuple
+    """
+    name = name or getattr(settings, "WHMCS_JSON_BACKEND", None)
+    decoder = _decoders.get(name)
+    if decoder is not None:
+        return decoder
+    with _decoders_lock:
+        if name:
+            loads = load_backend(name)
+            if loads is None:
+                raise ImportError(f"The {name} JSON backend is not installed")
+            decoder = name, loads
+        else:
+            decoder = next(
+                (backend, loads)
+                for backend, loads in (
+                    (backend, load_backend(backend)) for backend in PREFERRED_BACKENDS
+                )
+                if loads is not None
+            )
+        _decoders[name] = decoder
+    return decoder
+
+
+def loads(data):
+    """
+    Decode a JSON document with the configured backend.
+
+    Documents a fast backend rejects, eg because of a byte order mark, are
+    decoded again with the standard library so behaviour never regresses.
+    :param data: Bytes, or a memoryview eg of a memory mapped file, the JSON
+        document. Memoryviews are only copied for backends that cannot
+        decode them in place.
+    :return: The decoded document.
+    :raises ValueError: If the document is not valid JSON.
+    """
+    name, decode = get_decoder()
+    if isinstance(data, memoryview) and name not in BUFFER_BACKENDS:
+        data = bytes(data)
+    try:
+        return decode(data)
+    except ValueError:
+        if name == "json":
+            raise
+        return json.loads(bytes(data))
+
+
+def reset_decoders():
+    """Discard the resolved decoders so the settings are read again."""
+    with _decoders_lock:
+        _decoders.clear()
@@ -0,0 +1,450 @@
+"""This module contains the metrics and tracing hooks of the whmcs calls.
+
+The network layer and the caches report what they do through the hooks in
+this module, which forward it to the registered exporters. Nothing is
+measured while no exporter is registered, so the hooks cost a single check.
+
+Exporters are registered with :func:`add_exporter`, or listed by dotted path
+in the ``WHMCS_METRICS_EXPORTERS`` setting, and receive:
+
+- ``whmcs_request_duration_seconds``: latency of every http attempt, tagged
+  with the action and status.
+- ``whmcs_call_duration_seconds``: latency of every call including retries,
+  tagged with the action and outcome.
+- ``whmcs_request_bytes_sent`` and ``whmcs_request_bytes_received``, the
+  size of the decoded response body.
+- ``whmcs_response_bytes_saved``, the bytes compression kept off the wire,
+  tagged with the action and encoding.
+- ``whmcs_retries_total``, tagged with the status of the failed attempt.
+- ``whmcs_errors_total``, tagged with whether whmcs returned an error or
+  could not be reached.
+- ``whmcs_cache_requests_total``, tagged with the cache and whether it hit.
+"""
+
+import random
+import socket
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+REQUEST_DURATION = "whmcs_request_duration_seconds"
+CALL_DURATION = "whmcs_call_duration_seconds"
+BYTES_SENT = "whmcs_request_bytes_sent"
+BYTES_RECEIVED = "whmcs_request_bytes_received"
+BYTES_SAVED = "whmcs_response_bytes_saved"
+RETRIES = "whmcs_retries_total"
+ERRORS = "whmcs_errors_total"
+CACHE_REQUESTS = "whmcs_cache_requests_total"
+
+HISTOGRAMS = frozenset({REQUEST_DURATION, CALL_DURATION})
+
+DEFAULT_RESERVOIR_SIZE = 1024
+
+_exporters = None
+_exporters_lock = threading.Lock()
+
+
+def get_exporters():
+    """
+    Retrieve the registered exporters.
+
+    The exporters listed in ``WHMCS_METRICS_EXPORTERS`` are created on first
+    use.
+    :return: The exporters.
+    :rtype: Tuple
+    """
+    global _exporters
+    if _exporters is None:
+        with _exporters_lock:
+            if _exporters is None:
+                from django.utils.module_loading import import_string
+
+                _exporters = tuple(
+                    import_string(path)()
+                    for path in getattr(settings, "WHMCS_METRICS_EXPORTERS", ())
+                )
+    return _exporters
+
+
+def is_enabled():
+    """Check whether any exporter is registered."""
+    return bool(get_exporters())
+
+
+def add_exporter(exporter):
+    """Register an exporter, in addition to the configured ones."""
+    global _exporters
+    exporters = get_exporters()
+    with _exporters_lock:
+        _exporters = exporters + (exporter,)
+    return exporter
+
+
+def remove_exporter(exporter):
+    """Stop sending metrics to an exporter."""
+    global _exporters
+    exporters = get_exporters()
+    with _exporters_lock:
+        _exporters = tuple(other for other in exporters if other is not exporter)
+
+
+def reset_exporters():
+    """Discard the exporters so they are created again from the settings."""
+    global _exporters
+    with _exporters_lock:
+        _exporters = None
+
+
+def observe(name, value, **tags):
+    """Record a measurement, eg a duration, in the histogram ``name``."""
+    for exporter in get_exporters():
+        exporter.observe(name, value, tags)
+
+
+def increment(name, value=1, **tags):
+    """Add ``value`` to the counter ``name``."""
+    for exporter in get_exporters():
+        exporter.increment(name, value, tags)
+
+
+#########
+# HOOKS #
+#########
+
+
+def record_request(action, started_at, response=None, error=None):
+    """
+    Record one http attempt to whmcs.
+    :param action: String, the whmcs action.
+    :param started_at: Float, ``time.monotonic()`` when the attempt started.
+    :param response: The requests or httpx response, None if the attempt failed.
+    :param error: Exception, optional. Why the attempt failed.
+    """
+    duration = time.monotonic() - started_at
+    status = str(response.status_code) if response is not None else "error"
+    bytes_saved = get_bytes_saved(response) if response is not None else 0
+    for exporter in get_exporters():
+        exporter.observe(REQUEST_DURATION, duration, {"action": action, "status": status})
+        if response is not None:
+            exporter.increment(
+                BYTES_SENT, get_request_size(response.request), {"action": action}
+            )
+            exporter.increment(
+                BYTES_RECEIVED, get_response_size(response), {"action": action}
+            )
+        if bytes_saved:
+            exporter.increment(
+                BYTES_SAVED,
+                bytes_saved,
+                {"action": action, "encoding": response.headers["Content-Encoding"]},
+            )
+        trace = getattr(exporter, "trace", None)
+        if trace is not None:
+            trace(action, duration, status, error)
+
+
+def record_call(action, started_at, outcome):
+    """
+    Record a whmcs call, including its retries.
+    :param action: String, the whmcs action.
+    :param started_at: Float, ``time.monotonic()`` when the call started.
+    :param outcome: String, success, whmcs if whmcs returned an error or
+        connection if whmcs could not be reached.
+    """
+    observe(CALL_DURATION, time.monotonic() - started_at, action=action, outcome=outcome)
+    if outcome != "success":
+        increment(ERRORS, action=action, reason=outcome)
+
+
+def record_retry(action, status_code=None):
+    """Record that a failed attempt is sent again."""
+    increment(RETRIES, action=action, status=str(status_code or "error"))
+
+
+def record_cache_request(cache, action, hit):
+    """Record a lookup in one of the caches."""
+    increment(CACHE_REQUESTS, cache=cache, action=action, result="hit" if hit else "miss")
+
+
+def get_response_size(response):
+    """Retrieve the size of a response body without reading a streamed body."""
+    content = getattr(response, "_content", None)
+    if isinstance(content, bytes):
+        return len(content)
+    try:
+        return int(response.headers.get("Content-Length", 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def get_bytes_saved(response):
+    """
+    Retrieve the bytes compression saved on a response whose body was read.
+    :param response: The requests or httpx response.
+    :return: The decoded body size less the bytes received from the socket,
+        0 if the response is not compressed or its body was not read.
+    :rtype: Integer
+    """
+    content = getattr(response, "_content", None)
+    if not isinstance(content, bytes) or not response.headers.get("Content-Encoding"):
+        return 0
+    raw = getattr(response, "raw", None)
+    if raw is not None:
+        try:
+            wire_size = raw.tell()
+        except (AttributeError, OSError):
+            return 0
+    else:
+        wire_size = getattr(response, "num_bytes_downloaded", 0)
+    return max(0, len(content) - wire_size) if wire_size else 0
+
+
+def get_request_size(request):
+    """Retrieve the size of the encoded body of a requests or httpx request."""
+    body = getattr(request, "body", None)
+    if body is None:
+        body = getattr(request, "content", None)
+    return len(body) if isinstance(body, (bytes, str)) else 0
+
+
+#############
+# EXPORTERS #
+#############
+
+
+class CallbackExporter:
+    """Passes every measurement to a function.
+
+    The function is called with the kind of metric (histogram or counter),
+    its name, its value and its tags.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def observe(self, name, value, tags):
+        self.callback("histogram", name, value, tags)
+
+    def increment(self, name, value, tags):
+        self.callback("counter", name, value, tags)
+
+
+class Reservoir:
+    """Uniform sample of a bounded number of values, see Vitter's algorithm R.
+
+    The count and the maximum cover every value, the percentiles are those
+    of the sample.
+    """
+
+    def __init__(self, size=DEFAULT_RESERVOIR_SIZE):
+        self.size = size
+        self.count = 0
+        self.max = None
+        self.values = []
+
+    def add(self, value):
+        self.count += 1
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self.values) < self.size:
+            self.values.append(value)
+            return
+        index = random.randrange(self.count)
+        if index < self.size:
+            self.values[index] = value
+
+
+class SummaryExporter:
+    """Aggregates the metrics in memory, eg to find the slowest actions."""
+
+    def __init__(self, reservoir_size=DEFAULT_RESERVOIR_SIZE):
+        """Create the exporter.
+
+        Args:
+            reservoir_size (int): Optional. Number of latencies kept per
+                action to compute the percentiles from.
+        """
+        self._lock = threading.Lock()
+        self._histograms = defaultdict(lambda: Reservoir(reservoir_size))
+        self._counters = defaultdict(float)
+
+    def observe(self, name, value, tags):
+        with self._lock:
+            self._histograms[(name, tags.get("action"))].add(value)
+
+    def increment(self, name, value, tags):
+        key = (name, tags.get("action"), tags.get("result") or tags.get("reason"))
+        with self._lock:
+            self._counters[key] += value
+
+    def get_summary(self):
+        """
+        Summarize the metrics of each action.
+        :return: Per action, the number of calls, latency percentiles in
+            seconds, bytes transferred and saved by compression, retries,
+            errors and cache hit ratio.
+        :rtype: Dictionary
+        """
+        with self._lock:
+            histograms = {
+                key: (reservoir.count, reservoir.max, sorted(reservoir.values))
+                for key, reservoir in self._histograms.items()
+            }
+            counters = dict(self._counters)
+        summary = defaultdict(dict)
+        for (name, action), (count, maximum, values) in histograms.items():
+            if name == CALL_DURATION:
+                summary[action].update(
+                    calls=count,
+                    p50=get_percentile(values, 50),
+                    p99=get_percentile(values, 99),
+                    max=maximum,
+                )
+        totals = defaultdict(float)
+        for (name, action, label), value in counters.items():
+            totals[(name, action)] += value
+            if name == CACHE_REQUESTS and label == "hit":
+                totals[(name + "_hit", action)] += value
+        for (name, action), value in totals.items():
+            if name == BYTES_SENT:
+                summary[action]["bytes_sent"] = value
+            elif name == BYTES_RECEIVED:
+                summary[action]["bytes_received"] = value
+            elif name == BYTES_SAVED:
+                summary[action]["bytes_saved"] = value
+            elif name == RETRIES:
+                summary[action]["retries"] = value
+            elif name == ERRORS:
+                summary[action]["errors"] = value
+            elif name == CACHE_REQUESTS:
+                hits = totals.get((CACHE_REQUESTS + "_hit", action), 0)
+                summary[action]["cache_hit_ratio"] = hits / value if value else 0
+        return dict(summary)
+
+
+def get_percentile(sorted_values, percentile):
+    """Retrieve a percentile of sorted values, by the nearest rank."""
+    index = max(0, -(-len(sorted_values) * percentile // 100) - 1)
+    return sorted_values[int(index)]
+
+
+class PrometheusExporter:
+    """Exports the metrics with ``prometheus_client``."""
+
+    def __init__(self, registry=None, buckets=None):
+        """Create the exporter.
+
+        Args:
+            registry: Optional. The prometheus_client registry to register
+                the metrics in, the default registry otherwise.
+            buckets (tuple): Optional. Upper bounds of the latency buckets.
+        """
+        import prometheus_client
+
+        self.prometheus_client = prometheus_client
+        self.registry = registry or prometheus_client.REGISTRY
+        self.buckets = buckets or prometheus_client.Histogram.DEFAULT_BUCKETS
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def get_metric(self, name, tags):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    if name in HISTOGRAMS:
+                        metric = self.prometheus_client.Histogram(
+                            name,
+                            name.replace("_", " "),
+                            sorted(tags),
+                            registry=self.registry,
+                            buckets=self.buckets,
+                        )
+                    else:
+                        metric = self.prometheus_client.Counter(
+                            name.replace("_total", ""),
+                            name.replace("_", " "),
+                            sorted(tags),
+                            registry=self.registry,
+                        )
+                    self._metrics[name] = metric
+        return metric.labels(**tags)
+
+    def observe(self, name, value, tags):
+        self.get_metric(name, tags).observe(value)
+
+    def increment(self, name, value, tags):
+        self.get_metric(name, tags).inc(value)
+
+
+class StatsdExporter:
+    """Sends the metrics to a StatsD server over UDP.
+
+    Tags are appended in the DogStatsD format, which plain StatsD servers
+    ignore.
+    """
+
+    def __init__(self, host="localhost", port=8125, prefix="olittwhmcs"):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, name, value, kind, tags):
+        tags = ",".join(f"{key}:{value}" for key, value in tags.items())
+        line = f"{self.prefix}.{name}:{value}|{kind}" + (f"|#{tags}" if tags else "")
+        try:
+            self.socket.sendto(line.encode(), self.address)
+        except OSError:
+            pass
+
+    def observe(self, name, value, tags):
+        self.send(name, round(value * 1000, 3), "ms", tags)
+
+    def increment(self, name, value, tags):
+        self.send(name, value, "c", tags)
+
+
+class OpenTelemetryExporter:
+    """Exports the metrics and a span per http attempt with OpenTelemetry."""
+
+    def __init__(self, tracer=None, meter=None):
+        from opentelemetry import metrics, trace
+
+        self.tracer = tracer or trace.get_tracer("olittwhmcs")
+        self.meter = meter or metrics.get_meter("olittwhmcs")
+        self.status_codes = trace.StatusCode
+        self._instruments = {}
+        self._lock = threading.Lock()
+
+    def get_instrument(self, name):
+        instrument = self._instruments.get(name)
+        if instrument is None:
+            with self._lock:
+                instrument = self._instruments.get(name)
+                if instrument is None:
+                    if name in HISTOGRAMS:
+                        instrument = self.meter.create_histogram(name, unit="s")
+                    else:
+                        instrument = self.meter.create_counter(name)
+                    self._instruments[name] = instrument
+        return instrument
+
+    def observe(self, name, value, tags):
+        self.get_instrument(name).record(value, attributes=tags)
+
+    def increment(self, name, value, tags):
+        self.get_instrument(name).add(value, attributes=tags)
+
+    def trace(self, action, duration, status, error):
+        end_time = time.time_ns()
+        span = self.tracer.start_span(
+            f"whmcs {action}",
+            start_time=end_time - int(duration * 1e9),
+            attributes={"whmcs.action": action or "", "http.status_code": status},
+        )
+        if error is not None:
+            span.record_exception(error)
+            span.set_status(self.status_codes.ERROR)
+        span.end(end_time=end_time)
@@ -1,6 +1,5 @@
 """Whmcs models."""
-import re
-from datetime import datetime
+from olittwhmcs.parsing import parse_amount, parse_date
 
 
 class Client:
@@ -56,12 +55,12 @@ class Product:
         pricing_object = whmcs_pricing.get(currency.upper(), default_pricing_object)
         return {
             'prefix': pricing_object.get('prefix'),
-            'monthly': float(pricing_object.get('monthly')),
-            'quarterly': float(pricing_object.get('quarterly')),
-            'semiannually': float(pricing_object.get('semiannually')),
-            'annually': float(pricing_object.get('annually')),
-            'biennially': float(pricing_object.get('biennially')),
-            'triennially': float(pricing_object.get('triennially')),
+            'monthly': parse_amount(pricing_object.get('monthly')),
+            'quarterly': parse_amount(pricing_object.get('quarterly')),
+            'semiannually': parse_amount(pricing_object.get('semiannually')),
+            'annually': parse_amount(pricing_object.get('annually')),
+            'biennially': parse_amount(pricing_object.get('biennially')),
+            'triennially': parse_amount(pricing_object.get('triennially')),
         }
 
 
@@ -98,10 +97,7 @@ class ClientProduct:
 
 def get_date_object(date: str, date_format: str):
     """ Convert a string into a date object. """
-    try:
-        return datetime.strptime(date, date_format)
-    except ValueError:
-        return None
+    return parse_date(date, date_format)
 
 
 class ProductUpgrade:
@@ -170,7 +166,6 @@ class Order:
 
     @staticmethod
     def get_order_items(whmcs_order_item):
-        amount = whmcs_order_item.get('amount')
         return {
             'order_type': whmcs_order_item.get('type'),
             'rel_id': whmcs_order_item.get('relid'),
@@ -178,7 +173,7 @@ class Order:
             'product_type': whmcs_order_item.get('producttype'),
             'domain': whmcs_order_item.get('domain'),
             'billing_cycle': whmcs_order_item.get('billingcycle'),
-            'amount': float(re.compile(r'\d+(?:\.\d+)?').findall(amount)[0]),
+            'amount': parse_amount(whmcs_order_item.get('amount')),
             'status': whmcs_order_item.get('status')
         }
 
@@ -205,14 +200,14 @@ class Invoice:
             whmcs_invoice.get('last_capture_attempt'),
             '%Y-%m-%d %H:%M:%S')
 
-        self.sub_total = float(whmcs_invoice.get('subtotal'))
-        self.total = float(whmcs_invoice.get('total'))
-        self.credit = float(whmcs_invoice.get('credit'))
+        self.sub_total = parse_amount(whmcs_invoice.get('subtotal'))
+        self.total = parse_amount(whmcs_invoice.get('total'))
+        self.credit = parse_amount(whmcs_invoice.get('credit'))
 
-        self.tax = float(whmcs_invoice.get('tax'))
-        self.tax2 = float(whmcs_invoice.get('tax2'))
-        self.tax_rate = float(whmcs_invoice.get('taxrate'))
-        self.tax_rate_2 = float(whmcs_invoice.get('taxrate2'))
+        self.tax = parse_amount(whmcs_invoice.get('tax'))
+        self.tax2 = parse_amount(whmcs_invoice.get('tax2'))
+        self.tax_rate = parse_amount(whmcs_invoice.get('taxrate'))
+        self.tax_rate_2 = parse_amount(whmcs_invoice.get('taxrate2'))
 
         self.status = whmcs_invoice.get('status')
         self.payment_method = whmcs_invoice.get('paymentmethod')
@@ -1,61 +1,625 @@
 """This module contains the functions that make networks requests to whmcs."""
 
+import os
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from importlib.util import find_spec
+
 import requests
 from django.conf import settings
-from requests.exceptions import RequestException
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectTimeout, RequestException
+
+from olittwhmcs import deadlines, jsonbackends, metrics, serializer
+from olittwhmcs.actions import is_read_action
+from olittwhmcs.circuitbreaker import (
+    DEFAULT_FAILURE_THRESHOLD,
+    DEFAULT_HALF_OPEN_CALLS,
+    DEFAULT_RECOVERY_TIMEOUT,
+    CircuitBreakerRegistry,
+)
+from olittwhmcs.exceptions import WhmcsConnectionError, WhmcsTimeoutError
+from olittwhmcs.ratelimit import (
+    AdaptiveConcurrencyLimiter,
+    SharedRateLimiter,
+    TokenBucket,
+)
+from olittwhmcs.retry import (
+    DEFAULT_BASE_DELAY,
+    DEFAULT_DEADLINE,
+    DEFAULT_MAX_ATTEMPTS,
+    DEFAULT_MAX_DELAY,
+    RetryPolicy,
+)
+from olittwhmcs.router import (
+    DEFAULT_ENDPOINT_FAILURE_THRESHOLD,
+    DEFAULT_PROBE_INTERVAL,
+    Router,
+    parse_endpoints,
+)
+from olittwhmcs.singleflight import SingleFlight, get_request_key
+
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
 
-from olittwhmcs.exceptions import WhmcsConnectionError
+_limiters = None
+_limiters_lock = threading.Lock()
+
+_circuit_breakers = None
+_circuit_breakers_lock = threading.Lock()
+
+_router = None
+_router_pid = None
+_router_lock = threading.Lock()
+
+_single_flight = SingleFlight()
 
 
 def get_whmcs_response(parameters):
     """
     Make requests to whmcs and retrieve the response or error.
+
+    Identical read requests made concurrently share a single request to whmcs
+    and its response, unless ``WHMCS_COALESCE_READS`` is False. Waiting for
+    a shared request is bounded by the deadline of the call. A shared request
+    cut short by the deadline of the caller that made it is made again by
+    the callers that still have time.
     :param parameters: (Dictionary) the request payload
     :return: whmcs response if request completed successfully otherwise an error message
     :rtype: Dictionary or String or None
     """
+    if not is_read_action(parameters.get("action")) or not getattr(
+        settings, "WHMCS_COALESCE_READS", True
+    ):
+        return fetch_whmcs_response(parameters)
+    key = get_request_key(parameters)
+    while True:
+        made_request = []
+
+        def fetch():
+            made_request.append(True)
+            return fetch_whmcs_response(parameters)
+
+        try:
+            result = _single_flight.do(key, fetch, deadlines.get_remaining())
+        except (FutureTimeoutError, WhmcsTimeoutError):
+            return False, deadlines.DEADLINE_EXCEEDED
+        if made_request or result != (False, deadlines.DEADLINE_EXCEEDED):
+            return result
+
+
+def fetch_whmcs_response(parameters):
+    """
+    Request whmcs and retrieve the response or error.
+    :param parameters: (Dictionary) the request payload
+    :return: whmcs response if request completed successfully otherwise an error message
+    :rtype: Dictionary or String or None
+    """
+    started_at = time.monotonic()
+    outcome = "whmcs"
     try:
         response = make_whmcs_network_request(parameters)
         response_data = get_response_data(response)
-        result = response_data.get("result")
+        result = response_data.get("result") if response_data else None
         if response.ok and result == "success":
+            outcome = "success"
             return True, response_data
         error = get_error_message(response_data)
     except WhmcsConnectionError as e:
+        outcome = "connection"
         error = e.message
+    finally:
+        if metrics.is_enabled():
+            metrics.record_call(parameters.get("action"), started_at, outcome)
     return False, error
 
 
-def make_whmcs_network_request(parameters):
+def make_whmcs_network_request(parameters, stream=False):
     """
-    Make a network request to WHMCS.
+    Make a network request to WHMCS, retrying failures the retry policy allows.
+
+    Requests fail fast while the circuit breaker of the endpoint or action
+    is open. The endpoint is chosen by the router when ``WHMCS_ENDPOINTS``
+    is configured.
     :param parameters: Dictionary, payload to send to whmcs
+    :param stream: Boolean, leave the body unread so it can be consumed in
+        chunks. The caller must then close the response.
     :return: :class:`Response <Response>` object
     :rtype: requests.Response
     :raises WhmcsConnectionError: If the network request fails.
+    :raises WhmcsTimeoutError: If the deadline of the call passes.
+    """
+    action = parameters.get("action")
+    url = get_api_url(action)
+    circuit_breakers = get_circuit_breakers()
+    if not circuit_breakers.allow(url, action):
+        raise WhmcsConnectionError("Whmcs server is unavailable.")
+    succeeded = None
+    try:
+        response = send_whmcs_request_with_retries(url, parameters, stream)
+        succeeded = not is_overloaded_response(response)
+        return response
+    except RequestException:
+        # Running out of time is not a failure of the whmcs server.
+        if deadlines.has_expired():
+            raise WhmcsTimeoutError(deadlines.DEADLINE_EXCEEDED)
+        succeeded = False
+        raise WhmcsConnectionError("Could not reach whmcs server.")
+    finally:
+        if succeeded is None:
+            # Timed out or interrupted, give back a half open probe so the
+            # breaker keeps letting the next request through.
+            circuit_breakers.cancel(url, action)
+        elif succeeded:
+            circuit_breakers.record_success(url, action)
+        else:
+            circuit_breakers.record_failure(url, action)
+
+
+def send_whmcs_request_with_retries(url, parameters, stream=False):
+    """
+    Send a request to WHMCS, retrying failures the retry policy allows.
+
+    Retries stop at the retry deadline or at the deadline of the call,
+    whichever comes first.
+    :param url: String, url of the whmcs api.
+    :param parameters: Dictionary, payload to send to whmcs
+    :param stream: Boolean, leave the body of the response unread.
+    :return: :class:`Response <Response>` object
+    :rtype: requests.Response
+    :raises RequestException: If the last attempt fails.
+    :raises WhmcsTimeoutError: If the deadline of the call has passed.
+    """
+    action = parameters.get("action")
+    policy = get_retry_policy()
+    deadline = time.monotonic() + policy.deadline
+    if deadlines.get_expiry() is not None:
+        deadline = min(deadline, deadlines.get_expiry())
+    attempt = 0
+    while True:
+        attempt += 1
+        response = error = None
+        try:
+            response = send_whmcs_request(url, parameters, stream)
+        except RequestException as e:
+            error = e
+        if error is None and not is_overloaded_response(response):
+            return response
+        status_code = response.status_code if response is not None else None
+        sent = not isinstance(error, ConnectTimeout)
+        if not policy.should_retry(action, attempt, status_code, sent):
+            break
+        delay = policy.get_delay(attempt)
+        if time.monotonic() + delay >= deadline:
+            break
+        if response is not None:
+            response.close()
+        if metrics.is_enabled():
+            metrics.record_retry(action, status_code)
+        time.sleep(delay)
+    if error is not None:
+        raise error
+    return response
+
+
+def send_whmcs_request(url, parameters, stream=False):
+    """
+    Send a single request to WHMCS, waiting for the configured limiters.
+    :param url: String, url of the whmcs api.
+    :param parameters: Dictionary, payload to send to whmcs
+    :param stream: Boolean, leave the body of the response unread.
+    :return: :class:`Response <Response>` object
+    :rtype: requests.Response
+    :raises RequestException: If the network request fails.
+    :raises WhmcsTimeoutError: If the limiters do not let the request through
+        before the deadline.
+    """
+    rate_limiter, concurrency_limiter = get_limiters()
+    if rate_limiter and not rate_limiter.acquire(deadlines.get_remaining()):
+        raise WhmcsTimeoutError(deadlines.DEADLINE_EXCEEDED)
+    if concurrency_limiter and not concurrency_limiter.acquire(
+        deadlines.get_remaining()
+    ):
+        raise WhmcsTimeoutError(deadlines.DEADLINE_EXCEEDED)
+    started_at = time.monotonic()
+    response = error = None
+    try:
+        response = get_session().post(
+            url=url,
+            data=parameters,
+            timeout=get_timeouts(parameters.get("action")),
+            stream=stream,
+        )
+        return response
+    except RequestException as e:
+        error = e
+        raise
+    finally:
+        record_attempt(
+            url, concurrency_limiter, time.monotonic() - started_at, response, error
+        )
+        if metrics.is_enabled():
+            metrics.record_request(
+                parameters.get("action"), started_at, response, error
+            )
+
+
+def record_attempt(url, concurrency_limiter, duration, response, error=None):
+    """
+    Feed the outcome of a request to the concurrency limiter and the router.
+
+    A request abandoned at the deadline of its caller, or interrupted, says
+    nothing about the health of whmcs. It only gives back its slot of the
+    concurrency limiter, like the circuit breaker gives back its probe.
+    :param url: String, url of the whmcs api the request was sent to.
+    :param concurrency_limiter: AdaptiveConcurrencyLimiter or None.
+    :param duration: Float, seconds the request took.
+    :param response: The response, None if the request failed.
+    :param error: Exception, optional. The network error the request failed
+        with.
+    """
+    if response is None and (error is None or deadlines.has_expired()):
+        if concurrency_limiter:
+            concurrency_limiter.cancel()
+        return
+    failed = response is None or is_overloaded_response(response)
+    if concurrency_limiter:
+        concurrency_limiter.release(duration, failed)
+    router = get_router()
+    if router is not None:
+        router.record(url, duration, not failed)
+
+
+def is_overloaded_response(response):
+    """
+    Check whether a response shows that whmcs is struggling with the load.
+    :param response: requests.Response, the network response.
+    :return: True if whmcs failed or throttled the request.
+    :rtype: Boolean
     """
-    url = (
+    return response.status_code == 429 or response.status_code >= 500
+
+
+def get_limiters():
+    """
+    Retrieve the limiters that pace requests to whmcs.
+
+    ``WHMCS_RATE_LIMIT`` sets the maximum number of requests per second,
+    with bursts of up to ``WHMCS_RATE_LIMIT_BURST`` requests. The limit is
+    shared by all processes through the Django cache when
+    ``WHMCS_RATE_LIMIT_SHARED`` is True. ``WHMCS_ADAPTIVE_CONCURRENCY``
+    enables the adaptive concurrency limiter, bounded by
+    ``WHMCS_MAX_CONCURRENCY`` and aiming for ``WHMCS_LATENCY_TARGET``
+    seconds per request.
+    :return: The rate limiter and concurrency limiter, None when disabled.
+    :rtype: Tuple
+    """
+    global _limiters
+    if _limiters is None:
+        with _limiters_lock:
+            if _limiters is None:
+                _limiters = create_rate_limiter(), create_concurrency_limiter()
+    return _limiters
+
+
+def create_rate_limiter():
+    """Create the rate limiter configured in the settings."""
+    rate = getattr(settings, "WHMCS_RATE_LIMIT", None)
+    if not rate:
+        return None
+    if getattr(settings, "WHMCS_RATE_LIMIT_SHARED", False):
+        from django.core.cache import cache
+
+        return SharedRateLimiter(rate, cache)
+    return TokenBucket(rate, getattr(settings, "WHMCS_RATE_LIMIT_BURST", None))
+
+
+def create_concurrency_limiter():
+    """Create the adaptive concurrency limiter configured in the settings."""
+    if not getattr(settings, "WHMCS_ADAPTIVE_CONCURRENCY", False):
+        return None
+    return AdaptiveConcurrencyLimiter(
+        max_limit=getattr(settings, "WHMCS_MAX_CONCURRENCY", DEFAULT_POOL_MAXSIZE),
+        latency_target=getattr(settings, "WHMCS_LATENCY_TARGET", 1.0),
+    )
+
+
+def get_circuit_breakers():
+    """
+    Retrieve the circuit breakers guarding the whmcs endpoint.
+
+    Configured with the ``WHMCS_CIRCUIT_BREAKER_THRESHOLD``,
+    ``WHMCS_CIRCUIT_BREAKER_RECOVERY_TIMEOUT`` and
+    ``WHMCS_CIRCUIT_BREAKER_HALF_OPEN_CALLS`` settings.
+    :return: The circuit breakers of this process.
+    :rtype: CircuitBreakerRegistry
+    """
+    global _circuit_breakers
+    if _circuit_breakers is None:
+        with _circuit_breakers_lock:
+            if _circuit_breakers is None:
+                _circuit_breakers = CircuitBreakerRegistry(
+                    failure_threshold=getattr(
+                        settings,
+                        "WHMCS_CIRCUIT_BREAKER_THRESHOLD",
+                        DEFAULT_FAILURE_THRESHOLD,
+                    ),
+                    recovery_timeout=getattr(
+                        settings,
+                        "WHMCS_CIRCUIT_BREAKER_RECOVERY_TIMEOUT",
+                        DEFAULT_RECOVERY_TIMEOUT,
+                    ),
+                    half_open_calls=getattr(
+                        settings,
+                        "WHMCS_CIRCUIT_BREAKER_HALF_OPEN_CALLS",
+                        DEFAULT_HALF_OPEN_CALLS,
+                    ),
+                )
+    return _circuit_breakers
+
+
+def get_circuit_breaker_states():
+    """
+    Retrieve the state of every circuit breaker, eg for a health endpoint.
+    :return: A dictionary per breaker with its endpoint, action, state,
+        consecutive failures and seconds since it opened.
+    :rtype: List
+    """
+    return get_circuit_breakers().get_states()
+
+
+def reset_circuit_breakers():
+    """Discard the circuit breakers, closing them all."""
+    global _circuit_breakers
+    with _circuit_breakers_lock:
+        _circuit_breakers = None
+
+
+def get_retry_policy():
+    """
+    Retrieve the policy for retrying failed requests.
+
+    Configured with the ``WHMCS_RETRY_ATTEMPTS``, ``WHMCS_RETRY_BASE_DELAY``,
+    ``WHMCS_RETRY_MAX_DELAY`` and ``WHMCS_RETRY_DEADLINE`` settings. Mutating
+    actions listed in ``WHMCS_IDEMPOTENT_ACTIONS`` are retried like reads.
+    :return: The retry policy.
+    :rtype: RetryPolicy
+    """
+    return RetryPolicy(
+        max_attempts=getattr(settings, "WHMCS_RETRY_ATTEMPTS", DEFAULT_MAX_ATTEMPTS),
+        base_delay=getattr(settings, "WHMCS_RETRY_BASE_DELAY", DEFAULT_BASE_DELAY),
+        max_delay=getattr(settings, "WHMCS_RETRY_MAX_DELAY", DEFAULT_MAX_DELAY),
+        deadline=getattr(settings, "WHMCS_RETRY_DEADLINE", DEFAULT_DEADLINE),
+        idempotent_actions=getattr(settings, "WHMCS_IDEMPOTENT_ACTIONS", ()),
+    )
+
+
+def reset_limiters():
+    """Discard the limiters so they are created again from the settings."""
+    global _limiters
+    with _limiters_lock:
+        _limiters = None
+
+
+def get_api_url(action=None):
+    """
+    Retrieve the url of the whmcs api endpoint.
+
+    With ``WHMCS_ENDPOINTS`` configured, the router picks the endpoint for
+    the action, see :func:`get_router`.
+    :param action: String, optional. The whmcs action to send.
+    :return: The whmcs api url.
+    :rtype: String
+    """
+    router = get_router()
+    if router is not None:
+        return router.get_url(action)
+    return (
         f"{settings.WHMCS_BASE_URL}/includes/api.php"
         if settings.WHMCS_BASE_URL
         else "https://www.olitt.com/billing/includes/api.php"
     )
+
+
+def get_router():
+    """
+    Retrieve the router spreading requests over the ``WHMCS_ENDPOINTS``.
+
+    ``WHMCS_ENDPOINTS`` lists the base urls of write endpoints, or
+    dictionaries with the ``url`` and ``role`` (read or write) of each
+    endpoint. Reads go to the fastest healthy endpoint, writes to the first
+    healthy write endpoint. Endpoints are probed every
+    ``WHMCS_HEALTH_CHECK_INTERVAL`` seconds and are skipped after a failed
+    probe or ``WHMCS_ENDPOINT_FAILURE_THRESHOLD`` failed requests in a row.
+    A new router is created in
+    forked child processes, whose probe thread did not survive the fork.
+    :return: The router of this process, None without ``WHMCS_ENDPOINTS``.
+    :rtype: Router or None
+    """
+    global _router, _router_pid
+    endpoints = getattr(settings, "WHMCS_ENDPOINTS", None)
+    if not endpoints:
+        return None
+    pid = os.getpid()
+    if _router is not None and _router_pid == pid:
+        return _router
+    with _router_lock:
+        if _router is None or _router_pid != pid:
+            _router = Router(
+                parse_endpoints(endpoints),
+                circuit_breakers=get_circuit_breakers(),
+                probe=probe_endpoint,
+                probe_interval=getattr(
+                    settings, "WHMCS_HEALTH_CHECK_INTERVAL", DEFAULT_PROBE_INTERVAL
+                ),
+                failure_threshold=getattr(
+                    settings,
+                    "WHMCS_ENDPOINT_FAILURE_THRESHOLD",
+                    DEFAULT_ENDPOINT_FAILURE_THRESHOLD,
+                ),
+            )
+            _router_pid = pid
+        return _router
+
+
+def reset_router():
+    """Discard the router so it is created again from the settings."""
+    global _router
+    with _router_lock:
+        if _router is not None:
+            _router.stop()
+        _router = None
+
+
+def probe_endpoint(url):
+    """
+    Check that a whmcs endpoint answers api requests.
+
+    Sends the cheap WhmcsDetails action. Any response short of a server
+    error or throttling counts as healthy.
+    :param url: String, url of the whmcs api.
+    :return: Whether the endpoint is healthy.
+    :rtype: Boolean
+    """
     try:
-        return requests.post(url=url, data=parameters)
+        response = get_session().post(
+            url, data=serializer.get_template("WhmcsDetails"), timeout=get_timeouts()
+        )
     except RequestException:
-        raise WhmcsConnectionError("Could not reach whmcs server.")
+        return False
+    return not is_overloaded_response(response)
+
+
+def get_session():
+    """
+    Retrieve the process-wide session used to talk to whmcs.
+
+    The session keeps connections to whmcs alive between requests. A new
+    session is created in forked child processes so that pooled sockets are
+    never shared across processes.
+    :return: The shared session for the current process.
+    :rtype: requests.Session
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is not None and _session_pid == pid:
+        return _session
+    with _session_lock:
+        if _session is None or _session_pid != pid:
+            _session = create_session()
+            _session_pid = pid
+        return _session
+
+
+def create_session():
+    """
+    Create a session with a keep-alive connection pool mounted for http(s).
+
+    The pool can be sized with the ``WHMCS_POOL_CONNECTIONS`` (number of hosts
+    to keep pools for) and ``WHMCS_POOL_MAXSIZE`` (connections per host)
+    settings.
+    :return: A new session.
+    :rtype: requests.Session
+    """
+    adapter = HTTPAdapter(
+        pool_connections=getattr(
+            settings, "WHMCS_POOL_CONNECTIONS", DEFAULT_POOL_CONNECTIONS
+        ),
+        pool_maxsize=getattr(settings, "WHMCS_POOL_MAXSIZE", DEFAULT_POOL_MAXSIZE),
+    )
+    session = requests.Session()
+    session.headers["Accept-Encoding"] = get_accept_encoding()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_accept_encoding():
+    """
+    Retrieve the response encodings to advertise to whmcs.
+
+    Gzip and deflate are always supported, brotli and zstd when the brotli
+    (or brotlicffi) and zstandard packages are installed, see the
+    ``compression`` extra. Responses are decoded transparently, also while
+    streamed. Can be overridden with the ``WHMCS_ACCEPT_ENCODING`` setting,
+    eg "identity" to disable compression.
+    :return: The value of the Accept-Encoding header.
+    :rtype: String
+    """
+    accept_encoding = getattr(settings, "WHMCS_ACCEPT_ENCODING", None)
+    if accept_encoding:
+        return accept_encoding
+    encodings = ["gzip", "deflate"]
+    if find_spec("brotli") or find_spec("brotlicffi"):
+        encodings.append("br")
+    if find_spec("zstandard"):
+        encodings.append("zstd")
+    return ", ".join(encodings)
+
+
+def close_session():
+    """Close the shared session and release its pooled connections."""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _session_pid = None
+
+
+def get_timeouts(action=None):
+    """
+    Retrieve the connect and read timeouts for whmcs requests.
+
+    Configured with the ``WHMCS_CONNECT_TIMEOUT`` and ``WHMCS_READ_TIMEOUT``
+    settings, in seconds, and overridden per action by
+    ``WHMCS_ACTION_TIMEOUTS``, eg ``{"GetInvoices": (5, 120), "GetProducts": 60}``
+    where a single number sets the read timeout. Both timeouts are shortened
+    to the time left before the deadline of the call.
+    :param action: String, optional. The whmcs action of the request.
+    :return: The connect and read timeouts.
+    :rtype: Tuple
+    :raises WhmcsTimeoutError: If the deadline of the call has passed.
+    """
+    connect_timeout = getattr(
+        settings, "WHMCS_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT
+    )
+    read_timeout = getattr(settings, "WHMCS_READ_TIMEOUT", DEFAULT_READ_TIMEOUT)
+    action_timeouts = getattr(settings, "WHMCS_ACTION_TIMEOUTS", {}).get(action)
+    if isinstance(action_timeouts, (tuple, list)):
+        connect_timeout, read_timeout = action_timeouts
+    elif action_timeouts is not None:
+        read_timeout = action_timeouts
+    remaining = deadlines.get_remaining()
+    if remaining is not None:
+        connect_timeout = min(connect_timeout, remaining)
+        read_timeout = min(read_timeout, remaining)
+    return connect_timeout, read_timeout
 
 
 def get_response_data(response):
     """
     Get data from a network response.
+
+    The raw bytes of the body are decoded with the configured JSON backend.
+    Bodies that are not a JSON object, eg a list or null returned by a
+    misbehaving proxy, are treated as undecodable.
     :param response: requests.Response, the network response.
     :return: Data from the response if able to deserialize the response.
     :rtype: Dictionary or None
     """
     try:
-        return response.json()
+        response_data = jsonbackends.loads(response.content)
     except ValueError:
         return None
+    return response_data if isinstance(response_data, dict) else None
 
 
 def get_error_message(response_data):
@@ -0,0 +1,77 @@
+"""This module contains fast parsers for whmcs dates and amounts."""
+
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+DATE_FORMAT = "%Y-%m-%d"
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Matches the amount in formatted whmcs prices such as "KSh1,200.00KES".
+AMOUNT_PATTERN = re.compile(r"-?\d[\d,]*(?:\.\d+)?")
+
+
+@lru_cache(maxsize=4096)
+def parse_date(value, date_format=DATETIME_FORMAT):
+    """
+    Convert a whmcs date or date time string into a datetime.
+
+    ``YYYY-MM-DD`` and ``YYYY-MM-DD HH:MM:SS`` values are sliced directly
+    instead of going through ``strptime``, other formats fall back to it.
+    Results are memoized since exports repeat the same dates many times.
+    :param value: String, the date returned by whmcs.
+    :param date_format: String, format of the value if it is not one of the
+        whmcs formats.
+    :return: The date, None for empty values and the 0000-00-00 sentinel.
+    :rtype: datetime or None
+    """
+    if not value or value.startswith("0000-00-00"):
+        return None
+    try:
+        if len(value) == 10 and value[4] == "-" and value[7] == "-":
+            return datetime(int(value[:4]), int(value[5:7]), int(value[8:10]))
+        if len(value) == 19 and value[10] == " " and value[13] == ":":
+            return datetime(
+                int(value[:4]),
+                int(value[5:7]),
+                int(value[8:10]),
+                int(value[11:13]),
+                int(value[14:16]),
+                int(value[17:19]),
+            )
+        return datetime.strptime(value, date_format)
+    except ValueError:
+        return None
+
+
+def parse_money(value):
+    """
+    Convert a whmcs amount into a Decimal.
+    :param value: String, a plain or formatted amount. Eg 10.00, KSh1,200.00KES
+    :return: The amount, None if the value holds no amount.
+    :rtype: Decimal or None
+    """
+    if value is None:
+        return None
+    try:
+        return Decimal(value)
+    except (InvalidOperation, TypeError, ValueError):
+        match = AMOUNT_PATTERN.search(str(value))
+        return Decimal(match.group().replace(",", "")) if match else None
+
+
+def parse_amount(value):
+    """
+    Convert a whmcs amount into a float.
+    :param value: String, a plain or formatted amount. Eg 10.00, KSh1,200.00KES
+    :return: The amount, None if the value holds no amount.
+    :rtype: float or None
+    """
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        match = AMOUNT_PATTERN.search(str(value))
+        return float(match.group().replace(",", "")) if match else None
@@ -0,0 +1,280 @@
+"""This module contains the rate limiters used to pace requests to whmcs.
+
+Every limiter can be waited for from threads with ``acquire`` and from
+coroutines with ``acquire_async``, which never blocks the event loop: it
+sleeps with asyncio and talks to the Django cache from a worker thread.
+Both take an optional timeout and return False, without taking a slot, when
+the wait would exceed it.
+"""
+
+import asyncio
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+
+# Seconds between checks of a full concurrency limit from a coroutine.
+ASYNC_POLL_INTERVAL = 0.005
+
+
+class TokenBucket:
+    """Thread safe token bucket.
+
+    Tokens are added at ``rate`` per second up to ``capacity``. Each request
+    takes one token and waits for it if the bucket is empty.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """Create a full bucket.
+
+        Args:
+            rate (float): Tokens added per second.
+            capacity (int): Optional. Maximum number of tokens, ie the largest
+                burst allowed. Defaults to one second worth of tokens.
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token.
+
+        Returns:
+            float: Seconds to wait before the token may be used.
+        """
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated_at
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def cancel(self):
+        """Give back a token taken with :meth:`reserve` but not used."""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+    def acquire(self, timeout=None):
+        """Take a token, sleeping until it is available.
+
+        Args:
+            timeout (float): Optional. Maximum seconds to wait.
+        Returns:
+            bool: False if the token would not be available in time.
+        """
+        delay = self.reserve()
+        if timeout is not None and delay > timeout:
+            self.cancel()
+            return False
+        if delay:
+            time.sleep(delay)
+        return True
+
+    async def acquire_async(self, timeout=None):
+        """Take a token, awaiting until it is available. See :meth:`acquire`."""
+        delay = self.reserve()
+        if timeout is not None and delay > timeout:
+            self.cancel()
+            return False
+        if delay:
+            await asyncio.sleep(delay)
+        return True
+
+
+class SharedRateLimiter:
+    """Rate limiter shared by every process using the same Django cache.
+
+    Requests are counted in one second windows stored in the cache. Once a
+    window is full, requests wait for the next one.
+    """
+
+    def __init__(self, rate, cache, key_prefix="whmcs_rate_limit"):
+        """Create the limiter.
+
+        Args:
+            rate (int): Maximum number of requests per second.
+            cache: Django cache backend holding the counters.
+            key_prefix (str): Optional. Prefix of the counter cache keys.
+        """
+        self.rate = rate
+        self.cache = cache
+        self.key_prefix = key_prefix
+
+    def reserve(self):
+        """Count a request in the current window.
+
+        Returns:
+            float: 0 if the request may be sent, otherwise the seconds to
+                wait before trying again in the next window.
+        """
+        while True:
+            now = time.time()
+            window = int(now)
+            key = f"{self.key_prefix}_{window}"
+            self.cache.add(key, 0, timeout=2)
+            try:
+                count = self.cache.incr(key)
+            except ValueError:
+                # The counter expired between add and incr.
+                continue
+            if count <= self.rate:
+                return 0.0
+            return window + 1 - now
+
+    def acquire(self, timeout=None):
+        """Count a request, sleeping until a window has room for it.
+
+        Args:
+            timeout (float): Optional. Maximum seconds to wait.
+        Returns:
+            bool: False if no window has room in time.
+        """
+        expires_at = None if timeout is None else time.monotonic() + timeout
+        while True:
+            delay = self.reserve()
+            if not delay:
+                return True
+            if expires_at is not None and time.monotonic() + delay > expires_at:
+                return False
+            time.sleep(delay)
+
+    async def acquire_async(self, timeout=None):
+        """Count a request, awaiting a window with room. See :meth:`acquire`.
+
+        The cache is called from a worker thread, off the event loop.
+        """
+        reserve = sync_to_async(self.reserve, thread_sensitive=False)
+        expires_at = None if timeout is None else time.monotonic() + timeout
+        while True:
+            delay = await reserve()
+            if not delay:
+                return True
+            if expires_at is not None and time.monotonic() + delay > expires_at:
+                return False
+            await asyncio.sleep(delay)
+
+
+class AdaptiveConcurrencyLimiter:
+    """Concurrency limit tuned from the observed latency and error rate.
+
+    The limit grows additively while requests succeed within the latency
+    target and is cut multiplicatively when a request fails or is slow
+    (AIMD), so the number of requests in flight follows what the server
+    can sustain.
+    """
+
+    def __init__(
+        self,
+        initial_limit=4,
+        min_limit=1,
+        max_limit=64,
+        latency_target=1.0,
+        backoff_ratio=0.5,
+    ):
+        """Create the limiter.
+
+        Args:
+            initial_limit (int): Optional. Concurrency limit to start with.
+            min_limit (int): Optional. Lowest concurrency limit.
+            max_limit (int): Optional. Highest concurrency limit.
+            latency_target (float): Optional. Seconds above which a request is
+                considered slow.
+            backoff_ratio (float): Optional. Factor the limit is multiplied by
+                when a request fails or is slow.
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff_ratio = backoff_ratio
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._backed_off_at = 0.0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        """The current concurrency limit."""
+        return max(self.min_limit, int(self._limit))
+
+    @property
+    def in_flight(self):
+        """The number of requests in flight."""
+        return self._in_flight
+
+    def try_acquire(self):
+        """Count a request in flight if the limit allows it, without waiting.
+
+        Returns:
+            bool: Whether the request may be sent.
+        """
+        with self._condition:
+            if self._in_flight >= self.limit:
+                return False
+            self._in_flight += 1
+            return True
+
+    def acquire(self, timeout=None):
+        """Wait until a request may be sent.
+
+        Args:
+            timeout (float): Optional. Maximum seconds to wait.
+        Returns:
+            bool: False if no request slot freed up in time.
+        """
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: self._in_flight < self.limit, timeout
+            ):
+                return False
+            self._in_flight += 1
+            return True
+
+    async def acquire_async(self, timeout=None):
+        """Await until a request may be sent. See :meth:`acquire`.
+
+        The limit is shared with threads, so a full limit is polled rather
+        than waited on.
+        """
+        expires_at = None if timeout is None else time.monotonic() + timeout
+        while not self.try_acquire():
+            if expires_at is not None and time.monotonic() >= expires_at:
+                return False
+            await asyncio.sleep(ASYNC_POLL_INTERVAL)
+        return True
+
+    def cancel(self):
+        """Give back a request slot without adjusting the limit.
+
+        Used for requests abandoned at the deadline of their caller, which
+        say nothing about the load of the server.
+        """
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def release(self, latency, failed=False):
+        """Record the outcome of a request and adjust the limit.
+
+        Args:
+            latency (float): Seconds the request took.
+            failed (bool): Optional. Whether the server failed the request.
+        """
+        with self._condition:
+            self._in_flight -= 1
+            if failed or latency > self.latency_target:
+                # Requests in flight together see the same overload, back off
+                # once for all of them.
+                now = time.monotonic()
+                if now - self._backed_off_at >= self.latency_target:
+                    self._limit = max(
+                        self.min_limit, self._limit * self.backoff_ratio
+                    )
+                    self._backed_off_at = now
+            else:
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            self._condition.notify_all()
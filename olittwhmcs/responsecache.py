@@ -0,0 +1,409 @@
+"""This module contains the read-through cache of whmcs read responses.
+
+Responses are kept in an in-process LRU in front of the Django cache. Every
+cache key embeds the generation of the client the response belongs to, so a
+write to a client invalidates its responses by bumping the generation.
+Generations are themselves kept in process for a second, so a hit in the
+LRU does not cost a round trip to the Django cache, and a write made by
+another process is seen at most that long after.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from olittwhmcs import metrics
+from olittwhmcs.singleflight import get_request_key
+
+DEFAULT_TTLS = {
+    "GetClientsDetails": 60,
+    "GetClientsProducts": 60,
+}
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_GENERATION_TTL = 1
+GENERATION_TIMEOUT = 24 * 60 * 60
+KEY_PREFIX = "whmcs_response"
+
+
+class LRUCache:
+    """Thread safe in-process cache evicting the least recently used entry."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        """Create an empty cache holding up to ``max_entries`` entries."""
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Retrieve an entry, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        """Store an entry for ``timeout`` seconds."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Remove an entry, if it is cached."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._entries.clear()
+
+
+class ResponseCache:
+    """Two tier cache of successful whmcs read responses."""
+
+    def __init__(
+        self,
+        backend=None,
+        ttls=None,
+        max_entries=DEFAULT_MAX_ENTRIES,
+        generation_ttl=DEFAULT_GENERATION_TTL,
+    ):
+        """Create the cache.
+
+        Args:
+            backend: Optional. Shared Django cache backend.
+            ttls (dict): Optional. Seconds each action's responses are cached
+                for. Actions that are not listed are not cached.
+            max_entries (int): Optional. Size of the in-process tier.
+            generation_ttl (float): Optional. Seconds generations read from
+                the backend are kept in process.
+        """
+        self.backend = backend if backend is not None else cache
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.local = LRUCache(max_entries)
+        self.generations = LRUCache(max_entries)
+        self.generation_ttl = generation_ttl
+
+    def is_cacheable(self, parameters):
+        """Check whether the responses of a request are cached."""
+        return parameters.get("action") in self.ttls
+
+    def get_response(self, parameters, fetch_response):
+        """Retrieve a response from the cache or from whmcs.
+
+        Args:
+            parameters (dict): Payload of the request.
+            fetch_response (callable): Requests whmcs, returns a tuple of
+                whether the request succeeded and the response or error.
+        Returns:
+            tuple: Whether the request succeeded and the response or error.
+        """
+        if not self.is_cacheable(parameters):
+            return fetch_response(parameters)
+        key, response = self.get_cached_response(parameters)
+        if response is not None:
+            return True, response
+        is_successful, response_or_error = fetch_response(parameters)
+        if is_successful and response_or_error:
+            self.set_response(key, parameters, response_or_error)
+        return is_successful, response_or_error
+
+    async def get_response_async(self, parameters, fetch_response):
+        """Retrieve a response from the cache or from whmcs, in a coroutine.
+
+        See :meth:`get_response`. The Django cache is called from a worker
+        thread, off the event loop.
+
+        Args:
+            parameters (dict): Payload of the request.
+            fetch_response (callable): Coroutine function requesting whmcs.
+        Returns:
+            tuple: Whether the request succeeded and the response or error.
+        """
+        if not self.is_cacheable(parameters):
+            return await fetch_response(parameters)
+        key, response = await sync_to_async(
+            self.get_cached_response, thread_sensitive=False
+        )(parameters)
+        if response is not None:
+            return True, response
+        is_successful, response_or_error = await fetch_response(parameters)
+        if is_successful and response_or_error:
+            await sync_to_async(self.set_response, thread_sensitive=False)(
+                key, parameters, response_or_error
+            )
+        return is_successful, response_or_error
+
+    def get_cached_response(self, parameters):
+        """Look a request up in both tiers.
+
+        Returns:
+            tuple: The cache key of the request and its cached response, None
+                on a miss.
+        """
+        key = self.get_key(parameters)
+        response = self.local.get(key)
+        if response is None:
+            response = self.backend.get(key)
+            if response is not None:
+                self.local.set(key, response, self.ttls[parameters["action"]])
+        if metrics.is_enabled():
+            metrics.record_cache_request(
+                "response", parameters["action"], response is not None
+            )
+        return key, response
+
+    def set_response(self, key, parameters, response):
+        """Store a response in both tiers."""
+        timeout = self.ttls[parameters["action"]]
+        self.local.set(key, response, timeout)
+        self.backend.set(key, response, timeout)
+        client_id = parameters.get("clientid")
+        if parameters["action"] == "GetClientsDetails":
+            self.set_client_email(
+                client_id or get_client_id(response),
+                parameters.get("email") or get_client_email(response),
+            )
+        if client_id and parameters["action"] == "GetClientsProducts":
+            products = get_client_products(response)
+            self.backend.set_many(
+                {
+                    self.get_service_key(product.get("id")): client_id
+                    for product in products
+                },
+                GENERATION_TIMEOUT,
+            )
+
+    def set_client_email(self, client_id, email):
+        """Remember the email of a client, to invalidate its responses by both.
+
+        Details looked up by email are cached under the generation of the
+        email, which a write identifying the client by id must bump too.
+        """
+        if client_id and email:
+            self.backend.set_many(
+                {
+                    self.get_client_email_key(client_id): email,
+                    self.get_email_client_key(email): client_id,
+                },
+                GENERATION_TIMEOUT,
+            )
+
+    def get_generations(self, keys):
+        """Retrieve generations, from the process when read recently."""
+        generations = {key: self.generations.get(key) for key in keys}
+        missing = [key for key, generation in generations.items() if generation is None]
+        if missing:
+            fetched = self.backend.get_many(missing)
+            for key in missing:
+                generations[key] = fetched.get(key, 0)
+                self.generations.set(key, generations[key], self.generation_ttl)
+        return generations
+
+    def get_key(self, parameters):
+        """Build the cache key of a request.
+
+        The key embeds the global generation and the generation of the
+        client, or client email, the request is scoped to.
+        """
+        scope = get_scope(parameters)
+        generations = self.get_generations([self.get_generation_key(None), scope])
+        digest = hashlib.sha1(get_request_key(parameters).encode()).hexdigest()
+        return ":".join(
+            [
+                KEY_PREFIX,
+                parameters["action"],
+                str(generations.get(self.get_generation_key(None), 0)),
+                str(generations.get(scope, 0)),
+                digest,
+            ]
+        )
+
+    def invalidate_client(self, client_id=None, email=None):
+        """Invalidate the responses of a client, by id or email.
+
+        Responses scoped to the other identifier of the client are
+        invalidated too, once a details response has linked the two.
+        """
+        if client_id and not email:
+            email = self.backend.get(self.get_client_email_key(client_id))
+        elif email and not client_id:
+            client_id = self.backend.get(self.get_email_client_key(email))
+        if client_id:
+            self.bump_generation(self.get_generation_key(f"client:{client_id}"))
+        if email:
+            self.bump_generation(self.get_generation_key(f"email:{email}"))
+
+    def invalidate_service(self, service_id):
+        """Invalidate the responses of the client owning a service.
+
+        Everything is invalidated if the owner of the service is unknown.
+        """
+        client_id = self.backend.get(self.get_service_key(service_id))
+        if client_id:
+            self.invalidate_client(client_id)
+        else:
+            self.invalidate_all()
+
+    def invalidate_all(self):
+        """Invalidate every cached response."""
+        self.bump_generation(self.get_generation_key(None))
+        self.local.clear()
+
+    def bump_generation(self, key):
+        """Move a generation forward, orphaning the keys built from it."""
+        self.backend.add(key, 0, GENERATION_TIMEOUT)
+        try:
+            self.backend.incr(key)
+        except ValueError:
+            self.backend.set(key, 1, GENERATION_TIMEOUT)
+        self.generations.delete(key)
+
+    @staticmethod
+    def get_generation_key(scope):
+        return f"{KEY_PREFIX}_generation:{scope or 'all'}"
+
+    @staticmethod
+    def get_service_key(service_id):
+        return f"{KEY_PREFIX}_service:{service_id}"
+
+    @staticmethod
+    def get_client_email_key(client_id):
+        return f"{KEY_PREFIX}_client_email:{client_id}"
+
+    @staticmethod
+    def get_email_client_key(email):
+        return f"{KEY_PREFIX}_email_client:{email}"
+
+
+def get_scope(parameters):
+    """Retrieve the generation key of the client a request is scoped to."""
+    if parameters.get("clientid"):
+        return ResponseCache.get_generation_key(f"client:{parameters['clientid']}")
+    if parameters.get("email"):
+        return ResponseCache.get_generation_key(f"email:{parameters['email']}")
+    return ResponseCache.get_generation_key(None)
+
+
+def get_client_products(response):
+    """Retrieve the products listed in a GetClientsProducts response."""
+    try:
+        return response.get("products").get("product") or []
+    except AttributeError:
+        return []
+
+
+def get_client_id(response):
+    """Retrieve the client id of a GetClientsDetails response."""
+    client = response.get("client") or {}
+    return response.get("userid") or client.get("id")
+
+
+def get_client_email(response):
+    """Retrieve the email of a GetClientsDetails response."""
+    client = response.get("client") or {}
+    return response.get("email") or client.get("email")
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Retrieve the response cache configured in the settings.
+
+    The cache is enabled by the ``WHMCS_RESPONSE_CACHE`` setting. The seconds
+    each action is cached for are set by ``WHMCS_RESPONSE_CACHE_TTLS`` and
+    the size of the in-process tier by ``WHMCS_RESPONSE_CACHE_MAX_ENTRIES``.
+    ``WHMCS_RESPONSE_CACHE_GENERATION_TTL`` bounds how long an invalidation
+    made by another process can go unnoticed.
+    :return: The response cache, None if it is disabled.
+    :rtype: ResponseCache
+    """
+    global _response_cache
+    if not getattr(settings, "WHMCS_RESPONSE_CACHE", False):
+        return None
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache(
+                    ttls={
+                        **DEFAULT_TTLS,
+                        **getattr(settings, "WHMCS_RESPONSE_CACHE_TTLS", {}),
+                    },
+                    max_entries=getattr(
+                        settings,
+                        "WHMCS_RESPONSE_CACHE_MAX_ENTRIES",
+                        DEFAULT_MAX_ENTRIES,
+                    ),
+                    generation_ttl=getattr(
+                        settings,
+                        "WHMCS_RESPONSE_CACHE_GENERATION_TTL",
+                        DEFAULT_GENERATION_TTL,
+                    ),
+                )
+    return _response_cache
+
+
+def get_cached_whmcs_response(parameters, fetch_response):
+    """
+    Retrieve a whmcs response through the response cache, if it is enabled.
+    :param parameters: Dictionary, payload of the request.
+    :param fetch_response: Callable requesting whmcs when the cache misses.
+    :return: Whether the request succeeded and the response or error.
+    :rtype: Tuple
+    """
+    response_cache = get_response_cache()
+    if response_cache is None:
+        return fetch_response(parameters)
+    return response_cache.get_response(parameters, fetch_response)
+
+
+async def get_cached_whmcs_response_async(parameters, fetch_response):
+    """
+    Retrieve a whmcs response through the response cache, in a coroutine.
+    :param parameters: Dictionary, payload of the request.
+    :param fetch_response: Coroutine function requesting whmcs when the cache
+        misses.
+    :return: Whether the request succeeded and the response or error.
+    :rtype: Tuple
+    """
+    response_cache = get_response_cache()
+    if response_cache is None:
+        return await fetch_response(parameters)
+    return await response_cache.get_response_async(parameters, fetch_response)
+
+
+def invalidate_client(client_id=None, email=None):
+    """Invalidate the cached responses of a client, by id or email."""
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        response_cache.invalidate_client(client_id, email)
+
+
+def invalidate_service(service_id):
+    """Invalidate the cached responses of the client owning a service."""
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        response_cache.invalidate_service(service_id)
+
+
+def invalidate_all():
+    """Invalidate every cached response."""
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        response_cache.invalidate_all()
@@ -0,0 +1,89 @@
+"""This module contains the policy for retrying failed whmcs requests."""
+
+import random
+
+from olittwhmcs.actions import is_read_action
+
+RETRYABLE_STATUS_CODES = frozenset({429, 502, 503, 504})
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BASE_DELAY = 0.2
+DEFAULT_MAX_DELAY = 5
+DEFAULT_DEADLINE = 30
+
+
+class RetryPolicy:
+    """Decides whether and when a failed whmcs request is sent again.
+
+    Read actions are retried after connection errors and transient server
+    errors. Other actions change data in whmcs, so they are only retried when
+    the connection could not be opened, ie the request never reached whmcs,
+    unless they are listed as idempotent.
+    """
+
+    def __init__(
+        self,
+        max_attempts=DEFAULT_MAX_ATTEMPTS,
+        base_delay=DEFAULT_BASE_DELAY,
+        max_delay=DEFAULT_MAX_DELAY,
+        deadline=DEFAULT_DEADLINE,
+        idempotent_actions=(),
+    ):
+        """Create the policy.
+
+        Args:
+            max_attempts (int): Optional. Maximum number of times a request
+                is sent.
+            base_delay (float): Optional. Seconds to wait before the first
+                retry, doubled on every further retry.
+            max_delay (float): Optional. Longest wait between two attempts.
+            deadline (float): Optional. Seconds after which a request is no
+                longer retried.
+            idempotent_actions (iterable): Optional. Mutating actions that are
+                safe to send again, eg because callers guard against
+                duplicates.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.idempotent_actions = frozenset(idempotent_actions)
+
+    def is_safe(self, action):
+        """Check whether an action can be sent again without side effects."""
+        return is_read_action(action) or action in self.idempotent_actions
+
+    def should_retry(self, action, attempt, status_code=None, sent=True):
+        """Check whether a failed attempt should be retried.
+
+        Args:
+            action (str): The whmcs action of the request.
+            attempt (int): Number of attempts made so far.
+            status_code (int): Optional. Status of the response, None if the
+                request failed without a response.
+            sent (bool): Optional. False if the request failed before it
+                reached whmcs, eg the connection could not be opened.
+        Returns:
+            bool: True if the request should be sent again.
+        """
+        if attempt >= self.max_attempts:
+            return False
+        if not sent:
+            return True
+        if not self.is_safe(action):
+            return False
+        return status_code is None or status_code in RETRYABLE_STATUS_CODES
+
+    def get_delay(self, attempt):
+        """Get the seconds to wait before an attempt.
+
+        Uses capped exponential backoff with full jitter so that clients
+        failing together do not retry together.
+
+        Args:
+            attempt (int): Number of attempts made so far.
+        Returns:
+            float: Seconds to wait.
+        """
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
@@ -0,0 +1,227 @@
+"""This module contains the router spreading whmcs requests over endpoints.
+
+Each endpoint is a whmcs base url with a role. Write endpoints serve every
+action, read endpoints, eg a node on a read replica, only serve actions
+registered as reads. Reads go to the healthy endpoint with the lowest
+latency, an exponentially weighted moving average of its recent requests
+and health probes, while writes stay on the first healthy write endpoint,
+the primary. Endpoints whose circuit breaker is open, whose last probe
+failed or whose last few requests all failed are skipped until they
+recover. A single failed request does not take an endpoint out of rotation.
+"""
+
+import threading
+import time
+
+from olittwhmcs.actions import is_read_action
+from olittwhmcs.circuitbreaker import OPEN
+
+READ = "read"
+WRITE = "write"
+
+DEFAULT_EWMA_WEIGHT = 0.2
+DEFAULT_PROBE_INTERVAL = 15
+DEFAULT_ENDPOINT_FAILURE_THRESHOLD = 3
+
+
+class Endpoint:
+    """A whmcs endpoint, its role and how it has been performing."""
+
+    def __init__(self, base_url, role=WRITE):
+        """Create an endpoint.
+
+        Args:
+            base_url (str): Url of the whmcs installation, without the api path.
+            role (str): Optional. write to serve every action, read to only
+                serve read actions.
+        """
+        if role not in (READ, WRITE):
+            raise ValueError(f"Unknown whmcs endpoint role {role}")
+        self.base_url = base_url.rstrip("/")
+        self.url = f"{self.base_url}/includes/api.php"
+        self.role = role
+        self.latency = None
+        self.healthy = True
+        self.failures = 0
+        self.checked_at = None
+
+    def record(
+        self,
+        duration,
+        ok,
+        weight=DEFAULT_EWMA_WEIGHT,
+        failure_threshold=DEFAULT_ENDPOINT_FAILURE_THRESHOLD,
+    ):
+        """Fold the duration and outcome of a request into the endpoint state.
+
+        Args:
+            duration (float): Seconds the request took.
+            ok (bool): Whether the endpoint answered without failing.
+            weight (float): Optional. Weight of the new duration in the
+                moving average.
+            failure_threshold (int): Optional. Consecutive failures after
+                which the endpoint is unhealthy.
+        """
+        latency = self.latency
+        self.latency = (
+            duration if latency is None else latency + weight * (duration - latency)
+        )
+        if ok:
+            self.failures = 0
+            self.healthy = True
+        else:
+            self.failures += 1
+            if self.failures >= failure_threshold:
+                self.healthy = False
+
+    def get_status(self):
+        """Retrieve the url, role, latency and health of the endpoint."""
+        return {
+            "url": self.url,
+            "role": self.role,
+            "latency": self.latency,
+            "healthy": self.healthy,
+        }
+
+
+def parse_endpoints(config):
+    """
+    Build the endpoints of the ``WHMCS_ENDPOINTS`` setting.
+    :param config: List, base urls of write endpoints, or dictionaries with
+        the ``url`` and ``role`` of each endpoint.
+    :return: The endpoints.
+    :rtype: List
+    :raises ValueError: If no write endpoint is configured.
+    """
+    endpoints = [
+        Endpoint(entry)
+        if isinstance(entry, str)
+        else Endpoint(entry["url"], entry.get("role", WRITE))
+        for entry in config
+    ]
+    if not any(endpoint.role == WRITE for endpoint in endpoints):
+        raise ValueError("WHMCS_ENDPOINTS needs at least one write endpoint")
+    return endpoints
+
+
+class Router:
+    """Picks the endpoint of every whmcs request."""
+
+    def __init__(
+        self,
+        endpoints,
+        circuit_breakers=None,
+        probe=None,
+        probe_interval=DEFAULT_PROBE_INTERVAL,
+        ewma_weight=DEFAULT_EWMA_WEIGHT,
+        failure_threshold=DEFAULT_ENDPOINT_FAILURE_THRESHOLD,
+    ):
+        """Create the router.
+
+        Args:
+            endpoints (list): The endpoints, see :func:`parse_endpoints`.
+            circuit_breakers (CircuitBreakerRegistry): Optional. Breakers of
+                the endpoints, endpoints with an open breaker are skipped.
+            probe (callable): Optional. Checks the health of an endpoint,
+                called with its api url, returns whether it is healthy.
+            probe_interval (float): Optional. Seconds between health probes.
+            ewma_weight (float): Optional. Weight of each new latency sample.
+            failure_threshold (int): Optional. Consecutive failed requests
+                after which an endpoint is skipped. A failed probe is enough.
+        """
+        self.endpoints = list(endpoints)
+        self.circuit_breakers = circuit_breakers
+        self.probe_endpoint = probe
+        self.probe_interval = probe_interval
+        self.ewma_weight = ewma_weight
+        self.failure_threshold = failure_threshold
+        self._by_url = {endpoint.url: endpoint for endpoint in self.endpoints}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._prober = None
+
+    def get_endpoint(self, action=None):
+        """Choose the endpoint to send an action to.
+
+        Args:
+            action (str): Optional. The whmcs action, writes when omitted.
+        Returns:
+            Endpoint: The lowest latency healthy endpoint for reads, the
+                primary for writes. Unhealthy endpoints are only chosen if
+                none of the candidates is healthy.
+        """
+        self.start_probing()
+        is_read = is_read_action(action)
+        candidates = [
+            endpoint
+            for endpoint in self.endpoints
+            if is_read or endpoint.role == WRITE
+        ]
+        healthy = [endpoint for endpoint in candidates if self.is_available(endpoint)]
+        candidates = healthy or candidates
+        if not is_read:
+            return candidates[0]
+        # Endpoints without samples yet are tried first to measure them.
+        return min(candidates, key=lambda endpoint: endpoint.latency or 0)
+
+    def get_url(self, action=None):
+        """Retrieve the api url to send an action to."""
+        return self.get_endpoint(action).url
+
+    def is_available(self, endpoint):
+        """Check whether an endpoint is healthy and its breaker is not open."""
+        if not endpoint.healthy:
+            return False
+        if self.circuit_breakers is None:
+            return True
+        return self.circuit_breakers.get(endpoint.url).state != OPEN
+
+    def record(self, url, duration, ok, failure_threshold=None):
+        """Record the duration and outcome of a request to an endpoint."""
+        endpoint = self._by_url.get(url)
+        if endpoint is not None:
+            with self._lock:
+                endpoint.record(
+                    duration,
+                    ok,
+                    self.ewma_weight,
+                    failure_threshold or self.failure_threshold,
+                )
+
+    def probe(self):
+        """Check the health and latency of every endpoint once."""
+        for endpoint in self.endpoints:
+            started_at = time.monotonic()
+            try:
+                ok = self.probe_endpoint(endpoint.url)
+            except Exception:
+                ok = False
+            self.record(endpoint.url, time.monotonic() - started_at, ok, 1)
+            endpoint.checked_at = time.monotonic()
+
+    def start_probing(self):
+        """Probe the endpoints in a background thread, if there is a choice."""
+        if self._prober is not None or self.probe_endpoint is None:
+            return
+        if len(self.endpoints) < 2:
+            return
+        with self._lock:
+            if self._prober is not None:
+                return
+            self._prober = threading.Thread(
+                target=self._probe_periodically, name="whmcs-router", daemon=True
+            )
+        self._prober.start()
+
+    def stop(self):
+        """Stop probing the endpoints."""
+        self._stopped.set()
+
+    def get_states(self):
+        """Retrieve the status of every endpoint, eg for a health endpoint."""
+        with self._lock:
+            return [endpoint.get_status() for endpoint in self.endpoints]
+
+    def _probe_periodically(self):
+        while not self._stopped.wait(self.probe_interval):
+            self.probe()
@@ -1,16 +1,128 @@
-"""This module contains functions for processing whmcs request payloads."""
+"""This module contains functions for processing whmcs request payloads.
+
+Credentials are read from the environment once and every action's static
+payload is built once into an immutable template, so building a request is
+a single merge. Call :func:`reload_credentials` after rotating the keys.
+"""
 
 import os
+import threading
+from types import MappingProxyType
+
+CREATE_CLIENT_FIELDS = MappingProxyType(
+    {
+        "first_name": "firstname",
+        "last_name": "lastname",
+        "email": "email",
+        "country": "country",
+        "state": "state",
+        "city": "city",
+        "postcode": "postcode",
+        "address": "address1",
+        "phone": "phonenumber",
+        "password": "password2",
+    }
+)
+UPDATE_CLIENT_FIELDS = MappingProxyType(
+    {**CREATE_CLIENT_FIELDS, "email": "clientemail"}
+)
+# Order arguments that are also sent under their whmcs name.
+ORDER_FIELD_ALIASES = MappingProxyType(
+    {"price": "priceoverride", "promo_code": "promocode", "affiliate_id": "affid"}
+)
+NAMESERVER_FIELDS = MappingProxyType(
+    {
+        "nameserver1": "ns1",
+        "nameserver2": "ns2",
+        "nameserver3": "ns3",
+        "nameserver4": "ns4",
+        "nameserver5": "ns5",
+        "domainid": "domainid",
+    }
+)
+
+_credentials = None
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def get_credentials():
+    """
+    Retrieve the credentials and response type sent with every request.
+
+    The environment is only read on first use and after
+    :func:`reload_credentials`.
+    :return: The credentials.
+    :rtype: MappingProxyType
+    """
+    global _credentials
+    credentials = _credentials
+    if credentials is None:
+        credentials = _credentials = MappingProxyType(
+            {
+                "identifier": os.environ.get("WHMCS_IDENTIFIER_KEY", ""),
+                "secret": os.environ.get("WHMCS_SECRET_KEY", ""),
+                "accesskey": os.environ.get("WHMCS_ACCESS_KEY", ""),
+                "responsetype": "json",
+            }
+        )
+    return credentials
+
+
+def reload_credentials():
+    """Read the credentials from the environment again, eg after rotating them."""
+    global _credentials
+    with _templates_lock:
+        _credentials = None
+        _templates.clear()
+
+
+def get_template(action):
+    """
+    Retrieve the static portion of an action's payload.
+    :param action: String, the whmcs action. Eg GetClientsDetails
+    :return: The credentials and the action.
+    :rtype: MappingProxyType
+    """
+    template = _templates.get(action)
+    if template is None:
+        with _templates_lock:
+            template = _templates[action] = MappingProxyType(
+                {**get_credentials(), "action": action}
+            )
+    return template
 
 
 def get_default_parameters():
     """Retrieve parameters required for all whmcs requests."""
-    return {
-        "identifier": os.environ.get("WHMCS_IDENTIFIER_KEY", ""),
-        "secret": os.environ.get("WHMCS_SECRET_KEY", ""),
-        "accesskey": os.environ.get("WHMCS_ACCESS_KEY", ""),
-        "responsetype": "json",
-    }
+    return dict(get_credentials())
+
+
+def get_action_parameters(action, **fields):
+    """
+    Build the payload of an action from its template in a single merge.
+    :param action: String, the whmcs action. Eg GetClientsDetails
+    :param fields: The fields of the request.
+    :return: A new payload that can be modified freely.
+    :rtype: Dictionary
+    """
+    return {**get_template(action), **fields}
+
+
+def add_pagination_parameters(parameters, limit_start=None, limit_num=None):
+    """
+    Add the paging window to a whmcs list request.
+    :param parameters: Dictionary, payload of the list request.
+    :param limit_start: Integer, offset of the first record to fetch.
+    :param limit_num: Integer, number of records to fetch.
+    :return: payload for the list request
+    :rtype: Dictionary
+    """
+    if limit_start is not None:
+        parameters.update({"limitstart": limit_start})
+    if limit_num is not None:
+        parameters.update({"limitnum": limit_num})
+    return parameters
 
 
 def create_user_request_parameters(**kwargs):
@@ -20,30 +132,14 @@ def create_user_request_parameters(**kwargs):
     :return: payload for the create user request
     :rtype: Dictionary
     """
-    parameters = get_default_parameters()
-    parameters.update({"action": "AddClient"})
-    for param, value in kwargs.items():
-        if param == "first_name":
-            parameters.update({"firstname": value})
-        if param == "last_name":
-            parameters.update({"lastname": value})
-        if param == "email":
-            parameters.update({"email": value})
-        if param == "country":
-            parameters.update({"country": value})
-        if param == "state":
-            parameters.update({"state": value})
-        if param == "city":
-            parameters.update({"city": value})
-        if param == "postcode":
-            parameters.update({"postcode": value})
-        if param == "address":
-            parameters.update({"address1": value})
-        if param == "phone":
-            parameters.update({"phonenumber": value})
-        if param == "password":
-            parameters.update({"password2": value})
-    return parameters
+    return get_action_parameters(
+        "AddClient",
+        **{
+            CREATE_CLIENT_FIELDS[param]: value
+            for param, value in kwargs.items()
+            if param in CREATE_CLIENT_FIELDS
+        },
+    )
 
 
 def get_client_request_parameters(email=None, client_id=None):
@@ -55,8 +151,7 @@ def get_client_request_parameters(email=None, client_id=None):
     Returns:
       Dictionary, parameters for the get client details request.
     """
-    parameters = get_default_parameters()
-    parameters.update({"action": "GetClientsDetails"})
+    parameters = get_action_parameters("GetClientsDetails")
     if email:
         parameters.update({"email": email})
     if client_id:
@@ -71,23 +166,10 @@ def update_client_request_parameters(**kwargs):
     :return: payload for the update client request
     :rtype: Dictionary
     """
-    parameters = get_default_parameters()
-    parameters.update({"action": "UpdateClient"})
-    param_map = {
-        "first_name": "firstname",
-        "last_name": "lastname",
-        "email": "clientemail",
-        "country": "country",
-        "state": "state",
-        "city": "city",
-        "postcode": "postcode",
-        "address": "address1",
-        "phone": "phonenumber",
-        "password": "password2",
-    }
-    for param, value in kwargs.items():
-        parameters.update({param_map[param]: value})
-    return parameters
+    return get_action_parameters(
+        "UpdateClient",
+        **{UPDATE_CLIENT_FIELDS[param]: value for param, value in kwargs.items()},
+    )
 
 
 def get_product_request_parameters(group_id=None, module=None, product_ids=None):
@@ -99,8 +181,7 @@ def get_product_request_parameters(group_id=None, module=None, product_ids=None)
     :return: payload for the get products request
     :rtype: Dictionary
     """
-    parameters = get_default_parameters()
-    parameters.update({"action": "GetProducts"})
+    parameters = get_action_parameters("GetProducts")
     if group_id:
         parameters.update({"gid": group_id})
     if module:
@@ -111,7 +192,12 @@ def get_product_request_parameters(group_id=None, module=None, product_ids=None)
 
 
 def get_client_product_request_parameters(
-    client_id, product_id=None, service_id=None, domain=None
+    client_id,
+    product_id=None,
+    service_id=None,
+    domain=None,
+    limit_start=None,
+    limit_num=None,
 ):
     """
     Retrieve parameters for the client products request.
@@ -119,38 +205,32 @@ def get_client_product_request_parameters(
     :param product_id: Integer, specific product id to obtain the details for.
     :param service_id: Integer, specific service id to obtain the details for.
     :param domain: String, specific domain to obtain the service details for.
+    :param limit_start: Integer, offset of the first product to fetch.
+    :param limit_num: Integer, number of products to fetch.
     :return: payload for the get products request
     :rtype: Dictionary
     """
-    parameters = get_default_parameters()
-    parameters.update({"action": "GetClientsProducts", "clientid": str(client_id)})
+    parameters = get_action_parameters("GetClientsProducts", clientid=str(client_id))
     if product_id:
         parameters.update({"pid": product_id})
     if service_id:
         parameters.update({"serviceid": service_id})
     if domain:
         parameters.update({"domain": domain})
-    return parameters
+    return add_pagination_parameters(parameters, limit_start, limit_num)
 
 
 def order_request_parameters(client_id, payment_method, billing_cycle, **kwargs):
-    parameters = get_default_parameters()
-    parameters.update(
-        {
-            "action": "AddOrder",
-            "clientid": str(client_id),
-            "paymentmethod": payment_method,
-            "billingcycle": billing_cycle,
-        }
+    parameters = get_action_parameters(
+        "AddOrder",
+        clientid=str(client_id),
+        paymentmethod=payment_method,
+        billingcycle=billing_cycle,
     )
-    for param, value in kwargs.items():
-        parameters.update({param: value})
-        if param == "price":
-            parameters.update({"priceoverride": value})
-        if param == "promo_code":
-            parameters.update({"promocode": value})
-        if param == "affiliate_id":
-            parameters.update({"affid": value})
+    parameters.update(kwargs)
+    for param, field in ORDER_FIELD_ALIASES.items():
+        if param in kwargs:
+            parameters[field] = kwargs[param]
     return parameters
 
 
@@ -207,8 +287,7 @@ def order_bulk_products_request_parameters(parameters, **kwargs):
     :return: payload for the order product request
     :rtype: Dictionary
     """
-    default_parameters = get_default_parameters()
-    parameters.update(default_parameters)
+    parameters.update(get_credentials())
     return parameters
 
 
@@ -219,9 +298,7 @@ def get_domain_nameservers_request_parameter(domain_id):
     :return: payload for geting domain nameservers request
     :rtype: Dictionary
     """
-    parameters = get_default_parameters()
-    parameters.update({"action": "DomainGetNameservers", "domainid": str(domain_id)})
-    return parameters
+    return get_action_parameters("DomainGetNameservers", domainid=str(domain_id))
 
 
 def update_domain_nameservers_request_parameter(parameters):
@@ -231,23 +308,10 @@ def update_domain_nameservers_request_parameter(parameters):
     :return: payload for updating domain nameservers request
     :rtype: Dictionary
     """
-    updated_parameters = get_default_parameters()
-    updated_parameters.update(
-        {
-            "action": "DomainUpdateNameservers",
-        }
+    return get_action_parameters(
+        "DomainUpdateNameservers",
+        **{NAMESERVER_FIELDS[param]: value for param, value in parameters.items()},
     )
-    param_map = {
-        "nameserver1": "ns1",
-        "nameserver2": "ns2",
-        "nameserver3": "ns3",
-        "nameserver4": "ns4",
-        "nameserver5": "ns5",
-        "domainid": "domainid",
-    }
-    for param, value in parameters.items():
-        updated_parameters.update({param_map[param]: value})
-    return updated_parameters
 
 
 def upgrade_product_request_parameters(
@@ -264,13 +328,8 @@ def upgrade_product_request_parameters(
     Returns:
         Dictionary: Parameters for the upgrade product request
     """
-    parameters = get_default_parameters()
-    parameters.update(
-        {
-            "action": "UpdateClientProduct",
-            "serviceid": service_id,
-            "paymentmethod": payment_method,
-        }
+    parameters = get_action_parameters(
+        "UpdateClientProduct", serviceid=service_id, paymentmethod=payment_method
     )
     if billing_cycle:
         parameters.update({"billingcycle": billing_cycle})
@@ -293,14 +352,11 @@ def get_upgrade_product_parameters(
     promo_code=None,
 ):
     """Retrieve parameters for the upgrade product request."""
-    parameters = get_default_parameters()
-    parameters.update(
-        {
-            "action": "UpgradeProduct",
-            "serviceid": service_id,
-            "paymentmethod": payment_method,
-            "type": upgrade_type,
-        }
+    parameters = get_action_parameters(
+        "UpgradeProduct",
+        serviceid=service_id,
+        paymentmethod=payment_method,
+        type=upgrade_type,
     )
     if new_product_id:
         parameters.update({"newproductid": new_product_id})
@@ -316,23 +372,23 @@ def get_upgrade_product_parameters(
 ###########
 
 
-def prepare_get_orders_request(client_id, order_id, status):
+def prepare_get_orders_request(
+    client_id, order_id, status, limit_start=None, limit_num=None
+):
     """Prepare parameters for the get orders request."""
-    parameters = get_default_parameters()
-    parameters.update({"action": "GetOrders"})
+    parameters = get_action_parameters("GetOrders")
     if client_id:
         parameters.update({"userid": client_id})
     if status:
         parameters.update({"status": status})
     if order_id:
         parameters.update({"id": order_id})
-    return parameters
+    return add_pagination_parameters(parameters, limit_start, limit_num)
 
 
 def prepare_cancel_order_request(order_id, cancel_subscription, no_email):
     """Prepare parameters for the cancel order request."""
-    parameters = get_default_parameters()
-    parameters.update({"action": "CancelOrder"})
+    parameters = get_action_parameters("CancelOrder")
     if order_id:
         parameters.update({"orderid": order_id})
     if cancel_subscription:
@@ -347,10 +403,11 @@ def prepare_cancel_order_request(order_id, cancel_subscription, no_email):
 ###########
 
 
-def prepare_get_invoices_request(client_id, status, order_by, order):
+def prepare_get_invoices_request(
+    client_id, status, order_by, order, limit_start=None, limit_num=None
+):
     """Prepare parameters for the get invoices request."""
-    parameters = get_default_parameters()
-    parameters.update({"action": "GetInvoices"})
+    parameters = get_action_parameters("GetInvoices")
     if client_id:
         parameters.update({"userid": client_id})
     if status:
@@ -359,15 +416,14 @@ def prepare_get_invoices_request(client_id, status, order_by, order):
         parameters.update({"orderby": order_by})
     if order:
         parameters.update({"order": order})
-    return parameters
+    return add_pagination_parameters(parameters, limit_start, limit_num)
 
 
 def get_add_invoice_payment_parameters(
     invoice_id, transaction_id, amount, date, payment_method
 ):
     """Prepare parameters for the add invoice payment request."""
-    parameters = get_default_parameters()
-    parameters.update({"action": "AddInvoicePayment"})
+    parameters = get_action_parameters("AddInvoicePayment")
     if invoice_id:
         parameters.update({"invoiceid": invoice_id})
     if transaction_id:
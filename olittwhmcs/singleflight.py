@@ -0,0 +1,100 @@
+"""This module contains helpers sharing one in-flight call between callers."""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+
+CREDENTIAL_PARAMETERS = frozenset({"identifier", "secret", "accesskey"})
+
+
+def get_request_key(parameters):
+    """
+    Build a key identifying a whmcs request, ignoring the credentials.
+    :param parameters: Dictionary, payload of the request.
+    :return: A key equal for requests with the same payload.
+    :rtype: String
+    """
+    return repr(
+        sorted(
+            (name, str(value))
+            for name, value in parameters.items()
+            if name not in CREDENTIAL_PARAMETERS
+        )
+    )
+
+
+class SingleFlight:
+    """Runs one call per key at a time, sharing its outcome between threads.
+
+    A thread calling :meth:`do` with a key that is already being worked on
+    waits for that call and receives its result or exception instead of
+    making its own call.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function, timeout=None):
+        """Call a function unless a call for the same key is in flight.
+
+        Args:
+            key (hashable): Identifies identical calls.
+            function (callable): Makes the call, takes no arguments.
+            timeout (float): Optional. Maximum seconds to wait for a call
+                already in flight.
+        Returns:
+            The result of the call.
+        Raises:
+            concurrent.futures.TimeoutError: If the call in flight does not
+                finish in time.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._calls[key] = future
+        if not is_leader:
+            return future.result(timeout)
+        try:
+            result = function()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class AsyncSingleFlight:
+    """Runs one call per key at a time, sharing its outcome between tasks.
+
+    Instances must only be used from a single event loop.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, function, timeout=None):
+        """Await a coroutine function unless a call for the key is in flight.
+
+        Args:
+            key (hashable): Identifies identical calls.
+            function (callable): Returns the awaitable making the call.
+            timeout (float): Optional. Maximum seconds to wait for the call.
+                The call itself goes on for the other waiting tasks.
+        Returns:
+            The result of the call.
+        Raises:
+            asyncio.TimeoutError: If the call does not finish in time.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(function())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
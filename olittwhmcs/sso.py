@@ -0,0 +1,258 @@
+"""This module contains the pool of whmcs single sign on tokens.
+
+Creating a token takes a round trip to whmcs, which otherwise sits between a
+click on eg "View invoices" and the redirect. Tokens are kept in the Django
+cache with the redirect url whmcs issued and the time they expire, so a
+cached token is as good as a fresh one. Tokens can be created ahead of time
+with :meth:`SsoTokenPool.prewarm`, eg right after a client logs in, and are
+refreshed in the background before they expire. Concurrent requests for the
+same token share a single call to whmcs.
+"""
+
+import hashlib
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.core.cache import cache
+
+from olittwhmcs import deadlines, metrics
+from olittwhmcs.exceptions import WhmcsTimeoutError
+from olittwhmcs.singleflight import SingleFlight, get_request_key
+
+# Whmcs tokens are valid for 60 seconds after they are created.
+DEFAULT_TOKEN_LIFETIME = 60
+DEFAULT_EXPIRY_MARGIN = 10
+DEFAULT_PREWARM_DESTINATIONS = ("clientarea:invoices",)
+DEFAULT_PREWARM_WORKERS = 4
+KEY_PREFIX = "whmcs_sso_token"
+
+
+def get_token_key(client_id, destination="", extra_parameters=None):
+    """
+    Build the cache key of a client's token for a destination.
+    :param client_id: Integer, id of the whmcs client.
+    :param destination: String, where the token redirects to.
+    :param extra_parameters: Dictionary, optional. Extra CreateSsoToken
+        parameters, eg sso_redirect_path.
+    :return: The cache key.
+    :rtype: String
+    """
+    key = f"{KEY_PREFIX}_{client_id}_{destination}"
+    if extra_parameters:
+        digest = hashlib.sha1(get_request_key(extra_parameters).encode())
+        key = f"{key}_{digest.hexdigest()}"
+    return key
+
+
+def get_token_lifetime():
+    """Retrieve the seconds a token stays valid, ``WHMCS_SSO_TOKEN_LIFETIME``."""
+    return getattr(settings, "WHMCS_SSO_TOKEN_LIFETIME", DEFAULT_TOKEN_LIFETIME)
+
+
+def get_expiry_margin():
+    """
+    Retrieve the seconds a token must still be valid for to be handed out.
+
+    Leaves the client time to follow the redirect. Configured with
+    ``WHMCS_SSO_EXPIRY_MARGIN``.
+    """
+    return getattr(settings, "WHMCS_SSO_EXPIRY_MARGIN", DEFAULT_EXPIRY_MARGIN)
+
+
+class SsoTokenPool:
+    """Cache of whmcs single sign on tokens.
+
+    A token is handed out until it is within the expiry margin of its expiry.
+    Once half of its lifetime has passed, a replacement is created in the
+    background so requests keep hitting the cache.
+    """
+
+    def __init__(self, create_token=None, backend=None):
+        """Create the pool.
+
+        Args:
+            create_token (callable): Optional. Creates a token in whmcs from
+                the client id, destination and extra parameters, and returns
+                the access token and redirect url. Defaults to
+                :func:`olittwhmcs.whmcs.create_sso_token`.
+            backend: Optional. Django cache backend holding the tokens.
+        """
+        self._create_token = create_token
+        self.backend = backend if backend is not None else cache
+        self._single_flight = SingleFlight()
+        self._executor = None
+        self._lock = threading.Lock()
+        self._refreshing = set()
+
+    @property
+    def create_token(self):
+        if self._create_token is None:
+            from olittwhmcs import whmcs
+
+            return whmcs.create_sso_token
+        return self._create_token
+
+    def get(self, client_id, destination="", extra_parameters=None):
+        """Retrieve a token, creating it in whmcs if none is cached.
+
+        Args:
+            client_id (int): ID of client to get a token for.
+            destination (str): Optional. Destination to redirect to after login.
+            extra_parameters (dict): Optional. Extra parameters to pass to WHMCS.
+        Returns:
+            tuple: The access token and the redirect url whmcs issued.
+        Raises:
+            WhmcsException: If the token cannot be created.
+            WhmcsTimeoutError: If the deadline of the call passes while
+                waiting for a token another caller is creating.
+        """
+        token = self.lookup(client_id, destination, extra_parameters)
+        if token is not None:
+            return token["access_token"], token["redirect_url"]
+        key = get_token_key(client_id, destination, extra_parameters)
+        while True:
+            created_token = []
+
+            def refresh():
+                created_token.append(True)
+                return self.refresh(client_id, destination, extra_parameters)
+
+            try:
+                token = self._single_flight.do(
+                    key, refresh, deadlines.get_remaining()
+                )
+            except FutureTimeoutError:
+                raise WhmcsTimeoutError(deadlines.DEADLINE_EXCEEDED)
+            except WhmcsTimeoutError:
+                # The deadline of the caller creating the token passed, this
+                # caller creates it again if it still has time.
+                if created_token or deadlines.has_expired():
+                    raise
+                continue
+            return token["access_token"], token["redirect_url"]
+
+    def lookup(self, client_id, destination="", extra_parameters=None):
+        """Retrieve a cached token, refreshing it in the background if needed.
+
+        Args:
+            client_id (int): ID of client to get a token for.
+            destination (str): Optional. Destination to redirect to after login.
+            extra_parameters (dict): Optional. Extra parameters to pass to WHMCS.
+        Returns:
+            dict: The cached token, None if there is none to hand out. Tokens
+                past half of their lifetime are replaced in the background.
+        """
+        key = get_token_key(client_id, destination, extra_parameters)
+        token = self.get_cached(key)
+        if metrics.is_enabled():
+            metrics.record_cache_request("sso", "CreateSsoToken", token is not None)
+        if (
+            token is not None
+            and token["expires_at"] - time.time() < get_token_lifetime() / 2
+        ):
+            self._refresh_in_background(key, client_id, destination, extra_parameters)
+        return token
+
+    def get_cached(self, key):
+        """Retrieve a cached token that can still be handed out, or None."""
+        token = self.backend.get(key)
+        if token is None or token["expires_at"] - time.time() < get_expiry_margin():
+            return None
+        return token
+
+    def store(self, key, access_token, redirect_url, created_at=None):
+        """
+        Cache a token created in whmcs.
+        :param key: String, cache key of the token.
+        :param access_token: String, the token.
+        :param redirect_url: String, the redirect url whmcs issued.
+        :param created_at: Float, optional. ``time.time()`` when whmcs was asked.
+        :return: The cached token.
+        :rtype: Dictionary
+        """
+        created_at = time.time() if created_at is None else created_at
+        token = {
+            "access_token": access_token,
+            "redirect_url": redirect_url,
+            "expires_at": created_at + get_token_lifetime(),
+        }
+        timeout = token["expires_at"] - time.time() - get_expiry_margin()
+        if timeout > 0:
+            self.backend.set(key, token, math.ceil(timeout))
+        return token
+
+    def refresh(self, client_id, destination="", extra_parameters=None):
+        """Create a token in whmcs and cache it, replacing any cached one."""
+        key = get_token_key(client_id, destination, extra_parameters)
+        # The token's lifetime starts when whmcs creates it, count from before
+        # the request so the expiry is never overestimated.
+        created_at = time.time()
+        access_token, redirect_url = self.create_token(
+            client_id, destination, extra_parameters
+        )
+        return self.store(key, access_token, redirect_url, created_at)
+
+    def prewarm(self, client_id, destinations=None):
+        """Create a client's tokens in the background before they are needed.
+
+        Args:
+            client_id (int): ID of client to create tokens for.
+            destinations (iterable): Optional. Destinations to create tokens
+                for, each either a destination or a tuple of the destination
+                and its extra parameters. Defaults to the
+                ``WHMCS_SSO_PREWARM_DESTINATIONS`` setting.
+        Returns:
+            list: A future for each token created.
+        """
+        if destinations is None:
+            destinations = getattr(
+                settings,
+                "WHMCS_SSO_PREWARM_DESTINATIONS",
+                DEFAULT_PREWARM_DESTINATIONS,
+            )
+        futures = []
+        for destination in destinations:
+            destination, extra_parameters = (
+                destination if isinstance(destination, tuple) else (destination, None)
+            )
+            key = get_token_key(client_id, destination, extra_parameters)
+            if self.get_cached(key) is None:
+                futures.append(
+                    self._submit(key, client_id, destination, extra_parameters)
+                )
+        return futures
+
+    def _submit(self, key, client_id, destination, extra_parameters):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        getattr(
+                            settings,
+                            "WHMCS_SSO_PREWARM_WORKERS",
+                            DEFAULT_PREWARM_WORKERS,
+                        ),
+                        thread_name_prefix="whmcs-sso",
+                    )
+        return self._executor.submit(
+            self._single_flight.do,
+            key,
+            lambda: self.refresh(client_id, destination, extra_parameters),
+        )
+
+    def _refresh_in_background(self, key, client_id, destination, extra_parameters):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        future = self._submit(key, client_id, destination, extra_parameters)
+        # A failed refresh is ignored, the cached token is served until the
+        # expiry margin and then created again on demand.
+        future.add_done_callback(lambda _: self._refreshing.discard(key))
+
+
+sso_token_pool = SsoTokenPool()
@@ -0,0 +1,159 @@
+"""This module contains an incremental decoder for large whmcs responses.
+
+Only the list being streamed is decoded item by item, so peak memory is
+bounded by the size of one item and one network chunk rather than by the
+size of the response.
+"""
+
+import codecs
+import json
+from json.decoder import scanstring
+
+WHITESPACE = " \t\n\r"
+DELIMITERS = WHITESPACE + ",]}"
+
+_decoder = json.JSONDecoder()
+
+# Returned instead of an item once the streamed list is closed.
+END = object()
+
+
+class IncompleteData(Exception):
+    """More data is needed to decode the next token."""
+
+
+class StreamingParser:
+    """Decodes the items of a list nested in a JSON object as data arrives.
+
+    Scalar members of the top level object, such as ``result`` and
+    ``message``, are collected into :attr:`metadata` along the way.
+    """
+
+    def __init__(self, path):
+        """Create the parser.
+
+        Args:
+            path (tuple): Keys leading to the list to stream. Eg
+                ("orders", "order").
+        """
+        self.path = list(path)
+        self.metadata = {}
+        self._buffer = ""
+        self._position = 0
+        self._finished = False
+        # One [kind, key, expects_key] frame per open container.
+        self._stack = []
+        self._in_items = False
+
+    def iter_items(self, chunks):
+        """Decode the items of the list from chunks of the response.
+
+        Args:
+            chunks (iterable): Bytes of the response, in order.
+        Yields:
+            The decoded items of the list.
+        Raises:
+            ValueError: If the response is not valid JSON.
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        for chunk in chunks:
+            self._feed(decoder.decode(chunk))
+            yield from self._parse()
+        self._feed(decoder.decode(b"", final=True))
+        self._finished = True
+        yield from self._parse()
+        if self._stack or self._buffer[self._position:].strip(WHITESPACE):
+            raise ValueError("Incomplete JSON response")
+
+    def _feed(self, text):
+        self._buffer = self._buffer[self._position:] + text
+        self._position = 0
+
+    def _parse(self):
+        try:
+            while True:
+                if not self._in_items:
+                    self._next_token()
+                    continue
+                item = self._next_item()
+                if item is not END:
+                    yield item
+        except IncompleteData:
+            return
+
+    def _skip(self, characters):
+        buffer = self._buffer
+        position = self._position
+        while position < len(buffer) and buffer[position] in characters:
+            position += 1
+        self._position = position
+        if position >= len(buffer):
+            raise IncompleteData()
+        return buffer[position]
+
+    def _decode_value(self):
+        try:
+            value, end = _decoder.raw_decode(self._buffer, self._position)
+        except json.JSONDecodeError:
+            if self._finished:
+                raise ValueError("Invalid JSON response")
+            raise IncompleteData()
+        # A number is only complete once a delimiter follows it, otherwise
+        # it may continue in the next chunk.
+        if (
+            not self._finished
+            and isinstance(value, (int, float))
+            and (end >= len(self._buffer) or self._buffer[end] not in DELIMITERS)
+        ):
+            raise IncompleteData()
+        self._position = end
+        return value
+
+    def _next_item(self):
+        character = self._skip(WHITESPACE + ",")
+        if character == "]":
+            self._position += 1
+            self._in_items = False
+            self._end_value()
+            return END
+        return self._decode_value()
+
+    def _next_token(self):
+        character = self._skip(WHITESPACE + ",:")
+        frame = self._stack[-1] if self._stack else None
+        if character == "{":
+            self._position += 1
+            self._stack.append(["object", None, True])
+        elif character == "[":
+            self._position += 1
+            if self._is_at_path():
+                self._in_items = True
+            else:
+                self._stack.append(["array", None, False])
+        elif character in "}]":
+            self._position += 1
+            self._stack.pop()
+            self._end_value()
+        elif character == '"' and frame is not None and frame[2]:
+            try:
+                key, end = scanstring(self._buffer, self._position + 1)
+            except json.JSONDecodeError:
+                raise IncompleteData()
+            self._position = end
+            frame[1] = key
+            frame[2] = False
+        else:
+            value = self._decode_value()
+            if len(self._stack) == 1 and frame[0] == "object":
+                self.metadata[frame[1]] = value
+            self._end_value()
+
+    def _is_at_path(self):
+        return len(self._stack) == len(self.path) and all(
+            frame[0] == "object" and frame[1] == key
+            for frame, key in zip(self._stack, self.path)
+        )
+
+    def _end_value(self):
+        if self._stack and self._stack[-1][0] == "object":
+            self._stack[-1][2] = True
@@ -1,38 +1,59 @@
-"""This module contains the api surface for consuming this package."""
+"""This module contains the api surface for consuming this package.
 
+Every function calling whmcs accepts a ``timeout`` keyword argument, the
+seconds the whole call may take including retries, after which
+:class:`~olittwhmcs.exceptions.WhmcsTimeoutError` is raised. See
+:mod:`olittwhmcs.deadlines`.
+"""
+
+import contextvars
 import hashlib
 import os
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict
-
-from django.core.cache import cache
-
-from olittwhmcs import models, serializer
-from olittwhmcs.exceptions import WhmcsException
-from olittwhmcs.models import Client, ClientProduct, Product
-from olittwhmcs.network import get_whmcs_response
+from urllib.parse import urlencode
+
+from requests.exceptions import RequestException
+
+from olittwhmcs import (
+    actions,
+    compactmodels,
+    deadlines,
+    models,
+    responsecache,
+    serializer,
+    sso,
+)
+from olittwhmcs.deadlines import with_timeout
+from olittwhmcs.exceptions import (
+    WhmcsConnectionError,
+    WhmcsException,
+    WhmcsTimeoutError,
+)
+from olittwhmcs.models import ClientProduct, Product
+from olittwhmcs.network import (
+    get_error_message,
+    get_whmcs_response,
+    make_whmcs_network_request,
+)
+from olittwhmcs.ratelimit import TokenBucket
 from olittwhmcs.serializer import (
-    create_user_request_parameters,
     get_client_product_request_parameters,
-    get_default_parameters,
-    get_domain_nameservers_request_parameter,
-    get_product_request_parameters,
     order_bulk_products_request_parameters,
     order_domain_request_parameters,
     order_product_request_parameters,
-    prepare_cancel_order_request,
     prepare_get_invoices_request,
     prepare_get_orders_request,
-    update_domain_nameservers_request_parameter,
-    upgrade_product_request_parameters,
 )
+from olittwhmcs.streaming import StreamingParser
 
 ##########
 # CLIENT #
 ##########
 
 
+@with_timeout
 def create_client(**kwargs):
     """Create a WHMCS User account.
 
@@ -45,15 +66,10 @@ def create_client(**kwargs):
     Raises:
         WhmcsException: If an error occurs.
     """
-    parameters = create_user_request_parameters(**kwargs)
-    is_successful, response_or_error = get_whmcs_response(parameters)
-    if is_successful and response_or_error:
-        client_id = response_or_error.get("clientid")
-        return client_id
-    default_error = "Unable to enroll for a billing account"
-    raise WhmcsException(response_or_error if response_or_error else default_error)
+    return call_action("AddClient", **kwargs)
 
 
+@with_timeout
 def get_client(email=None, client_id=None):
     """Retrieve a WHMCS User account.
 
@@ -65,15 +81,10 @@ def get_client(email=None, client_id=None):
     Raises:
         WhmcsException: If an error occurs.
     """
-    parameters = serializer.get_client_request_parameters(email, client_id)
-    is_successful, response_or_error = get_whmcs_response(parameters)
-    if is_successful and response_or_error:
-        client = Client(response_or_error)
-        return client
-    default_error = "Unable to get client details"
-    raise WhmcsException(response_or_error if response_or_error else default_error)
+    return call_action("GetClientsDetails", email, client_id)
 
 
+@with_timeout
 def update_client(**kwargs):
     """Update a WHMCS User account.
     Args:
@@ -85,13 +96,7 @@ def update_client(**kwargs):
      Raises:
          WhmcsException: If an error occurs.
     """
-    parameters = serializer.update_client_request_parameters(**kwargs)
-    is_successful, response_or_error = get_whmcs_response(parameters)
-    if is_successful and response_or_error:
-        client_id = response_or_error.get("clientid")
-        return client_id
-    default_error = "Unable to update client details"
-    raise WhmcsException(response_or_error if response_or_error else default_error)
+    return call_action("UpdateClient", **kwargs)
 
 
 ###########
@@ -99,6 +104,7 @@ def update_client(**kwargs):
 ###########
 
 
+@with_timeout
 def get_products(currency=None, group_id=None, module=None, product_ids=None):
     """Retrieve products from WHMCS.
 
@@ -112,24 +118,31 @@ def get_products(currency=None, group_id=None, module=None, product_ids=None):
     Raises:
         WhmcsException: If an error occurs.
     """
-    parameters = get_product_request_parameters(group_id, module, product_ids)
-    is_successful, response_or_error = get_whmcs_response(parameters)
-    if is_successful and response_or_error:
-        try:
-            whmcs_products_wrapper = response_or_error.get("products", "")
-            whmcs_products = whmcs_products_wrapper.get("product")
-        except AttributeError:
-            whmcs_products = []
-
-        products = []
-        for whmcs_product in whmcs_products:
-            product = Product(whmcs_product, currency)
-            products.append(product)
-        return products
-    default_error = "Unable to fetch products"
-    raise WhmcsException(response_or_error if response_or_error else default_error)
+    whmcs_products = get_raw_products(group_id, module, product_ids)
+    products = []
+    for whmcs_product in whmcs_products:
+        product = Product(whmcs_product, currency)
+        products.append(product)
+    return products
+
+
+@with_timeout
+def get_raw_products(group_id=None, module=None, product_ids=None):
+    """Retrieve products from WHMCS as returned by the api.
+
+    Args:
+        group_id (int): Optional. ID of the group from which to fetch products.
+        module (str): Optional. Name of the module from which to fetch products.
+        product_ids (list): Optional. Product ids to retrieve.
+    Returns:
+        list: Product dictionaries retrieved from whmcs
+    Raises:
+        WhmcsException: If an error occurs.
+    """
+    return call_action("GetProducts", group_id, module, product_ids)
 
 
+@with_timeout
 def get_client_products(client_id, product_id=None, service_id=None, domain=None):
     """
     Retrieve a user's products from WHMCS.
@@ -138,26 +151,86 @@ def get_client_products(client_id, product_id=None, service_id=None, domain=None
     :param service_id: Integer, specific service id to obtain the details for.
     :param domain: String, specific domain to obtain the service details for.
     """
+    return call_action(
+        "GetClientsProducts", client_id, product_id, service_id, domain
+    )
+
+
+@with_timeout
+def iter_client_products(
+    client_id,
+    product_id=None,
+    service_id=None,
+    domain=None,
+    page_size=None,
+    compact=False,
+):
+    """Iterate over all of a user's products in WHMCS, one page at a time.
+
+    Args:
+        client_id (int): ID of the client whose products to fetch.
+        product_id (int): Optional. Specific product id to obtain the details for.
+        service_id (int): Optional. Specific service id to obtain the details for.
+        domain (str): Optional. Specific domain to obtain the service details for.
+        page_size (int): Optional. Number of products to request per page.
+        compact (bool): Optional. Yield memory compact models that decode
+            their fields lazily.
+    Yields:
+        ClientProduct: The client's products.
+    Raises:
+        WhmcsException: If an error occurs.
+    """
+
+    def build_parameters(limit_start, limit_num):
+        return get_client_product_request_parameters(
+            client_id, product_id, service_id, domain, limit_start, limit_num
+        )
+
+    whmcs_products = iter_pages(
+        build_parameters,
+        "products",
+        "product",
+        "Unable to fetch your products",
+        page_size,
+    )
+    model = compactmodels.ClientProduct if compact else ClientProduct
+    for whmcs_product in whmcs_products:
+        yield model(whmcs_product)
+
+
+@with_timeout
+def stream_client_products(
+    client_id, product_id=None, service_id=None, domain=None, compact=False
+):
+    """Iterate over a user's products in WHMCS as the response arrives.
+
+    Products are decoded one at a time from a single response, so memory
+    stays bounded however many products the client has.
+
+    Args:
+        client_id (int): ID of the client whose products to fetch.
+        product_id (int): Optional. Specific product id to obtain the details for.
+        service_id (int): Optional. Specific service id to obtain the details for.
+        domain (str): Optional. Specific domain to obtain the service details for.
+        compact (bool): Optional. Yield memory compact models that decode
+            their fields lazily.
+    Yields:
+        ClientProduct: The client's products.
+    Raises:
+        WhmcsException: If an error occurs.
+    """
     parameters = get_client_product_request_parameters(
         client_id, product_id, service_id, domain
     )
-    is_successful, response_or_error = get_whmcs_response(parameters)
-    if is_successful:
-        try:
-            whmcs_products_wrapper = response_or_error.get("products", "")
-            whmcs_products = whmcs_products_wrapper.get("product", [])
-        except AttributeError:
-            whmcs_products = []
-
-        client_products = []
-        for whmcs_product in whmcs_products:
-            client_product = ClientProduct(whmcs_product)
-            client_products.append(client_product)
-        return client_products
-    default_error = "Unable to fetch your products"
-    raise WhmcsException(response_or_error if response_or_error else default_error)
+    whmcs_products = stream_records(
+        parameters, "products", "product", "Unable to fetch your products"
+    )
+    model = compactmodels.ClientProduct if compact else ClientProduct
+    for whmcs_product in whmcs_products:
+        yield model(whmcs_product)
 
 
+@with_timeout
 def order_product(
     client_id, payment_method, billing_cycle, product_id=None, domain=None, **kwargs
 ):
@@ -183,15 +256,10 @@ def order_product(
         parameters = order_domain_request_parameters(
             client_id, domain, payment_method, billing_cycle, **kwargs
         )
-    is_successful, response_or_error = get_whmcs_response(parameters)
-    if is_successful and response_or_error:
-        order_id = response_or_error.get("orderid")
-        invoice_id = response_or_error.get("invoiceid")
-        return order_id, invoice_id
-    default_error = "Unable to fetch products"
-    raise WhmcsException(response_or_error if response_or_error else default_error)
+    return run_action(actions.ADD_ORDER, parameters)
 
 
+@with_timeout
 def order_bulk_products(parameters=None, **kwargs):
     """
     Place a multiple products order in WHMCS.
@@ -206,15 +274,10 @@ def order_bulk_products(parameters=None, **kwargs):
     if not parameters:
         parameters = {}
     updated_parameters = order_bulk_products_request_parameters(parameters)
-    is_successful, response_or_error = get_whmcs_response(updated_parameters)
-    if is_successful and response_or_error:
-        order_id = response_or_error.get("orderid")
-        invoice_id = response_or_error.get("invoiceid")
-        return order_id, invoice_id
-    default_error = "Unable to fetch products"
-    raise WhmcsException(response_or_error if response_or_error else default_error)
+    return run_action(actions.ADD_ORDER, updated_parameters)
 
 
+@with_timeout
 def get_domain_nameservers(domain_id):
     """get  domain nameservers.
 
@@ -225,14 +288,10 @@ def get_domain_nameservers(domain_id):
     Raises:
         WhmcsException: If an error occurs.
     """
-    parameters = get_domain_nameservers_request_parameter(domain_id)
-    is_successful, response_or_error = get_whmcs_response(parameters)
-    if is_successful and response_or_error:
-        return response_or_error
-    default_error = "Unable to get nameservers"
-    raise WhmcsException(response_or_error if response_or_error else default_error)
+    return call_action("DomainGetNameservers", domain_id)
 
 
+@with_timeout
 def update_domain_nameservers(data):
     """update a domain nameservers.
 
@@ -243,14 +302,10 @@ def update_domain_nameservers(data):
     Raises:
         WhmcsException: If an error occurs.
     """
-    parameters = update_domain_nameservers_request_parameter(data)
-    is_successful, response_or_error = get_whmcs_response(parameters)
-    if is_successful and response_or_error:
-        return response_or_error
-    default_error = "Unable to update nameservers"
-    raise WhmcsException(response_or_error if response_or_error else default_error)
+    return call_action("DomainUpdateNameservers", data)
 
 
+@with_timeout
 def upgrade_client_product(
     service_id, payment_method, billing_cycle=None, package_id=None
 ):
@@ -267,15 +322,9 @@ def upgrade_client_product(
     Raises:
         WhmcsException: If an error occurs.
     """
-    parameters = upgrade_product_request_parameters(
-        service_id, payment_method, billing_cycle, package_id
+    return call_action(
+        "UpdateClientProduct", service_id, payment_method, billing_cycle, package_id
     )
-    is_successful, response_or_error = get_whmcs_response(parameters)
-    if is_successful and response_or_error:
-        service_id = response_or_error.get("serviceid")
-        return service_id
-    default_error = "Unable to fetch products"
-    raise WhmcsException(response_or_error if response_or_error else default_error)
 
 
 ###########
@@ -283,6 +332,7 @@ def upgrade_client_product(
 ###########
 
 
+@with_timeout
 def upgrade_product(
     service_id,
     payment_method,
@@ -305,7 +355,8 @@ def upgrade_product(
     Raises:
         WhmcsException: If an error occurs.
     """
-    parameters = serializer.get_upgrade_product_parameters(
+    return call_action(
+        "UpgradeProduct",
         service_id,
         payment_method,
         upgrade_type,
@@ -313,13 +364,9 @@ def upgrade_product(
         new_billing_cycle,
         promo_code,
     )
-    is_successful, response_or_error = get_whmcs_response(parameters)
-    if is_successful and response_or_error:
-        return models.ProductUpgrade(response_or_error)
-    default_error = "Unable to complete upgrade"
-    raise WhmcsException(response_or_error if response_or_error else default_error)
 
 
+@with_timeout
 def add_invoice_payment(invoice_id, transaction_id, amount, date, gateway):
     """Add a payment to an invoice.
 
@@ -334,14 +381,9 @@ def add_invoice_payment(invoice_id, transaction_id, amount, date, gateway):
     Raises:
         WhmcsException: If an error occurs.
     """
-    parameters = serializer.get_add_invoice_payment_parameters(
-        invoice_id, transaction_id, amount, date, gateway
+    return call_action(
+        "AddInvoicePayment", invoice_id, transaction_id, amount, date, gateway
     )
-    is_successful, response_or_error = get_whmcs_response(parameters)
-    if is_successful:
-        return is_successful
-    default_error = "Unable to add payment"
-    raise WhmcsException(response_or_error if response_or_error else default_error)
 
 
 #########
@@ -349,6 +391,7 @@ def add_invoice_payment(invoice_id, transaction_id, amount, date, gateway):
 #########
 
 
+@with_timeout
 def get_orders(client_id=None, order_id=None, status=None):
     """Retrieve a WHMCS orders.
 
@@ -361,24 +404,65 @@ def get_orders(client_id=None, order_id=None, status=None):
     Raises:
         WhmcsException: If an error occurs.
     """
-    parameters = prepare_get_orders_request(client_id, order_id, status)
-    is_successful, response_or_error = get_whmcs_response(parameters)
-    if is_successful and response_or_error:
-        try:
-            whmcs_orders_wrapper = response_or_error.get("orders")
-            whmcs_orders = whmcs_orders_wrapper.get("order")
-        except AttributeError:
-            whmcs_orders = []
-
-        orders = []
-        for whmcs_order in whmcs_orders:
-            order = models.Order(whmcs_order)
-            orders.append(order)
-        return orders
-    default_error = "Unable to fetch orders"
-    raise WhmcsException(response_or_error if response_or_error else default_error)
+    return call_action("GetOrders", client_id, order_id, status)
+
+
+@with_timeout
+def iter_orders(client_id=None, status=None, page_size=None, compact=False):
+    """Iterate over all WHMCS orders, one page at a time.
+
+    Args:
+        client_id (int): (Optional) ID of client whose orders to retrieve.
+        status (str): (Optional) Status of the orders to retrieve.
+        page_size (int): (Optional) Number of orders to request per page.
+        compact (bool): (Optional) Yield memory compact models that decode
+            their fields lazily.
+    Yields:
+        Order: Orders retrieved from whmcs
+    Raises:
+        WhmcsException: If an error occurs.
+    """
+
+    def build_parameters(limit_start, limit_num):
+        return prepare_get_orders_request(
+            client_id, None, status, limit_start, limit_num
+        )
+
+    whmcs_orders = iter_pages(
+        build_parameters, "orders", "order", "Unable to fetch orders", page_size
+    )
+    model = compactmodels.Order if compact else models.Order
+    for whmcs_order in whmcs_orders:
+        yield model(whmcs_order)
+
+
+@with_timeout
+def stream_orders(client_id=None, status=None, compact=False):
+    """Iterate over WHMCS orders as the response arrives.
 
+    Orders are decoded one at a time from a single response, so memory
+    stays bounded however many orders are returned.
 
+    Args:
+        client_id (int): (Optional) ID of client whose orders to retrieve.
+        status (str): (Optional) Status of the orders to retrieve.
+        compact (bool): (Optional) Yield memory compact models that decode
+            their fields lazily.
+    Yields:
+        Order: Orders retrieved from whmcs
+    Raises:
+        WhmcsException: If an error occurs.
+    """
+    parameters = prepare_get_orders_request(client_id, None, status)
+    whmcs_orders = stream_records(
+        parameters, "orders", "order", "Unable to fetch orders"
+    )
+    model = compactmodels.Order if compact else models.Order
+    for whmcs_order in whmcs_orders:
+        yield model(whmcs_order)
+
+
+@with_timeout
 def cancel_order(order_id, cancel_subscription=None, no_email=None):
     """Cancel a WHMCS order.
 
@@ -393,12 +477,7 @@ def cancel_order(order_id, cancel_subscription=None, no_email=None):
     Raises:
         WhmcsException: If an error occurs.
     """
-    parameters = prepare_cancel_order_request(order_id, cancel_subscription, no_email)
-    is_successful, response_or_error = get_whmcs_response(parameters)
-    if is_successful:
-        return is_successful
-    default_error = "Unable to cancel the order"
-    raise WhmcsException(response_or_error if response_or_error else default_error)
+    return call_action("CancelOrder", order_id, cancel_subscription, no_email)
 
 
 ###########
@@ -406,11 +485,13 @@ def cancel_order(order_id, cancel_subscription=None, no_email=None):
 ###########
 
 
+@with_timeout
 def get_client_invoices_sso_url(client_id: int):
     """Get or generate a url to view a client's invoices."""
     return get_sso_token_and_redirect_url(client_id, "clientarea:invoices")
 
 
+@with_timeout
 def get_client_invoice_sso_url(client_id: int, invoice_id: int):
     """Get or generate a url to view a client's invoices."""
     return get_sso_token_and_redirect_url(
@@ -429,32 +510,44 @@ def get_settle_invoice_url(invoice_id, client_email, auto_auth_key):
     :return: A url to pay for an invoice.
     :rtype: String.
     """
+    return get_settle_invoice_urls([(invoice_id, client_email)], auto_auth_key)[0]
 
-    def get_timestamp():
-        timestamp_float = time.mktime(datetime.now().timetuple())
-        timestamp_int = int(timestamp_float)
-        timestamp_string = str(timestamp_int)
-        return timestamp_string
-
-    def generate_whmcs_hash(email):
-        concatenated_string = f"{email}{get_timestamp()}{auto_auth_key}"
-        hash_object = hashlib.sha1(concatenated_string.encode())
-        pb_hash = hash_object.hexdigest()
-        return pb_hash
-
-    whmcs_hash = generate_whmcs_hash(client_email)
 
+def get_settle_invoice_urls(invoices, auto_auth_key, timestamp=None):
+    """
+    Generate urls to preview and pay for many invoices, eg for a mailing.
+
+    No request is made to whmcs. The urls of a batch share one timestamp and
+    their query strings are url encoded.
+    :param invoices: Iterable, (invoice id, client email) pairs.
+    :param auto_auth_key: String, key to autologin the users.
+    :param timestamp: Integer, optional. Unix time the urls are signed at,
+        now by default. Whmcs rejects urls signed more than 15 minutes ago.
+    :return: A url to pay for each invoice, in order.
+    :rtype: List
+    """
+    timestamp = str(int(time.time()) if timestamp is None else int(timestamp))
+    # Whmcs signs the login as sha1(email + timestamp + auto auth key).
+    suffix = f"{timestamp}{auto_auth_key}".encode()
     base_url = os.environ.get("WHMCS_CLIENT_AREA_URL", "https://www.olitt.com/billing")
-
-    invoice_url = f"{base_url}/viewinvoice.php?id={invoice_id}"
-    parameters = (
-        f"email={client_email}&timestamp={get_timestamp()}"
-        + f"&hash={whmcs_hash}&goto={invoice_url}"
-    )
-    payment_url = f"{base_url}/dologin.php?{parameters}"
-    return payment_url
+    login_url = f"{base_url}/dologin.php?"
+    invoice_url = f"{base_url}/viewinvoice.php?id="
+    sha1 = hashlib.sha1
+    return [
+        login_url
+        + urlencode(
+            {
+                "email": client_email,
+                "timestamp": timestamp,
+                "hash": sha1(client_email.encode() + suffix).hexdigest(),
+                "goto": f"{invoice_url}{invoice_id}",
+            }
+        )
+        for invoice_id, client_email in invoices
+    ]
 
 
+@with_timeout
 def get_invoices(client_id=None, status=None, order_by=None, order=None):
     """Retrieve a WHMCS invoices.
 
@@ -469,22 +562,77 @@ def get_invoices(client_id=None, status=None, order_by=None, order=None):
     Raises:
         WhmcsException: If an error occurs.
     """
+    return call_action("GetInvoices", client_id, status, order_by, order)
+
+
+@with_timeout
+def iter_invoices(
+    client_id=None,
+    status=None,
+    order_by=None,
+    order=None,
+    page_size=None,
+    compact=False,
+):
+    """Iterate over all WHMCS invoices, one page at a time.
+
+    Args:
+        client_id (int): (Optional) ID of client whose invoices to retrieve.
+        status (str): (Optional) Status of the invoices to retrieve.
+        order (str): (Optional) Sort attribute. Accepted values are: asc, desc.
+        order_by (str): (Optional) Field to sort results by. Accepted values are:
+            id, invoicenumber, date, duedate, total, status.
+        page_size (int): (Optional) Number of invoices to request per page.
+        compact (bool): (Optional) Yield memory compact models that decode
+            their fields lazily.
+    Yields:
+        Invoice: Invoices retrieved from whmcs
+    Raises:
+        WhmcsException: If an error occurs.
+    """
+
+    def build_parameters(limit_start, limit_num):
+        return prepare_get_invoices_request(
+            client_id, status, order_by, order, limit_start, limit_num
+        )
+
+    whmcs_invoices = iter_pages(
+        build_parameters, "invoices", "invoice", "Unable to fetch invoices", page_size
+    )
+    model = compactmodels.Invoice if compact else models.Invoice
+    for whmcs_invoice in whmcs_invoices:
+        yield model(whmcs_invoice)
+
+
+@with_timeout
+def stream_invoices(
+    client_id=None, status=None, order_by=None, order=None, compact=False
+):
+    """Iterate over WHMCS invoices as the response arrives.
+
+    Invoices are decoded one at a time from a single response, so memory
+    stays bounded however many invoices are returned.
+
+    Args:
+        client_id (int): (Optional) ID of client whose invoices to retrieve.
+        status (str): (Optional) Status of the invoices to retrieve.
+        order (str): (Optional) Sort attribute. Accepted values are: asc, desc.
+        order_by (str): (Optional) Field to sort results by. Accepted values are:
+            id, invoicenumber, date, duedate, total, status.
+        compact (bool): (Optional) Yield memory compact models that decode
+            their fields lazily.
+    Yields:
+        Invoice: Invoices retrieved from whmcs
+    Raises:
+        WhmcsException: If an error occurs.
+    """
     parameters = prepare_get_invoices_request(client_id, status, order_by, order)
-    is_successful, response_or_error = get_whmcs_response(parameters)
-    if is_successful and response_or_error:
-        try:
-            whmcs_invoices_wrapper = response_or_error.get("invoices")
-            whmcs_invoices = whmcs_invoices_wrapper.get("invoice")
-        except AttributeError:
-            whmcs_invoices = []
-
-        invoices = []
-        for whmcs_invoice in whmcs_invoices:
-            invoice = models.Invoice(whmcs_invoice)
-            invoices.append(invoice)
-        return invoices
-    default_error = "Unable to fetch invoices"
-    raise WhmcsException(response_or_error if response_or_error else default_error)
+    whmcs_invoices = stream_records(
+        parameters, "invoices", "invoice", "Unable to fetch invoices"
+    )
+    model = compactmodels.Invoice if compact else models.Invoice
+    for whmcs_invoice in whmcs_invoices:
+        yield model(whmcs_invoice)
 
 
 ###########
@@ -494,50 +642,302 @@ def get_invoices(client_id=None, status=None, order_by=None, order=None):
 SIXTY_SECONDS = 60
 
 
+@with_timeout
 def get_sso_token_and_redirect_url(
     client_id: int, destination: str = "", extra_paramaters: Dict = None
 ):
     """
     Generate Single Sign On access token and redirect url.
 
+    Tokens are served from the pool of cached tokens, see
+    :mod:`olittwhmcs.sso`, and created in whmcs when none is cached.
+
     Args:
         client_id (int): ID of client to generate token for.
         destination (str): (Optional) Destination to redirect to after login.
         extra_paramaters (dict): (Optional) Extra parameters to pass to WHMCS.
+    Returns:
+        tuple: The access token and the redirect url whmcs issued.
+    Raises:
+        WhmcsException: If an error occurs.
     """
-    if not extra_paramaters:
-        extra_paramaters = {}
+    return sso.sso_token_pool.get(client_id, destination, extra_paramaters)
 
-    access_token_key = f"whmcs_sso_token_{client_id}_{destination}"
-    existing_access_token = cache.get(access_token_key)
-
-    if existing_access_token:
-        base_url = os.environ.get(
-            "WHMCS_CLIENT_AREA_URL", "https://www.olitt.com/billing"
-        )
-        return (
-            existing_access_token,
-            f"{base_url}/oauth/singlesignon.php?access_token={existing_access_token}",
-        )
 
-    default_parameters = get_default_parameters()
+@with_timeout
+def create_sso_token(
+    client_id: int, destination: str = "", extra_paramaters: Dict = None
+):
+    """
+    Create a Single Sign On access token in whmcs, bypassing the token pool.
 
+    Args:
+        client_id (int): ID of client to generate token for.
+        destination (str): (Optional) Destination to redirect to after login.
+        extra_paramaters (dict): (Optional) Extra parameters to pass to WHMCS.
+    Returns:
+        tuple: The access token and redirect url.
+    Raises:
+        WhmcsException: If an error occurs.
+    """
     parameters = {
-        **default_parameters,
-        "action": "CreateSsoToken",
+        **serializer.get_template("CreateSsoToken"),
         "client_id": client_id,
         "destination": destination,
-        **extra_paramaters,
+        **(extra_paramaters or {}),
     }
+    return run_action(actions.CREATE_SSO_TOKEN, parameters)
+
+
+def prewarm_sso_tokens(client_id: int, destinations=None):
+    """
+    Create a client's Single Sign On tokens in the background, eg at login.
+
+    Args:
+        client_id (int): ID of client to generate tokens for.
+        destinations (iterable): (Optional) Destinations, or tuples of a
+            destination and its extra parameters, to generate tokens for.
+            Defaults to the ``WHMCS_SSO_PREWARM_DESTINATIONS`` setting.
+    Returns:
+        list: A future for each token being generated.
+    """
+    return sso.sso_token_pool.prewarm(client_id, destinations)
+
+
+###########
+# ACTIONS #
+###########
+
+
+def call_action(name, *args, **kwargs):
+    """Send a registered WHMCS action.
+
+    Args:
+        name (str): Name of the whmcs action. Eg GetOrders.
+        args: Positional arguments of the action's payload builder.
+        kwargs: Keyword arguments of the action's payload builder.
+    Returns:
+        The result of the action, as declared in the registry.
+    Raises:
+        WhmcsException: If an error occurs.
+    """
+    action = actions.get_action(name)
+    return run_action(action, action.build_parameters(*args, **kwargs))
+
+
+def run_action(action, parameters):
+    """Send a WHMCS action and parse its response.
+
+    Reads go through the response cache, writes invalidate the cached
+    responses they affect.
+
+    Args:
+        action (Action): The action to send.
+        parameters (dict): Payload of the request.
+    Returns:
+        The result of the action, as declared in the registry.
+    Raises:
+        WhmcsTimeoutError: If the deadline of the call passes.
+        WhmcsException: If an error occurs.
+    """
+    if action.read:
+        is_successful, response_or_error = responsecache.get_cached_whmcs_response(
+            parameters, get_whmcs_response
+        )
+    else:
+        is_successful, response_or_error = get_whmcs_response(parameters)
+    if action.invalidate is not None:
+        action.invalidate(parameters, response_or_error if is_successful else None)
+    if is_successful and (response_or_error or not action.require_response):
+        return action.parse_response(response_or_error)
+    if response_or_error == deadlines.DEADLINE_EXCEEDED:
+        raise WhmcsTimeoutError(response_or_error)
+    error = response_or_error if response_or_error else action.default_error
+    raise WhmcsException(error)
+
+
+##########
+# PAGING #
+##########
+
+DEFAULT_PAGE_SIZE = 100
+
 
+def get_page(parameters, wrapper_key, item_key, default_error):
+    """Retrieve one page of a WHMCS list.
+
+    Args:
+        parameters (dict): Payload of the list request.
+        wrapper_key (str): Key of the object wrapping the list. Eg orders.
+        item_key (str): Key of the list in the wrapper. Eg order.
+        default_error (str): Error raised if whmcs does not give one.
+    Returns:
+        tuple: The records in the page and the total number of records.
+    Raises:
+        WhmcsException: If an error occurs.
+    """
     is_successful, response_or_error = get_whmcs_response(parameters)
+    if is_successful and response_or_error:
+        try:
+            records = response_or_error.get(wrapper_key).get(item_key) or []
+        except AttributeError:
+            records = []
+        total = int(response_or_error.get("totalresults") or 0)
+        return records, total
+    if response_or_error == deadlines.DEADLINE_EXCEEDED:
+        raise WhmcsTimeoutError(response_or_error)
+    raise WhmcsException(response_or_error if response_or_error else default_error)
+
+
+def iter_pages(build_parameters, wrapper_key, item_key, default_error, page_size=None):
+    """Iterate over the raw records of a paginated WHMCS list.
+
+    The next page is fetched in the background while the records of the
+    current page are consumed, within the deadline of the caller.
+
+    Args:
+        build_parameters (callable): Builds the payload of a page from the
+            ``limit_start`` and ``limit_num`` arguments.
+        wrapper_key (str): Key of the object wrapping the list. Eg orders.
+        item_key (str): Key of the list in the wrapper. Eg order.
+        default_error (str): Error raised if whmcs does not give one.
+        page_size (int): Optional. Number of records to request per page.
+    Yields:
+        dict: The records returned by whmcs.
+    Raises:
+        WhmcsException: If an error occurs.
+    """
+    page_size = page_size or DEFAULT_PAGE_SIZE
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    def fetch(limit_start):
+        parameters = build_parameters(limit_start, page_size)
+        return executor.submit(
+            contextvars.copy_context().run,
+            get_page,
+            parameters,
+            wrapper_key,
+            item_key,
+            default_error,
+        )
+
+    try:
+        limit_start = 0
+        next_page = fetch(limit_start)
+        while next_page is not None:
+            records, total = next_page.result()
+            limit_start += len(records)
+            has_more = len(records) == page_size and (not total or limit_start < total)
+            next_page = fetch(limit_start) if has_more else None
+            yield from records
+    finally:
+        executor.shutdown(wait=False)
 
-    if not is_successful:
-        default_error = "Unable to generate SSO token"
-        raise WhmcsException(response_or_error if response_or_error else default_error)
 
-    access_token = response_or_error.get("access_token")
-    redirect_url = response_or_error.get("redirect_url")
+#############
+# STREAMING #
+#############
 
-    cache.set(access_token_key, access_token, SIXTY_SECONDS)
-    return access_token, redirect_url
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def stream_records(parameters, wrapper_key, item_key, default_error):
+    """Iterate over the raw records of a WHMCS list as the response arrives.
+
+    The body is read from the socket in chunks and only the list is decoded,
+    one record at a time. Streamed requests are neither coalesced nor cached.
+
+    Args:
+        parameters (dict): Payload of the list request.
+        wrapper_key (str): Key of the object wrapping the list. Eg orders.
+        item_key (str): Key of the list in the wrapper. Eg order.
+        default_error (str): Error raised if whmcs does not give one.
+    Yields:
+        dict: The records returned by whmcs.
+    Raises:
+        WhmcsException: If an error occurs.
+    """
+    response = make_whmcs_network_request(parameters, stream=True)
+    parser = StreamingParser((wrapper_key, item_key))
+    with response:
+        try:
+            yield from parser.iter_items(response.iter_content(STREAM_CHUNK_SIZE))
+        except ValueError:
+            raise WhmcsException(default_error)
+        except RequestException:
+            raise WhmcsConnectionError("Could not reach whmcs server.")
+        if not response.ok or parser.metadata.get("result") != "success":
+            error = get_error_message(parser.metadata)
+            raise WhmcsException(error if error else default_error)
+
+
+#########
+# BATCH #
+#########
+
+DEFAULT_BATCH_CONCURRENCY = 8
+
+
+def batch(function, arguments, max_workers=None, rate_limit=None):
+    """Call a WHMCS function for many inputs concurrently.
+
+    Args:
+        function (callable): The function to call. Eg get_client.
+        arguments (iterable): The arguments of each call. Each item is either
+            a tuple of positional arguments or a dict of keyword arguments.
+        max_workers (int): Optional. Maximum number of concurrent calls.
+        rate_limit (float): Optional. Maximum number of calls per second.
+    Returns:
+        list: The result of each call, in the order of the arguments. Calls
+            that fail hold the WhmcsException they raised instead. Calls
+            share the deadline of the caller, waits for the rate limit
+            included.
+    """
+    limiter = TokenBucket(rate_limit) if rate_limit else None
+
+    def call(call_arguments):
+        try:
+            if limiter and not limiter.acquire(deadlines.get_remaining()):
+                raise WhmcsTimeoutError(deadlines.DEADLINE_EXCEEDED)
+            if isinstance(call_arguments, dict):
+                return function(**call_arguments)
+            return function(*call_arguments)
+        except WhmcsException as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers or DEFAULT_BATCH_CONCURRENCY) as executor:
+        # Each call runs in a copy of the caller's context, which holds the
+        # deadline. A context can only be entered by one thread at a time.
+        futures = [
+            executor.submit(contextvars.copy_context().run, call, call_arguments)
+            for call_arguments in arguments
+        ]
+        return [future.result() for future in futures]
+
+
+def map_clients(client_ids, max_workers=None, rate_limit=None):
+    """Retrieve many WHMCS clients concurrently.
+
+    Args:
+        client_ids (iterable): IDs of the clients to retrieve.
+        max_workers (int): Optional. Maximum number of concurrent calls.
+        rate_limit (float): Optional. Maximum number of calls per second.
+    Returns:
+        list: A Client or WhmcsException for each id, in order.
+    """
+    arguments = ({"client_id": client_id} for client_id in client_ids)
+    return batch(get_client, arguments, max_workers, rate_limit)
+
+
+def map_client_products(client_ids, max_workers=None, rate_limit=None):
+    """Retrieve the products of many WHMCS clients concurrently.
+
+    Args:
+        client_ids (iterable): IDs of the clients whose products to retrieve.
+        max_workers (int): Optional. Maximum number of concurrent calls.
+        rate_limit (float): Optional. Maximum number of calls per second.
+    Returns:
+        list: A list of ClientProduct or a WhmcsException for each id, in order.
+    """
+    arguments = ((client_id,) for client_id in client_ids)
+    return batch(get_client_products, arguments, max_workers, rate_limit)
@@ -8,6 +8,14 @@ setup(
     license="MIT",
     packages=find_packages(include=["olittwhmcs"]),
     install_requires=["django>=3.0", "requests"],
+    extras_require={
+        "aio": ["httpx"],
+        "compression": ["brotli", "zstandard"],
+        "export": ["numpy", "pyarrow"],
+        "fastjson": ["orjson"],
+        "opentelemetry": ["opentelemetry-api"],
+        "prometheus": ["prometheus_client"],
+    },
     setup_requires=["pytest-runner"],
     tests_require=["pytest", "responses"],
     test_suite="tests",
@@ -0,0 +1,41 @@
+import pytest
+import responses
+
+from olittwhmcs import actions, models, whmcs
+from olittwhmcs.exceptions import WhmcsException
+
+URL = 'https://www.olitt.com/billing/includes/api.php'
+
+
+def test_read_actions_are_taken_from_the_registry():
+    assert actions.is_read_action('GetOrders')
+    assert actions.is_read_action('GetClientsDetails')
+    assert not actions.is_read_action('AddOrder')
+    assert not actions.is_read_action('UnknownAction')
+
+
+def test_compile_parser_maps_records_into_models():
+    parse = actions.compile_parser(response_path=('orders', 'order'), model=models.Order)
+    orders = parse({'orders': {'order': [{'id': 1}, {'id': 2}]}})
+    assert [order.id for order in orders] == [1, 2]
+    assert parse({'orders': ''}) == []
+    parse = actions.compile_parser(result_keys=('orderid', 'invoiceid'))
+    assert parse({'orderid': 1, 'invoiceid': 2}) == (1, 2)
+
+
+@responses.activate
+def test_registered_actions_can_be_called_without_a_function():
+    actions.register(actions.Action(
+        'GetTickets', 'Unable to fetch tickets', response_path=('tickets', 'ticket'), read=True,
+    ))
+    try:
+        responses.add(responses.POST, URL, json={'result': 'success', 'tickets': {'ticket': [{'id': 7}]}})
+        responses.add(responses.POST, URL, json={'result': 'error'})
+        assert whmcs.call_action('GetTickets', clientid=1) == [{'id': 7}]
+        assert 'action=GetTickets' in responses.calls[0].request.body
+        assert 'clientid=1' in responses.calls[0].request.body
+        with pytest.raises(WhmcsException) as error:
+            whmcs.call_action('GetTickets', clientid=1)
+        assert error.value.message == 'Unable to fetch tickets'
+    finally:
+        del actions.ACTIONS['GetTickets']
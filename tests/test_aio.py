@@ -0,0 +1,123 @@
+import asyncio
+from unittest import mock
+
+import httpx
+import pytest
+from django.core.cache import cache
+from django.test import override_settings
+
+from olittwhmcs import aio
+from olittwhmcs.exceptions import WhmcsException
+from olittwhmcs.ratelimit import AdaptiveConcurrencyLimiter
+
+
+def mock_async_client(handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return mock.patch.object(aio, 'get_async_client', return_value=client)
+
+
+def test_get_orders_returns_the_orders_in_the_response():
+    def handler(request):
+        assert b'action=GetOrders' in request.content
+        orders = [{'id': 1, 'date': '2021-01-01 10:00:00'}, {'id': 2, 'date': '2021-01-02 10:00:00'}]
+        return httpx.Response(200, json={'result': 'success', 'orders': {'order': orders}})
+
+    with mock_async_client(handler):
+        orders = asyncio.run(aio.get_orders(client_id=3))
+    assert [order.id for order in orders] == [1, 2]
+
+
+def test_get_client_raises_the_whmcs_error_message():
+    def handler(request):
+        return httpx.Response(200, json={'result': 'error', 'message': 'Client Not Found'})
+
+    with mock_async_client(handler):
+        with pytest.raises(WhmcsException) as error:
+            asyncio.run(aio.get_client(client_id=3))
+    assert error.value.message == 'Client Not Found'
+
+
+def test_make_whmcs_network_request_raises_a_whmcs_connection_error_when_unreachable():
+    def handler(request):
+        raise httpx.ConnectError('unreachable')
+
+    with mock_async_client(handler):
+        is_successful, error = asyncio.run(aio.get_whmcs_response({}))
+    assert is_successful is False
+    assert error == 'Could not reach whmcs server.'
+
+
+def test_get_async_client_is_shared_within_an_event_loop():
+    async def get_clients():
+        clients = aio.get_async_client(), aio.get_async_client()
+        await aio.close_async_client()
+        return clients
+
+    first, second = asyncio.run(get_clients())
+    assert first is second
+
+
+def test_batch_returns_results_and_errors_in_input_order():
+    async def get_client(client_id):
+        if client_id == 2:
+            raise WhmcsException('Client Not Found')
+        return client_id * 10
+
+    results = asyncio.run(aio.batch(get_client, [(1,), {'client_id': 2}, (3,)], max_workers=2))
+    assert results[0] == 10
+    assert isinstance(results[1], WhmcsException)
+    assert results[2] == 30
+
+
+def test_get_sso_token_and_redirect_url_shares_the_token_pool():
+    cache.clear()
+
+    def handler(request):
+        return httpx.Response(200, json={'result': 'success', 'access_token': 'token', 'redirect_url': 'url'})
+
+    handler = mock.Mock(side_effect=handler)
+    with mock_async_client(handler):
+        first = asyncio.run(aio.get_sso_token_and_redirect_url(1, 'clientarea:invoices'))
+    assert first == ('token', 'url')
+    assert aio.sso.sso_token_pool.get(1, 'clientarea:invoices') == ('token', 'url')
+    assert handler.call_count == 1
+
+
+def test_requests_wait_for_the_concurrency_limiter():
+    in_flight = []
+
+    async def handler(request):
+        in_flight.append(limiter.in_flight)
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={'result': 'success', 'client': {}})
+
+    async def get_clients():
+        return await asyncio.gather(*(aio.get_whmcs_response({'action': 'UpdateClient'}) for _ in range(3)))
+
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=1)
+    with mock.patch.object(aio, 'get_limiters', return_value=(None, limiter)), mock_async_client(handler):
+        results = asyncio.run(get_clients())
+    assert all(is_successful for is_successful, _ in results)
+    assert in_flight == [1, 1, 1]
+    assert limiter.in_flight == 0
+
+
+@override_settings(WHMCS_RESPONSE_CACHE=True)
+def test_reads_share_the_response_cache_and_writes_invalidate_it():
+    cache.clear()
+    sent = []
+
+    def handler(request):
+        sent.append(request)
+        return httpx.Response(200, json={'result': 'success', 'client': {'id': 3}, 'clientid': 3})
+
+    async def call():
+        await aio.get_client(client_id=3)
+        await aio.get_client(client_id=3)
+        await aio.update_client(email='jane@example.com')
+        await aio.get_client(client_id=3)
+
+    with mock_async_client(handler):
+        asyncio.run(call())
+    actions = [dict(httpx.QueryParams(request.content.decode()))['action'] for request in sent]
+    assert actions == ['GetClientsDetails', 'UpdateClient', 'GetClientsDetails']
@@ -0,0 +1,112 @@
+import time
+from unittest import mock
+
+import pytest
+from django.test import override_settings
+
+from olittwhmcs.catalogue import ProductCatalogue, read_snapshot, write_snapshot
+
+
+def make_whmcs_product(pid, gid, module='cpanel', monthly='1.00'):
+    prices = {
+        'prefix': '$', 'monthly': monthly, 'quarterly': '3.00', 'semiannually': '6.00',
+        'annually': '12.00', 'biennially': '24.00', 'triennially': '36.00',
+    }
+    return {
+        'pid': pid, 'gid': gid, 'module': module, 'name': f'Product {pid}',
+        'pricing': {'USD': prices, 'KES': {**prices, 'prefix': 'KSh', 'monthly': '100.00'}},
+    }
+
+
+def test_catalogue_fetches_the_products_once():
+    fetch_products = mock.Mock(return_value=[make_whmcs_product(1, 1), make_whmcs_product(2, 2, 'plesk')])
+    catalogue = ProductCatalogue(ttl=60, fetch_products=fetch_products)
+
+    assert catalogue.get_product(1).name == 'Product 1'
+    assert [product.id for product in catalogue.get_group_products(2)] == [2]
+    assert [product.id for product in catalogue.get_module_products('plesk')] == [2]
+    assert fetch_products.call_count == 1
+
+
+def test_catalogue_keeps_a_view_per_currency():
+    catalogue = ProductCatalogue(ttl=60, fetch_products=lambda: [make_whmcs_product(1, 1)])
+
+    assert catalogue.get_product(1).pricing['monthly'] == 1.0
+    assert catalogue.get_product(1, 'kes').pricing['monthly'] == 100.0
+    assert catalogue.get_product(1, 'KES') is catalogue.get_product(1, 'kes')
+
+
+def test_catalogue_serves_stale_products_while_refreshing():
+    fetch_products = mock.Mock(side_effect=[[make_whmcs_product(1, 1)], [make_whmcs_product(1, 1, monthly='2.00')]])
+    catalogue = ProductCatalogue(ttl=0, fetch_products=fetch_products)
+    catalogue.get_products()
+
+    with mock.patch.object(catalogue, '_refresh_in_background') as refresh_in_background:
+        assert catalogue.get_product(1).pricing['monthly'] == 1.0
+    refresh_in_background.assert_called_once()
+
+    catalogue.refresh()
+    assert catalogue.get_product(1).pricing['monthly'] == 2.0
+
+
+def test_catalogue_invalidate_fetches_the_products_again():
+    fetch_products = mock.Mock(return_value=[make_whmcs_product(1, 1)])
+    catalogue = ProductCatalogue(ttl=60, fetch_products=fetch_products)
+
+    catalogue.get_products()
+    catalogue.invalidate()
+    catalogue.get_products()
+    assert fetch_products.call_count == 2
+
+
+def test_catalogue_starts_from_a_snapshot_saved_by_another_process(tmp_path):
+    path = str(tmp_path / 'catalogue.snapshot')
+    fetch_products = mock.Mock(return_value=[make_whmcs_product(1, 1)])
+    ProductCatalogue(ttl=60, fetch_products=fetch_products, snapshot_path=path).get_products()
+
+    catalogue = ProductCatalogue(ttl=60, fetch_products=fetch_products, snapshot_path=path)
+    assert catalogue.get_product(1).name == 'Product 1'
+    assert fetch_products.call_count == 1
+    assert catalogue.version == read_snapshot(path)[0]['version']
+
+
+def test_catalogue_ignores_snapshots_older_than_the_max_age(tmp_path):
+    path = str(tmp_path / 'catalogue.snapshot')
+    write_snapshot(path, [make_whmcs_product(1, 1)])
+    fetch_products = mock.Mock(return_value=[make_whmcs_product(2, 1)])
+    catalogue = ProductCatalogue(ttl=60, fetch_products=fetch_products, snapshot_path=path)
+
+    with override_settings(WHMCS_CATALOGUE_SNAPSHOT_MAX_AGE=60), \
+            mock.patch('time.time', return_value=time.time() + 120):
+        assert [product.id for product in catalogue.get_products()] == [2]
+    assert read_snapshot(path)[1] == [make_whmcs_product(2, 1)]
+
+
+def test_catalogue_refreshes_a_stale_snapshot_and_keeps_views_of_the_same_version(tmp_path):
+    path = str(tmp_path / 'catalogue.snapshot')
+    write_snapshot(path, [make_whmcs_product(1, 1)])
+    fetch_products = mock.Mock(return_value=[make_whmcs_product(1, 1)])
+    catalogue = ProductCatalogue(ttl=0, fetch_products=fetch_products, snapshot_path=path)
+
+    with mock.patch.object(catalogue, '_refresh_in_background') as refresh_in_background:
+        product = catalogue.get_product(1)
+    refresh_in_background.assert_called_once()
+    catalogue._background_refresh()
+    assert fetch_products.call_count == 1
+    assert catalogue.get_product(1) is product
+
+
+def test_read_snapshot_ignores_missing_and_corrupt_files(tmp_path):
+    path = tmp_path / 'catalogue.snapshot'
+    assert read_snapshot(str(path)) is None
+    path.write_bytes(b'{"format": 1}\n[{"pid": ')
+    assert read_snapshot(str(path)) is None
+
+
+@pytest.mark.parametrize('backend', ['json', 'orjson'])
+def test_read_snapshot_decodes_the_mapped_file_with_each_backend(tmp_path, backend):
+    pytest.importorskip(backend)
+    path = str(tmp_path / 'catalogue.snapshot')
+    write_snapshot(path, [make_whmcs_product(1, 1)])
+    with override_settings(WHMCS_JSON_BACKEND=backend):
+        assert read_snapshot(path)[1] == [make_whmcs_product(1, 1)]
@@ -0,0 +1,54 @@
+from unittest import mock
+
+import pytest
+import responses
+
+from olittwhmcs import network
+from olittwhmcs.circuitbreaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakerRegistry
+from olittwhmcs.exceptions import WhmcsConnectionError
+
+
+def test_circuit_breaker_opens_after_the_failure_threshold():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=30)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_circuit_breaker_lets_limited_probes_through_once_recovered():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0, half_open_calls=1)
+    breaker.record_failure()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_circuit_breaker_reopens_when_a_probe_fails():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0)
+    breaker.record_failure()
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker._state == OPEN
+
+
+def test_registry_opens_the_endpoint_breaker_for_every_action():
+    registry = CircuitBreakerRegistry(failure_threshold=2)
+    registry.record_failure('https://whmcs', 'GetOrders')
+    registry.record_failure('https://whmcs', 'GetInvoices')
+    assert not registry.allow('https://whmcs', 'GetProducts')
+
+
+@responses.activate
+def test_make_whmcs_network_request_fails_fast_while_the_breaker_is_open():
+    url = 'https://www.olitt.com/billing/includes/api.php'
+    responses.add(responses.POST, url, status=500)
+    with mock.patch.object(network, 'get_circuit_breakers', return_value=CircuitBreakerRegistry(failure_threshold=1)):
+        network.make_whmcs_network_request({'action': 'AddOrder'})
+        with pytest.raises(WhmcsConnectionError) as error:
+            network.make_whmcs_network_request({'action': 'AddOrder'})
+    assert error.value.message == 'Whmcs server is unavailable.'
+    assert len(responses.calls) == 1
@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from olittwhmcs import compactmodels, models
+
+WHMCS_INVOICE = {
+    'id': 1, 'invoicenum': '', 'userid': 2, 'date': '2021-03-01', 'duedate': '2021-03-08',
+    'datepaid': '0000-00-00 00:00:00', 'last_capture_attempt': '2021-03-02 10:00:00',
+    'subtotal': '10.00', 'total': '11.60', 'credit': '0.00', 'tax': '1.60', 'tax2': '0.00',
+    'taxrate': '16.00', 'taxrate2': '0.00', 'status': 'Unpaid', 'paymentmethod': 'mpesa', 'notes': '',
+}
+
+WHMCS_ORDER = {
+    'id': 3, 'ordernum': '123', 'userid': 2, 'date': '2021-03-01 09:30:00', 'status': 'Pending',
+    'lineitems': {'lineitem': [{'type': 'product', 'relid': 4, 'amount': 'KSh1,200.50KES'}]},
+}
+
+
+def test_compact_invoice_has_the_same_attributes_as_the_invoice_model():
+    invoice = models.Invoice(WHMCS_INVOICE)
+    compact_invoice = compactmodels.Invoice(WHMCS_INVOICE)
+    for attribute in vars(invoice):
+        assert getattr(compact_invoice, attribute) == getattr(invoice, attribute), attribute
+
+
+def test_compact_order_has_the_same_attributes_as_the_order_model():
+    order = models.Order(WHMCS_ORDER)
+    compact_order = compactmodels.Order(WHMCS_ORDER)
+    for attribute in vars(order):
+        assert getattr(compact_order, attribute) == getattr(order, attribute), attribute
+
+
+def test_compact_models_decode_fields_once_and_have_no_instance_dict():
+    invoice = compactmodels.Invoice(WHMCS_INVOICE)
+    assert not hasattr(invoice, '__dict__')
+    assert invoice.date_created == datetime(2021, 3, 1)
+    assert invoice.date_created is invoice.date_created
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import threading
+import time
+from unittest import mock
+
+import httpx
+import pytest
+import requests
+import responses
+from django.test import override_settings
+
+from olittwhmcs import aio, deadlines, network, whmcs
+from olittwhmcs.circuitbreaker import CircuitBreakerRegistry
+from olittwhmcs.exceptions import WhmcsTimeoutError
+
+URL = 'https://www.olitt.com/billing/includes/api.php'
+
+
+##############
+# deadline() #
+##############
+
+def test_deadline_sets_the_remaining_time_of_the_block():
+    assert deadlines.get_remaining() is None
+    with deadlines.deadline(10):
+        assert 9 < deadlines.get_remaining() <= 10
+    assert deadlines.get_expiry() is None
+
+
+def test_nested_deadlines_can_only_shorten_the_enclosing_one():
+    with deadlines.deadline(1):
+        with deadlines.deadline(60):
+            assert deadlines.get_remaining() <= 1
+        with deadlines.deadline(0.5):
+            assert deadlines.get_remaining() <= 0.5
+
+
+def test_get_remaining_raises_a_timeout_error_once_the_deadline_passes():
+    with deadlines.deadline(0):
+        assert deadlines.has_expired()
+        with pytest.raises(WhmcsTimeoutError):
+            deadlines.get_remaining()
+
+
+##################
+# with_timeout() #
+##################
+
+def test_with_timeout_bounds_the_whole_iteration_of_a_generator():
+    @deadlines.with_timeout
+    def generate():
+        for _ in range(3):
+            yield deadlines.get_remaining()
+
+    items = generate(timeout=10)
+    first = next(items)
+    assert deadlines.get_expiry() is None
+    assert list(items)[-1] <= first <= 10
+
+
+def test_with_timeout_sets_the_deadline_of_coroutines():
+    @deadlines.with_timeout
+    async def call():
+        return deadlines.get_remaining()
+
+    assert asyncio.run(call(timeout=5)) <= 5
+    assert asyncio.run(call()) is None
+
+
+##################
+# get_timeouts() #
+##################
+
+@override_settings(WHMCS_ACTION_TIMEOUTS={'GetInvoices': (2, 90), 'GetProducts': 45})
+def test_get_timeouts_honours_per_action_timeouts():
+    assert network.get_timeouts('GetInvoices') == (2, 90)
+    assert network.get_timeouts('GetProducts') == (network.DEFAULT_CONNECT_TIMEOUT, 45)
+    assert network.get_timeouts('GetOrders') == (
+        network.DEFAULT_CONNECT_TIMEOUT, network.DEFAULT_READ_TIMEOUT
+    )
+
+
+def test_get_timeouts_are_capped_by_the_deadline():
+    with deadlines.deadline(1):
+        connect_timeout, read_timeout = network.get_timeouts()
+    assert connect_timeout <= 1 and read_timeout <= 1
+
+
+########################
+# deadline propagation #
+########################
+
+@responses.activate
+def test_requests_are_sent_with_the_remaining_time_as_timeout():
+    responses.add(responses.POST, URL, json={'result': 'success', 'client': {}}, status=200)
+    with mock.patch.object(network.get_session(), 'post', wraps=network.get_session().post) as post:
+        whmcs.get_client(client_id=1, timeout=2)
+    connect_timeout, read_timeout = post.call_args.kwargs['timeout']
+    assert connect_timeout <= 2 and read_timeout <= 2
+
+
+@responses.activate
+def test_calls_past_their_deadline_raise_a_timeout_error():
+    responses.add(responses.POST, URL, json={'result': 'success', 'client': {}}, status=200)
+    with pytest.raises(WhmcsTimeoutError):
+        whmcs.get_client(client_id=1, timeout=0)
+    assert len(responses.calls) == 0
+
+
+@responses.activate
+def test_retries_stop_at_the_deadline():
+    def time_out(request):
+        time.sleep(0.05)
+        raise requests.exceptions.ReadTimeout()
+
+    responses.add_callback(responses.POST, URL, callback=time_out)
+    with pytest.raises(WhmcsTimeoutError), deadlines.deadline(0.05):
+        network.make_whmcs_network_request({'action': 'GetProducts'})
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_batch_calls_share_the_deadline_of_the_caller():
+    responses.add(responses.POST, URL, json={'result': 'success', 'client': {}}, status=200)
+    with deadlines.deadline(0):
+        results = whmcs.batch(whmcs.get_client, [{'client_id': 1}, {'client_id': 2}])
+    assert all(isinstance(result, WhmcsTimeoutError) for result in results)
+
+
+def test_batch_calls_stop_waiting_for_the_rate_limit_at_the_deadline():
+    with deadlines.deadline(0.2):
+        results = whmcs.batch(lambda client_id: client_id, [(1,), (2,), (3,)], rate_limit=1)
+    assert results[0] == 1
+    assert all(isinstance(result, WhmcsTimeoutError) for result in results[1:])
+
+
+def test_async_calls_past_their_deadline_raise_a_timeout_error():
+    async def call():
+        try:
+            return await aio.get_client(client_id=1, timeout=0)
+        finally:
+            await aio.close_async_client()
+
+    with pytest.raises(WhmcsTimeoutError):
+        asyncio.run(call())
+
+
+@responses.activate
+def test_a_half_open_probe_cut_short_by_the_deadline_is_given_back():
+    def time_out(request):
+        time.sleep(0.05)
+        raise requests.exceptions.ReadTimeout()
+
+    responses.add_callback(responses.POST, URL, callback=time_out)
+    responses.add(responses.POST, URL, json={'result': 'success'}, status=200)
+    registry = CircuitBreakerRegistry(failure_threshold=1, recovery_timeout=0, half_open_calls=1)
+    registry.record_failure(URL, 'GetProducts')
+    with mock.patch.object(network, 'get_circuit_breakers', return_value=registry):
+        with pytest.raises(WhmcsTimeoutError), deadlines.deadline(0.05):
+            network.make_whmcs_network_request({'action': 'GetProducts'})
+        assert network.make_whmcs_network_request({'action': 'GetProducts'}).ok
+
+
+######################
+# coalesced requests #
+######################
+
+@responses.activate
+def test_a_coalesced_request_outlives_the_deadline_of_the_caller_that_made_it():
+    started = threading.Event()
+
+    def respond(request):
+        if not started.is_set():
+            started.set()
+            time.sleep(0.1)
+            raise requests.exceptions.ReadTimeout()
+        return 200, {}, json.dumps({'result': 'success', 'client': {}})
+
+    responses.add_callback(responses.POST, URL, callback=respond)
+    parameters = {'action': 'GetClientsDetails', 'clientid': 1}
+
+    def lead():
+        with deadlines.deadline(0.05):
+            return network.get_whmcs_response(parameters)
+
+    leader = threading.Thread(target=lead)
+    leader.start()
+    started.wait(1)
+    result = network.get_whmcs_response(parameters)
+    leader.join()
+    assert result == (True, {'result': 'success', 'client': {}})
+
+
+def test_an_async_coalesced_request_outlives_the_deadline_of_the_task_that_made_it():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        read_timeout = request.extensions['timeout']['read']
+        if read_timeout is not None and read_timeout < 0.1:
+            await asyncio.sleep(read_timeout)
+            raise httpx.ReadTimeout('timed out', request=request)
+        await asyncio.sleep(0.1)
+        return httpx.Response(200, json={'result': 'success', 'client': {}})
+
+    async def get_details():
+        parameters = {'action': 'GetClientsDetails', 'clientid': 1}
+
+        async def lead():
+            with deadlines.deadline(0.05):
+                return await aio.get_whmcs_response(parameters)
+
+        return await asyncio.gather(lead(), aio.get_whmcs_response(parameters))
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with mock.patch.object(aio, 'get_async_client', return_value=client):
+        leader, follower = asyncio.run(get_details())
+    assert leader == (False, deadlines.DEADLINE_EXCEEDED)
+    assert follower == (True, {'result': 'success', 'client': {}})
+    assert len(calls) == 1
@@ -0,0 +1,56 @@
+import math
+
+import pytest
+
+from olittwhmcs.export import INVOICE_COLUMNS, ColumnarTable
+
+WHMCS_INVOICES = [
+    {'id': '1', 'userid': '7', 'date': '2021-01-05', 'duedate': '2021-01-12', 'datepaid': '2021-01-06 10:00:00',
+     'subtotal': '10.00', 'tax': '1.60', 'tax2': '0.00', 'credit': '0.00', 'total': '11.60',
+     'status': 'Paid', 'paymentmethod': 'mpesa'},
+    {'id': '2', 'userid': '7', 'date': '2021-02-05', 'duedate': '2021-02-12', 'datepaid': '0000-00-00 00:00:00',
+     'subtotal': '20.00', 'tax': '3.20', 'tax2': '0.00', 'credit': '0.00', 'total': '23.20',
+     'status': 'Unpaid', 'paymentmethod': 'mpesa'},
+    {'id': '3', 'userid': '8', 'date': '2021-02-07', 'duedate': '2021-02-14', 'datepaid': '2021-02-08 09:00:00',
+     'subtotal': '5.00', 'tax': '0.80', 'tax2': '0.00', 'credit': '0.00', 'total': '5.80',
+     'status': 'Paid', 'paymentmethod': 'paypal'},
+]
+
+
+def test_columnar_table_stores_typed_and_dictionary_encoded_columns():
+    table = ColumnarTable(INVOICE_COLUMNS).extend(WHMCS_INVOICES)
+    assert len(table) == 3
+    assert list(table.columns['id']) == [1, 2, 3]
+    assert list(table.columns['total']) == [11.6, 23.2, 5.8]
+    assert table.columns['status'].categories == ['Paid', 'Unpaid']
+    assert list(table.columns['status'].codes) == [0, 1, 0]
+
+
+def test_columnar_table_aggregates_amounts():
+    pytest.importorskip('numpy')
+    table = ColumnarTable(INVOICE_COLUMNS).extend(WHMCS_INVOICES)
+    totals = table.sum_by('status', 'total')
+    assert math.isclose(totals['Paid'], 17.4)
+    assert math.isclose(totals['Unpaid'], 23.2)
+    revenue = table.sum_by_month('date_paid', 'total')
+    assert list(revenue) == ['2021-01', '2021-02']
+    assert math.isclose(revenue['2021-02'], 5.8)
+
+
+def test_columnar_table_converts_to_numpy_records():
+    numpy = pytest.importorskip('numpy')
+    records = ColumnarTable(INVOICE_COLUMNS).extend(WHMCS_INVOICES).to_numpy()
+    assert records.id.tolist() == [1, 2, 3]
+    assert records.status.tolist() == ['Paid', 'Unpaid', 'Paid']
+    assert records.date_created[0] == numpy.datetime64('2021-01-05T00:00:00')
+    assert numpy.isnat(records.date_paid[1])
+
+
+def test_columnar_table_converts_to_arrow(tmp_path):
+    pyarrow = pytest.importorskip('pyarrow')
+    table = ColumnarTable(INVOICE_COLUMNS).extend(WHMCS_INVOICES)
+    arrow_table = table.to_arrow()
+    assert arrow_table.column('status').type == pyarrow.dictionary(pyarrow.int64(), pyarrow.string())
+    assert arrow_table.column('date_paid').null_count == 1
+    table.write_parquet(str(tmp_path / 'invoices.parquet'))
+    assert (tmp_path / 'invoices.parquet').exists()
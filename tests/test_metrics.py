@@ -0,0 +1,94 @@
+import gzip
+import json
+import socket
+
+import pytest
+import responses
+
+from olittwhmcs import metrics, network
+from olittwhmcs.responsecache import ResponseCache
+
+URL = 'https://www.olitt.com/billing/includes/api.php'
+
+
+@pytest.fixture
+def recorded():
+    events = []
+    exporter = metrics.add_exporter(metrics.CallbackExporter(lambda *event: events.append(event)))
+    yield events
+    metrics.remove_exporter(exporter)
+
+
+def test_hooks_are_disabled_without_exporters():
+    assert not metrics.is_enabled()
+
+
+@responses.activate
+def test_requests_report_latency_bytes_and_errors(recorded):
+    responses.add(responses.POST, URL, json={'result': 'error', 'message': 'Invalid client'})
+    network.fetch_whmcs_response({'action': 'AddOrder', 'clientid': 1})
+    names = {(kind, name): tags for kind, name, _, tags in recorded}
+    assert names[('histogram', metrics.REQUEST_DURATION)] == {'action': 'AddOrder', 'status': '200'}
+    assert names[('histogram', metrics.CALL_DURATION)] == {'action': 'AddOrder', 'outcome': 'whmcs'}
+    assert names[('counter', metrics.ERRORS)] == {'action': 'AddOrder', 'reason': 'whmcs'}
+    sizes = {name: value for kind, name, value, _ in recorded if kind == 'counter'}
+    assert sizes[metrics.BYTES_SENT] == len('action=AddOrder&clientid=1')
+    assert sizes[metrics.BYTES_RECEIVED] > 0
+
+
+@responses.activate
+def test_compressed_responses_report_the_bytes_saved(recorded):
+    body = json.dumps({'result': 'success', 'products': {'product': [{'name': 'Hosting'}] * 100}}).encode()
+    responses.add(responses.POST, URL, body=gzip.compress(body), headers={'Content-Encoding': 'gzip'})
+    assert network.fetch_whmcs_response({'action': 'GetProducts'})[0]
+    saved = [(value, tags) for kind, name, value, tags in recorded if name == metrics.BYTES_SAVED]
+    assert saved == [(len(body) - len(gzip.compress(body)), {'action': 'GetProducts', 'encoding': 'gzip'})]
+
+
+def test_summary_exporter_reports_percentiles_and_cache_hit_ratio():
+    exporter = metrics.add_exporter(metrics.SummaryExporter())
+    try:
+        cache = ResponseCache(backend=None, ttls={'GetClientsDetails': 60})
+        parameters = {'action': 'GetClientsDetails', 'clientid': 99}
+        for _ in range(4):
+            cache.get_response(parameters, lambda parameters: (True, {'result': 'success'}))
+        for duration in (0.1, 0.2, 0.3, 0.4):
+            metrics.observe(metrics.CALL_DURATION, duration, action='GetOrders', outcome='success')
+        summary = exporter.get_summary()
+    finally:
+        metrics.remove_exporter(exporter)
+    assert summary['GetClientsDetails']['cache_hit_ratio'] == 0.75
+    assert summary['GetOrders']['calls'] == 4
+    assert summary['GetOrders']['p50'] == 0.2
+    assert summary['GetOrders']['p99'] == 0.4
+
+
+def test_summary_exporter_keeps_a_bounded_sample_of_latencies():
+    exporter = metrics.SummaryExporter(reservoir_size=10)
+    for duration in range(1000):
+        exporter.observe(metrics.CALL_DURATION, duration, {'action': 'GetOrders'})
+    summary = exporter.get_summary()['GetOrders']
+    assert len(exporter._histograms[(metrics.CALL_DURATION, 'GetOrders')].values) == 10
+    assert summary['calls'] == 1000
+    assert summary['max'] == 999
+
+
+def test_statsd_exporter_sends_tagged_lines():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', 0))
+    server.settimeout(1)
+    exporter = metrics.StatsdExporter('127.0.0.1', server.getsockname()[1])
+    exporter.increment(metrics.RETRIES, 1, {'action': 'GetOrders'})
+    assert server.recv(1024) == b'olittwhmcs.whmcs_retries_total:1|c|#action:GetOrders'
+    server.close()
+
+
+def test_prometheus_exporter_registers_labelled_metrics():
+    prometheus_client = pytest.importorskip('prometheus_client')
+    registry = prometheus_client.CollectorRegistry()
+    exporter = metrics.PrometheusExporter(registry)
+    exporter.observe(metrics.CALL_DURATION, 0.5, {'action': 'GetOrders', 'outcome': 'success'})
+    value = registry.get_sample_value(
+        'whmcs_call_duration_seconds_count', {'action': 'GetOrders', 'outcome': 'success'}
+    )
+    assert value == 1
@@ -1,8 +1,11 @@
+from unittest import mock
+
 import pytest
 import requests
 import responses
+from django.test import override_settings
 
-from olittwhmcs import network
+from olittwhmcs import jsonbackends, network
 from olittwhmcs.exceptions import WhmcsConnectionError
 
 
@@ -28,6 +31,70 @@ def test_make_whmcs_network_request_raises_a_whmcs_connection_error_when_an_inva
         network.make_whmcs_network_request({})
 
 
+@responses.activate
+def test_make_whmcs_network_request_reuses_the_shared_session():
+    responses.add(responses.POST, 'https://www.olitt.com/billing/includes/api.php', json={}, status=200)
+    network.make_whmcs_network_request({})
+    network.make_whmcs_network_request({})
+    assert len(responses.calls) == 2
+    assert network.get_session() is network.get_session()
+
+
+@responses.activate
+def test_make_whmcs_network_request_retries_read_actions_on_server_errors():
+    url = 'https://www.olitt.com/billing/includes/api.php'
+    responses.add(responses.POST, url, status=503)
+    responses.add(responses.POST, url, json={'result': 'success'}, status=200)
+    with mock.patch('time.sleep'):
+        response = network.make_whmcs_network_request({'action': 'GetProducts'})
+    assert response.status_code == 200
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_make_whmcs_network_request_does_not_retry_mutating_actions():
+    url = 'https://www.olitt.com/billing/includes/api.php'
+    responses.add(responses.POST, url, body=requests.exceptions.ConnectionError())
+    with mock.patch('time.sleep'), pytest.raises(WhmcsConnectionError):
+        network.make_whmcs_network_request({'action': 'AddOrder'})
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_make_whmcs_network_request_retries_mutating_actions_that_never_connected():
+    url = 'https://www.olitt.com/billing/includes/api.php'
+    responses.add(responses.POST, url, body=requests.exceptions.ConnectTimeout())
+    responses.add(responses.POST, url, json={'result': 'success'}, status=200)
+    with mock.patch('time.sleep'):
+        response = network.make_whmcs_network_request({'action': 'AddOrder'})
+    assert response.status_code == 200
+
+
+#################
+# get_session() #
+#################
+
+
+def test_create_session_advertises_the_supported_compressions():
+    assert network.create_session().headers['Accept-Encoding'].startswith('gzip, deflate')
+    with override_settings(WHMCS_ACCEPT_ENCODING='identity'):
+        assert network.create_session().headers['Accept-Encoding'] == 'identity'
+
+
+def test_get_session_creates_a_new_session_in_a_forked_process():
+    session = network.get_session()
+    with mock.patch('os.getpid', return_value=-1):
+        child_session = network.get_session()
+    assert child_session is not session
+    network.close_session()
+
+
+def test_close_session_discards_the_shared_session():
+    session = network.get_session()
+    network.close_session()
+    assert network.get_session() is not session
+
+
 #######################
 # get_response_data() #
 #######################
@@ -54,6 +121,34 @@ def test_get_response_data_with_a_blank_json_body_returns_none():
     assert response_data is None
 
 
+@responses.activate
+@pytest.mark.parametrize('body', [[], ['success'], 'null'])
+def test_fetch_whmcs_response_fails_on_bodies_that_are_not_a_json_object(body):
+    url = 'https://www.olitt.com/billing/includes/api.php'
+    if isinstance(body, str):
+        responses.add(responses.POST, url, body=body, status=200)
+    else:
+        responses.add(responses.POST, url, json=body, status=200)
+    assert network.fetch_whmcs_response({'action': 'GetProducts'}) == (False, None)
+
+
+@pytest.mark.parametrize('backend', ['json', 'orjson'])
+def test_get_decoder_decodes_bytes_with_each_backend(backend):
+    pytest.importorskip(backend)
+    name, loads = jsonbackends.get_decoder(backend)
+    assert name == backend
+    assert loads(b'{"result": "success", "total": 1.5}') == {'result': 'success', 'total': 1.5}
+
+
+def test_get_response_data_falls_back_to_the_standard_library():
+    def reject(data):
+        raise ValueError('unexpected character')
+
+    response = mock.Mock(content='\ufeff{"result": "success"}'.encode('utf-8'))
+    with mock.patch.object(jsonbackends, 'get_decoder', return_value=('orjson', reject)):
+        assert network.get_response_data(response) == {'result': 'success'}
+
+
 #######################
 # get_error_message() #
 #######################
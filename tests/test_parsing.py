@@ -0,0 +1,34 @@
+from datetime import datetime
+from decimal import Decimal
+
+from olittwhmcs.parsing import parse_amount, parse_date, parse_money
+
+
+def test_parse_date_reads_whmcs_dates_and_date_times():
+    assert parse_date('2021-03-01', '%Y-%m-%d') == datetime(2021, 3, 1)
+    assert parse_date('2021-03-01 09:30:05') == datetime(2021, 3, 1, 9, 30, 5)
+
+
+def test_parse_date_returns_none_for_empty_and_sentinel_dates():
+    assert parse_date(None) is None
+    assert parse_date('') is None
+    assert parse_date('0000-00-00') is None
+    assert parse_date('0000-00-00 00:00:00') is None
+    assert parse_date('2021-02-30') is None
+
+
+def test_parse_date_falls_back_to_the_given_format():
+    assert parse_date('01/03/2021', '%d/%m/%Y') == datetime(2021, 3, 1)
+
+
+def test_parse_money_reads_plain_and_formatted_amounts():
+    assert parse_money('10.50') == Decimal('10.50')
+    assert parse_money('KSh1,200.50KES') == Decimal('1200.50')
+    assert parse_money('$-1.00 USD') == Decimal('-1.00')
+    assert parse_money('free') is None
+
+
+def test_parse_amount_returns_floats():
+    assert parse_amount('10.50') == 10.5
+    assert parse_amount('KSh1,200.50KES') == 1200.5
+    assert parse_amount(None) is None
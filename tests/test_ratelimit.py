@@ -0,0 +1,73 @@
+import asyncio
+import threading
+from unittest import mock
+
+from django.core.cache import cache
+
+from olittwhmcs.ratelimit import AdaptiveConcurrencyLimiter, SharedRateLimiter, TokenBucket
+
+
+def test_token_bucket_allows_a_burst_then_spaces_requests():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert 0 < bucket.reserve() <= 0.1
+
+
+def test_shared_rate_limiter_waits_for_the_next_window_once_full():
+    limiter = SharedRateLimiter(rate=1, cache=cache, key_prefix='test_rate_limit')
+    with mock.patch('olittwhmcs.ratelimit.time') as time_mock:
+        time_mock.time.side_effect = [100.5, 100.6, 101.0]
+        limiter.acquire()
+        limiter.acquire()
+    time_mock.sleep.assert_called_once()
+
+
+def test_adaptive_concurrency_limiter_grows_on_success_and_backs_off_on_failure():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4, latency_target=1.0)
+    for _ in range(8):
+        limiter.acquire()
+        limiter.release(latency=0.1)
+    assert limiter.limit == 5
+
+    limiter.acquire()
+    limiter.release(latency=0.1, failed=True)
+    assert limiter.limit == 2
+    assert limiter.in_flight == 0
+
+
+def test_limiters_give_up_once_the_wait_exceeds_the_timeout():
+    bucket = TokenBucket(rate=1, capacity=1)
+    assert bucket.acquire(timeout=0)
+    assert not bucket.acquire(timeout=0.1)
+    # The token of the refused request was given back.
+    assert 0.9 < bucket.reserve() <= 1
+
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, latency_target=1.0)
+    assert limiter.acquire(timeout=0)
+    assert not limiter.acquire(timeout=0.01)
+    assert limiter.in_flight == 1
+
+
+def test_limiters_can_be_awaited():
+    async def acquire_twice(limiter):
+        return await limiter.acquire_async(0.5), await limiter.acquire_async(0.01)
+
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, latency_target=1.0)
+    assert asyncio.run(acquire_twice(limiter)) == (True, False)
+    bucket = TokenBucket(rate=10, capacity=1)
+    assert asyncio.run(acquire_twice(bucket)) == (True, False)
+
+
+def test_shared_rate_limiter_reserves_off_the_event_loop():
+    limiter = SharedRateLimiter(rate=1, cache=cache, key_prefix='test_async_rate_limit')
+    threads = []
+    cache_incr = cache.incr
+
+    def incr(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return cache_incr(*args, **kwargs)
+
+    with mock.patch.object(cache, 'incr', side_effect=incr):
+        assert asyncio.run(limiter.acquire_async(0.01))
+    assert threads and threading.main_thread() not in threads
@@ -0,0 +1,100 @@
+from unittest import mock
+
+from django.core.cache import cache
+
+from olittwhmcs.responsecache import ResponseCache
+
+
+def client_parameters(client_id):
+    return {'action': 'GetClientsDetails', 'clientid': client_id, 'secret': 'secret'}
+
+
+def test_response_cache_serves_repeated_reads_from_the_cache():
+    cache.clear()
+    response_cache = ResponseCache()
+    fetch_response = mock.Mock(return_value=(True, {'result': 'success', 'client': {'id': 1}}))
+
+    first = response_cache.get_response(client_parameters(1), fetch_response)
+    second = response_cache.get_response(client_parameters(1), fetch_response)
+
+    assert first == second == (True, {'result': 'success', 'client': {'id': 1}})
+    assert fetch_response.call_count == 1
+
+
+def test_response_cache_shares_responses_between_processes():
+    cache.clear()
+    fetch_response = mock.Mock(return_value=(True, {'result': 'success'}))
+
+    ResponseCache().get_response(client_parameters(1), fetch_response)
+    ResponseCache().get_response(client_parameters(1), fetch_response)
+
+    assert fetch_response.call_count == 1
+
+
+def test_response_cache_does_not_cache_errors_or_write_actions():
+    cache.clear()
+    response_cache = ResponseCache()
+    fetch_error = mock.Mock(return_value=(False, 'Client Not Found'))
+    response_cache.get_response(client_parameters(1), fetch_error)
+    response_cache.get_response(client_parameters(1), fetch_error)
+    assert fetch_error.call_count == 2
+
+    fetch_response = mock.Mock(return_value=(True, {'result': 'success'}))
+    response_cache.get_response({'action': 'AddOrder', 'clientid': 1}, fetch_response)
+    response_cache.get_response({'action': 'AddOrder', 'clientid': 1}, fetch_response)
+    assert fetch_response.call_count == 2
+
+
+def test_invalidating_a_client_only_drops_its_responses():
+    cache.clear()
+    response_cache = ResponseCache()
+    fetch_response = mock.Mock(return_value=(True, {'result': 'success'}))
+    response_cache.get_response(client_parameters(1), fetch_response)
+    response_cache.get_response(client_parameters(2), fetch_response)
+
+    response_cache.invalidate_client(1)
+    response_cache.get_response(client_parameters(1), fetch_response)
+    response_cache.get_response(client_parameters(2), fetch_response)
+
+    assert fetch_response.call_count == 3
+
+
+def test_invalidating_a_service_drops_the_responses_of_its_client():
+    cache.clear()
+    response_cache = ResponseCache()
+    products = {'result': 'success', 'products': {'product': [{'id': 7}]}}
+    fetch_response = mock.Mock(return_value=(True, products))
+    parameters = {'action': 'GetClientsProducts', 'clientid': '1'}
+    response_cache.get_response(parameters, fetch_response)
+
+    response_cache.invalidate_service(7)
+    response_cache.get_response(parameters, fetch_response)
+
+    assert fetch_response.call_count == 2
+
+
+def test_invalidating_a_client_by_id_drops_its_details_looked_up_by_email():
+    cache.clear()
+    response_cache = ResponseCache()
+    details = {'result': 'success', 'userid': 1, 'client': {'id': 1, 'email': 'jane@example.com'}}
+    fetch_response = mock.Mock(return_value=(True, details))
+    parameters = {'action': 'GetClientsDetails', 'email': 'jane@example.com'}
+    response_cache.get_response(parameters, fetch_response)
+
+    response_cache.invalidate_client(1)
+    response_cache.get_response(parameters, fetch_response)
+
+    assert fetch_response.call_count == 2
+
+
+def test_cache_hits_in_process_do_not_read_the_generations_again():
+    cache.clear()
+    response_cache = ResponseCache()
+    fetch_response = mock.Mock(return_value=(True, {'result': 'success'}))
+    response_cache.get_response(client_parameters(1), fetch_response)
+
+    with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+        response_cache.get_response(client_parameters(1), fetch_response)
+
+    get_many.assert_not_called()
+    assert fetch_response.call_count == 1
@@ -0,0 +1,146 @@
+import asyncio
+import time
+from unittest import mock
+
+import httpx
+import pytest
+import requests
+import responses
+from django.test import override_settings
+
+from olittwhmcs import aio, deadlines, network
+from olittwhmcs.circuitbreaker import CircuitBreakerRegistry
+from olittwhmcs.exceptions import WhmcsTimeoutError
+from olittwhmcs.ratelimit import AdaptiveConcurrencyLimiter
+from olittwhmcs.router import Endpoint, Router, parse_endpoints
+
+PRIMARY = 'https://primary.example.com/billing'
+REPLICA = 'https://replica.example.com/billing'
+ENDPOINTS = [{'url': PRIMARY, 'role': 'write'}, {'url': REPLICA, 'role': 'read'}]
+
+
+def create_router(**options):
+    return Router(parse_endpoints(ENDPOINTS), **options)
+
+
+def test_router_sends_reads_to_the_endpoint_with_the_lowest_latency():
+    router = create_router()
+    router.record(f'{PRIMARY}/includes/api.php', 0.5, True)
+    router.record(f'{REPLICA}/includes/api.php', 0.1, True)
+    assert router.get_url('GetClientsDetails') == f'{REPLICA}/includes/api.php'
+    for _ in range(10):
+        router.record(f'{REPLICA}/includes/api.php', 2.0, True)
+    assert router.get_url('GetClientsDetails') == f'{PRIMARY}/includes/api.php'
+
+
+def test_router_pins_writes_to_the_primary():
+    router = create_router()
+    router.record(f'{PRIMARY}/includes/api.php', 0.5, True)
+    router.record(f'{REPLICA}/includes/api.php', 0.1, True)
+    assert router.get_url('AddOrder') == f'{PRIMARY}/includes/api.php'
+    assert router.get_url('AddInvoicePayment') == f'{PRIMARY}/includes/api.php'
+
+
+def test_router_skips_unhealthy_endpoints_and_endpoints_with_an_open_breaker():
+    circuit_breakers = CircuitBreakerRegistry(failure_threshold=1)
+    router = create_router(circuit_breakers=circuit_breakers, failure_threshold=2)
+    router.record(f'{REPLICA}/includes/api.php', 0.1, False)
+    router.record(f'{REPLICA}/includes/api.php', 0.1, False)
+    assert router.get_url('GetOrders') == f'{PRIMARY}/includes/api.php'
+    router.record(f'{REPLICA}/includes/api.php', 0.1, True)
+    circuit_breakers.record_failure(f'{REPLICA}/includes/api.php', 'GetOrders')
+    assert router.get_url('GetOrders') == f'{PRIMARY}/includes/api.php'
+
+
+def test_router_keeps_an_endpoint_in_rotation_after_a_single_failure():
+    router = create_router()
+    router.record(f'{PRIMARY}/includes/api.php', 0.5, True)
+    router.record(f'{REPLICA}/includes/api.php', 0.1, True)
+    router.record(f'{REPLICA}/includes/api.php', 0.1, False)
+    assert router.get_url('GetOrders') == f'{REPLICA}/includes/api.php'
+    router.record(f'{REPLICA}/includes/api.php', 0.1, True)
+    router.record(f'{REPLICA}/includes/api.php', 0.1, False)
+    router.record(f'{REPLICA}/includes/api.php', 0.1, False)
+    assert router.get_states()[1]['healthy']
+
+
+def test_router_probes_mark_endpoints_healthy_again():
+    healthy = {f'{PRIMARY}/includes/api.php': True, f'{REPLICA}/includes/api.php': False}
+    router = create_router(probe=healthy.get)
+    router.probe()
+    assert [state['healthy'] for state in router.get_states()] == [True, False]
+    healthy[f'{REPLICA}/includes/api.php'] = True
+    router.probe()
+    assert all(state['healthy'] and state['latency'] is not None for state in router.get_states())
+
+
+def test_parse_endpoints_requires_a_write_endpoint():
+    assert parse_endpoints([PRIMARY])[0].role == 'write'
+    with pytest.raises(ValueError):
+        parse_endpoints([{'url': REPLICA, 'role': 'read'}])
+    with pytest.raises(ValueError):
+        Endpoint(PRIMARY, 'primary')
+
+
+@responses.activate
+@override_settings(WHMCS_ENDPOINTS=ENDPOINTS, WHMCS_HEALTH_CHECK_INTERVAL=3600)
+def test_network_routes_requests_through_the_configured_endpoints():
+    network.reset_router()
+    try:
+        responses.add(responses.POST, f'{PRIMARY}/includes/api.php', json={'result': 'success'})
+        responses.add(responses.POST, f'{REPLICA}/includes/api.php', json={'result': 'success'})
+        network.get_router().record(f'{PRIMARY}/includes/api.php', 1.0, True)
+        network.make_whmcs_network_request({'action': 'GetOrders'})
+        network.make_whmcs_network_request({'action': 'AddOrder'})
+        assert [call.request.url for call in responses.calls] == [
+            f'{REPLICA}/includes/api.php', f'{PRIMARY}/includes/api.php'
+        ]
+        replica = network.get_router().get_states()[1]
+        assert replica['healthy'] and replica['latency'] is not None
+    finally:
+        network.reset_router()
+
+
+@responses.activate
+@override_settings(WHMCS_ENDPOINTS=ENDPOINTS, WHMCS_HEALTH_CHECK_INTERVAL=3600)
+def test_requests_cut_short_by_the_deadline_leave_the_endpoint_and_limiter_alone():
+    def time_out(request):
+        time.sleep(0.05)
+        raise requests.exceptions.ReadTimeout()
+
+    responses.add_callback(responses.POST, f'{PRIMARY}/includes/api.php', callback=time_out)
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4)
+    network.reset_router()
+    try:
+        with mock.patch.object(network, 'get_limiters', return_value=(None, limiter)):
+            with pytest.raises(WhmcsTimeoutError), deadlines.deadline(0.05):
+                network.make_whmcs_network_request({'action': 'AddOrder'})
+        primary = network.get_router().get_states()[0]
+        assert primary['healthy'] and primary['latency'] is None
+        assert limiter.limit == 4 and limiter.in_flight == 0
+    finally:
+        network.reset_router()
+
+
+@override_settings(WHMCS_ENDPOINTS=ENDPOINTS, WHMCS_HEALTH_CHECK_INTERVAL=3600)
+def test_async_requests_cut_short_by_the_deadline_leave_the_endpoint_and_limiter_alone():
+    async def time_out(request):
+        await asyncio.sleep(request.extensions['timeout']['read'])
+        raise httpx.ReadTimeout('timed out', request=request)
+
+    async def add_order():
+        with deadlines.deadline(0.05):
+            await aio.make_whmcs_network_request({'action': 'AddOrder'})
+
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4)
+    client = httpx.AsyncClient(transport=httpx.MockTransport(time_out))
+    network.reset_router()
+    try:
+        with mock.patch.object(aio, 'get_limiters', return_value=(None, limiter)):
+            with mock.patch.object(aio, 'get_async_client', return_value=client), pytest.raises(WhmcsTimeoutError):
+                asyncio.run(add_order())
+        primary = network.get_router().get_states()[0]
+        assert primary['healthy'] and primary['latency'] is None
+        assert limiter.limit == 4 and limiter.in_flight == 0
+    finally:
+        network.reset_router()
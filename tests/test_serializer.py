@@ -15,8 +15,10 @@ def test_whmcs_secrets_are_retrieved_correctly():
         'WHMCS_ACCESS_KEY': "my_access_key"
     })
     environ_mock.start()
+    serializer.reload_credentials()
     whmcs_secrets = serializer.get_default_parameters()
     environ_mock.stop()
+    serializer.reload_credentials()
 
     assert whmcs_secrets['identifier'] == "my_identifier_key"
     assert whmcs_secrets['secret'] == "my_secret_key"
@@ -24,6 +26,34 @@ def test_whmcs_secrets_are_retrieved_correctly():
     assert whmcs_secrets['responsetype'] == "json"
 
 
+def test_credentials_are_only_read_from_the_environment_on_reload():
+    serializer.reload_credentials()
+    serializer.get_credentials()
+    with mock.patch.dict(os.environ, {'WHMCS_SECRET_KEY': "rotated_secret_key"}):
+        assert serializer.get_client_request_parameters(client_id=1)['secret'] != "rotated_secret_key"
+        serializer.reload_credentials()
+        assert serializer.get_client_request_parameters(client_id=1)['secret'] == "rotated_secret_key"
+    serializer.reload_credentials()
+
+
+def test_action_parameters_do_not_modify_the_template():
+    parameters = serializer.get_client_request_parameters(client_id=1)
+    parameters['clientid'] = 2
+    assert 'clientid' not in serializer.get_template('GetClientsDetails')
+    assert serializer.get_client_request_parameters()['action'] == 'GetClientsDetails'
+
+
+def test_client_parameters_use_the_whmcs_field_names():
+    parameters = serializer.create_user_request_parameters(first_name='Jane', address='1 Road', unknown='x')
+    assert parameters['firstname'] == 'Jane'
+    assert parameters['address1'] == '1 Road'
+    assert 'unknown' not in parameters
+    parameters = serializer.update_client_request_parameters(email='jane@example.com')
+    assert parameters['clientemail'] == 'jane@example.com'
+    parameters = serializer.order_product_request_parameters(1, 2, 'mpesa', 'monthly', promo_code='OFF')
+    assert parameters['promo_code'] == parameters['promocode'] == 'OFF'
+
+
 ####################################
 # get_product_request_parameters() #
 ####################################
@@ -70,3 +100,16 @@ def test_products_parameters_are_retrieved_correctly_with_combined_filters():
     assert params == default_parameters
     params = serializer.get_product_request_parameters(group_id=2, module="other_products", product_ids=[1, 2, 3])
     assert params != default_parameters
+
+
+###############################
+# add_pagination_parameters() #
+###############################
+
+def test_pagination_parameters_are_only_added_when_given():
+    parameters = serializer.prepare_get_orders_request(None, None, None)
+    assert 'limitstart' not in parameters
+    assert 'limitnum' not in parameters
+    parameters = serializer.prepare_get_orders_request(None, None, None, limit_start=0, limit_num=25)
+    assert parameters['limitstart'] == 0
+    assert parameters['limitnum'] == 25
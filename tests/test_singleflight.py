@@ -0,0 +1,53 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from olittwhmcs.singleflight import AsyncSingleFlight, SingleFlight, get_request_key
+
+
+def test_request_key_ignores_the_credentials():
+    first = {'identifier': 'a', 'secret': 'b', 'accesskey': 'c', 'action': 'GetClientsDetails', 'clientid': 1}
+    second = {'action': 'GetClientsDetails', 'clientid': 1, 'identifier': 'x'}
+    assert get_request_key(first) == get_request_key(second)
+    assert get_request_key(first) != get_request_key({**second, 'clientid': 2})
+
+
+def test_single_flight_shares_one_call_between_threads():
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(1)
+        return 'client'
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(single_flight.do, 'key', fetch)
+        started.wait(1)
+        followers = [executor.submit(single_flight.do, 'key', fetch) for _ in range(3)]
+        time.sleep(0.1)
+        release.set()
+        results = [leader.result()] + [follower.result() for follower in followers]
+
+    assert results == ['client'] * 4
+    assert len(calls) == 1
+
+
+def test_async_single_flight_shares_one_call_between_tasks():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0)
+        return 'client'
+
+    async def run():
+        single_flight = AsyncSingleFlight()
+        return await asyncio.gather(*(single_flight.do('key', fetch) for _ in range(5)))
+
+    assert asyncio.run(run()) == ['client'] * 5
+    assert len(calls) == 1
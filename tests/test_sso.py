@@ -0,0 +1,207 @@
+import asyncio
+import threading
+import time
+from unittest import mock
+
+import pytest
+import responses
+from django.core.cache import cache
+
+from olittwhmcs import aio, deadlines, sso, whmcs
+from olittwhmcs.exceptions import WhmcsTimeoutError
+from olittwhmcs.sso import SsoTokenPool, get_token_key
+
+URL = 'https://www.olitt.com/billing/includes/api.php'
+
+
+def test_sso_token_pool_returns_the_redirect_url_whmcs_issued_on_a_cache_hit():
+    cache.clear()
+    create_token = mock.Mock(return_value=('token', 'https://billing/sso?access_token=token&goto=x'))
+    pool = SsoTokenPool(create_token)
+
+    first = pool.get(1, 'clientarea:invoices')
+    second = pool.get(1, 'clientarea:invoices')
+
+    assert first == second == ('token', 'https://billing/sso?access_token=token&goto=x')
+    assert create_token.call_count == 1
+
+
+def test_sso_tokens_are_cached_per_extra_parameters():
+    first = get_token_key(1, 'sso:custom_redirect', {'sso_redirect_path': '/viewinvoice.php?id=1'})
+    second = get_token_key(1, 'sso:custom_redirect', {'sso_redirect_path': '/viewinvoice.php?id=2'})
+    assert first != second
+
+
+def test_sso_token_pool_does_not_hand_out_tokens_about_to_expire():
+    cache.clear()
+    create_token = mock.Mock(side_effect=[('old', 'old_url'), ('new', 'new_url')])
+    pool = SsoTokenPool(create_token)
+    pool.get(1)
+    key = get_token_key(1)
+    cache.set(key, {**cache.get(key), 'expires_at': time.time() + 5})
+
+    assert pool.get(1) == ('new', 'new_url')
+
+
+def test_sso_token_pool_refreshes_tokens_in_the_background_before_they_expire():
+    cache.clear()
+    refreshed = threading.Event()
+
+    def create_token(client_id, destination, extra_parameters):
+        if create_token.calls:
+            refreshed.set()
+        create_token.calls += 1
+        return f'token{create_token.calls}', 'url'
+
+    create_token.calls = 0
+    pool = SsoTokenPool(create_token)
+    pool.get(1)
+    key = get_token_key(1)
+    cache.set(key, {**cache.get(key), 'expires_at': time.time() + 20})
+
+    assert pool.get(1) == ('token1', 'url')
+    assert refreshed.wait(5)
+    deadline = time.monotonic() + 5
+    while cache.get(key)['access_token'] != 'token2' and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert pool.get(1) == ('token2', 'url')
+
+
+def test_sso_token_pool_shares_concurrent_misses():
+    cache.clear()
+    release = threading.Event()
+
+    def create_token(client_id, destination, extra_parameters):
+        release.wait(5)
+        return 'token', 'url'
+
+    create_token = mock.Mock(side_effect=create_token)
+    pool = SsoTokenPool(create_token)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(pool.get(1))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == [('token', 'url')] * 4
+    assert create_token.call_count == 1
+
+
+def test_sso_token_pool_raises_a_timeout_error_when_a_shared_miss_outlasts_the_deadline():
+    cache.clear()
+    release = threading.Event()
+
+    def create_token(client_id, destination, extra_parameters):
+        release.wait(5)
+        return 'token', 'url'
+
+    pool = SsoTokenPool(create_token)
+    leader = threading.Thread(target=pool.get, args=(1,))
+    leader.start()
+    time.sleep(0.05)
+    try:
+        with pytest.raises(WhmcsTimeoutError), deadlines.deadline(0.05):
+            pool.get(1)
+    finally:
+        release.set()
+        leader.join()
+
+
+def test_async_sso_tokens_raise_a_timeout_error_when_a_shared_miss_outlasts_the_deadline():
+    cache.clear()
+
+    async def create_sso_token(client_id, destination, extra_parameters):
+        await asyncio.sleep(0.2)
+        return 'token', 'url'
+
+    async def get_tokens():
+        async def follow():
+            await asyncio.sleep(0.01)
+            with deadlines.deadline(0.05):
+                return await aio.get_sso_token_and_redirect_url(1)
+
+        return await asyncio.gather(
+            aio.get_sso_token_and_redirect_url(1), follow(), return_exceptions=True
+        )
+
+    with mock.patch.object(aio, 'create_sso_token', side_effect=create_sso_token):
+        leader, follower = asyncio.run(get_tokens())
+    assert leader == ('token', 'url')
+    assert isinstance(follower, WhmcsTimeoutError)
+
+
+def test_sso_token_pool_creates_the_token_again_when_the_creating_caller_runs_out_of_time():
+    cache.clear()
+    started = threading.Event()
+
+    def create_token(client_id, destination, extra_parameters):
+        if not started.is_set():
+            started.set()
+            time.sleep(0.1)
+            raise WhmcsTimeoutError(deadlines.DEADLINE_EXCEEDED)
+        return 'token', 'url'
+
+    pool = SsoTokenPool(create_token)
+
+    def lead():
+        with pytest.raises(WhmcsTimeoutError), deadlines.deadline(0.05):
+            pool.get(1)
+
+    leader = threading.Thread(target=lead)
+    leader.start()
+    started.wait(1)
+    assert pool.get(1) == ('token', 'url')
+    leader.join()
+
+
+def test_async_sso_tokens_are_refreshed_in_the_background_before_they_expire():
+    cache.clear()
+    threads = []
+
+    def create_token(client_id, destination, extra_parameters):
+        threads.append(threading.current_thread())
+        return f'token{len(threads)}', 'url'
+
+    pool = SsoTokenPool(create_token)
+    pool.get(1)
+    key = get_token_key(1)
+    cache.set(key, {**cache.get(key), 'expires_at': time.time() + 20})
+
+    with mock.patch.object(sso, 'sso_token_pool', pool):
+        assert asyncio.run(aio.get_sso_token_and_redirect_url(1)) == ('token1', 'url')
+    deadline = time.monotonic() + 5
+    while cache.get(key)['access_token'] != 'token2' and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache.get(key)['access_token'] == 'token2'
+    assert threads[1] is not threading.main_thread()
+
+
+def test_sso_token_pool_prewarms_the_configured_destinations():
+    cache.clear()
+    create_token = mock.Mock(return_value=('token', 'url'))
+    pool = SsoTokenPool(create_token)
+
+    for future in pool.prewarm(1):
+        future.result()
+    pool.get(1, 'clientarea:invoices')
+
+    create_token.assert_called_once_with(1, 'clientarea:invoices', None)
+    assert pool.prewarm(1) == []
+
+
+@responses.activate
+def test_get_sso_token_and_redirect_url_uses_the_token_pool():
+    cache.clear()
+    responses.add(responses.POST, URL, json={
+        'result': 'success', 'access_token': 'token', 'redirect_url': 'https://billing/sso?access_token=token',
+    }, status=200)
+
+    first = whmcs.get_client_invoices_sso_url(1)
+    second = whmcs.get_client_invoices_sso_url(1)
+
+    assert first == second == ('token', 'https://billing/sso?access_token=token')
+    assert len(responses.calls) == 1
+    assert sso.sso_token_pool.get_cached(get_token_key(1, 'clientarea:invoices')) is not None
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from olittwhmcs.streaming import StreamingParser
+
+DOCUMENT = {
+    'result': 'success',
+    'totalresults': 3,
+    'orders': {'order': [
+        {'id': 1, 'notes': 'quoted "]}" text', 'name': 'café'},
+        {'id': 22, 'lineitems': {'lineitem': [{'amount': '1.50'}]}},
+        {'id': 333, 'values': [1, 2.5e3, None, True]},
+    ]},
+    'startnumber': 0,
+}
+
+
+def chunk(data, size):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 1 << 20])
+def test_iter_items_decodes_items_split_across_chunks(size):
+    parser = StreamingParser(('orders', 'order'))
+    data = json.dumps(DOCUMENT, ensure_ascii=False).encode()
+    items = list(parser.iter_items(chunk(data, size)))
+    assert items == DOCUMENT['orders']['order']
+    assert parser.metadata == {'result': 'success', 'totalresults': 3, 'startnumber': 0}
+
+
+def test_iter_items_collects_the_error_of_a_failed_response():
+    parser = StreamingParser(('orders', 'order'))
+    items = list(parser.iter_items([b'{"result": "error", "message": "Invalid client"}']))
+    assert items == []
+    assert parser.metadata == {'result': 'error', 'message': 'Invalid client'}
+
+
+def test_iter_items_rejects_invalid_and_truncated_json():
+    with pytest.raises(ValueError):
+        list(StreamingParser(('orders', 'order')).iter_items([b'<html>']))
+    with pytest.raises(ValueError):
+        list(StreamingParser(('orders', 'order')).iter_items([b'{"orders": {"order": [{"id": 1}']))
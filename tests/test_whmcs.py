@@ -1,7 +1,74 @@
+import hashlib
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+import responses
+
 from olittwhmcs import whmcs
+from olittwhmcs.exceptions import WhmcsException
 
 
 def test_get_products():
     retrieved_products = whmcs.get_products()
     # assert type(retrieved_products) == (dict or list)
     # assert retrieved_products == ""
+
+
+@responses.activate
+def test_iter_orders_requests_every_page():
+    url = 'https://www.olitt.com/billing/includes/api.php'
+    for start in (0, 2, 4):
+        orders = [{'id': order_id, 'date': '2021-01-01 10:00:00'} for order_id in range(start, min(start + 2, 5))]
+        responses.add(responses.POST, url, json={'result': 'success', 'totalresults': 5, 'orders': {'order': orders}})
+    orders = list(whmcs.iter_orders(client_id=1, page_size=2))
+    assert [order.id for order in orders] == [0, 1, 2, 3, 4]
+    assert len(responses.calls) == 3
+    assert 'limitstart=4' in responses.calls[2].request.body
+
+
+@responses.activate
+def test_iter_invoices_raises_the_whmcs_error():
+    responses.add(
+        responses.POST, 'https://www.olitt.com/billing/includes/api.php',
+        json={'result': 'error', 'message': 'Invalid client'},
+    )
+    with pytest.raises(WhmcsException) as error:
+        list(whmcs.iter_invoices(client_id=1))
+    assert error.value.message == 'Invalid client'
+
+
+@responses.activate
+def test_stream_invoices_yields_models_and_raises_the_whmcs_error():
+    url = 'https://www.olitt.com/billing/includes/api.php'
+    invoices = [{'id': invoice_id, 'total': '10.00'} for invoice_id in range(3)]
+    responses.add(responses.POST, url, json={'result': 'success', 'invoices': {'invoice': invoices}})
+    responses.add(responses.POST, url, json={'result': 'error', 'message': 'Invalid client'})
+    assert [invoice.id for invoice in whmcs.stream_invoices(client_id=1, compact=True)] == [0, 1, 2]
+    with pytest.raises(WhmcsException) as error:
+        list(whmcs.stream_invoices(client_id=1))
+    assert error.value.message == 'Invalid client'
+
+
+def test_batch_returns_results_and_errors_in_input_order():
+    def get_client(client_id):
+        if client_id == 2:
+            raise WhmcsException('Client Not Found')
+        return client_id * 10
+
+    results = whmcs.batch(get_client, [(1,), {'client_id': 2}, (3,)], max_workers=2)
+    assert results[0] == 10
+    assert isinstance(results[1], WhmcsException)
+    assert results[2] == 30
+
+
+def test_get_settle_invoice_urls_signs_a_batch_with_one_timestamp_and_encodes_it():
+    urls = whmcs.get_settle_invoice_urls([(1, 'jane+doe@example.com'), (2, 'john@example.com')], 'key', 1600000000)
+
+    query = parse_qs(urlsplit(urls[0]).query)
+    assert urls[0].startswith('https://www.olitt.com/billing/dologin.php?email=jane%2Bdoe%40example.com&')
+    assert query['email'] == ['jane+doe@example.com']
+    assert query['timestamp'] == ['1600000000']
+    assert query['hash'] == [hashlib.sha1(b'jane+doe@example.com1600000000key').hexdigest()]
+    assert query['goto'] == ['https://www.olitt.com/billing/viewinvoice.php?id=1']
+    assert parse_qs(urlsplit(urls[1]).query)['timestamp'] == ['1600000000']
+    assert whmcs.get_settle_invoice_url(1, 'jane+doe@example.com', 'key').startswith(urls[0][:80])